@@ -0,0 +1,214 @@
+# app/bench/fake_servers.py
+# 本地的外部服务替身，用于离线测试和压测 (不访问外网、结果可复现)：
+#   - Open-Meteo：支持与真实 API 相同的逗号分隔多坐标请求，多于一个坐标时返回 JSON 数组；
+#   - 网络搜索 (DuckDuckGo HTML 结果页) 及其链接到的文章页面。
+#
+# 用法 (在项目根目录运行):
+#   python -m app.bench.fake_servers --port 8765 --web-search-port 8766
+#   然后在 .env 中设置 OPEN_METEO_API_URL=http://127.0.0.1:8765/v1/forecast
+#   以及 WEB_SEARCH_URL=http://127.0.0.1:8766/html/
+import argparse
+import json
+import threading
+import time
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List
+from urllib.parse import parse_qs, quote, urlparse
+
+
+def fake_location_weather(latitude: float, longitude: float, query: Dict[str, List[str]]) -> Dict[str, Any]:
+    """根据坐标确定性地生成一个地点的天气数据 (结构与 Open-Meteo 的响应一致)。"""
+    seed = abs(latitude * 7.0 + longitude * 3.0) % 10.0
+    result: Dict[str, Any] = {"latitude": latitude, "longitude": longitude, "timezone": "GMT"}
+    if "current" in query:
+        result["current"] = {
+            "temperature_2m": round(24.0 + seed, 1),
+            "relative_humidity_2m": round(70.0 + 2.5 * seed, 1),
+        }
+    if "daily" in query:
+        days = int(query.get("forecast_days", ["7"])[0])
+        start = date(2024, 7, 1)
+        result["daily"] = {
+            "time": [(start + timedelta(days=d)).isoformat() for d in range(days)],
+            "temperature_2m_max": [round(25.0 + seed + d % 3, 1) for d in range(days)],
+            "temperature_2m_min": [round(20.0 + seed / 2, 1) for _ in range(days)],
+            "relative_humidity_2m_mean": [round(78.0 + seed + 2 * (d % 4), 1) for d in range(days)],
+            "precipitation_sum": [round((seed + d) % 9, 1) for d in range(days)],
+        }
+    return result
+
+
+class _StubServer:
+    """在后台线程运行的 HTTP 替身服务器的公共部分；子类实现 _handler_class()。"""
+    path = "/"
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency_ms: float = 0.0):
+        self.latency_ms = latency_ms
+        self.requests: List[Dict[str, List[str]]] = []
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def url(self) -> str:
+        return self.base_url + self.path
+
+    @property
+    def request_count(self) -> int:
+        with self._lock:
+            return len(self.requests)
+
+    def _record(self, query: Dict[str, List[str]]):
+        with self._lock:
+            self.requests.append(query)
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000.0)
+
+    def _handler_class(self):
+        raise NotImplementedError
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def serve_forever(self):
+        self._server.serve_forever()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def _send(self, status: int, body: Any, content_type: str = "application/json"):
+        payload = body.encode("utf-8") if isinstance(body, str) else json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+class FakeOpenMeteoServer(_StubServer):
+    """
+    在后台线程运行的 Open-Meteo 替身：
+        with FakeOpenMeteoServer() as server:
+            WeatherService(api_url=server.url)
+    :param latency_ms: 每个请求的人为延迟，用于模拟真实网络往返。
+    """
+    path = "/v1/forecast"
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(_Handler):
+            def do_GET(self):
+                parsed = urlparse(self.path)
+                query = parse_qs(parsed.query)
+                server._record(query)
+                try:
+                    latitudes = [float(v) for v in query["latitude"][0].split(",")]
+                    longitudes = [float(v) for v in query["longitude"][0].split(",")]
+                    if parsed.path != "/v1/forecast" or len(latitudes) != len(longitudes):
+                        raise ValueError("bad request")
+                except (KeyError, ValueError):
+                    self._send(400, {"error": True, "reason": "Invalid coordinates"})
+                    return
+                locations = [fake_location_weather(lat, lon, query) for lat, lon in zip(latitudes, longitudes)]
+                self._send(200, locations if len(locations) > 1 else locations[0])
+
+        return Handler
+
+
+def fake_article_html(index: int, query: str) -> str:
+    """确定性的文章页面：包含症状和防治句子，每行一句 (与 NLP 句子分类器的输入格式一致)。"""
+    topic = query.split(" pepper")[0] or "pepper disease"
+    sentences = [
+        f"Article {index} about {topic}.",
+        f"Symptoms of {topic} appear on leaves as yellow spots and wilting.",
+        "Infected leaves turn brown and drop early in humid weather.",
+        f"Use a copper based fungicide to treat {topic} every two weeks.",
+        "Remove infected vines and improve drainage to control the spread.",
+    ]
+    return "<html><body><article>" + "".join(f"<p>{s}</p>\n" for s in sentences) + "</article></body></html>"
+
+
+class FakeWebSearchServer(_StubServer):
+    """
+    网络搜索替身：GET /html/?q=... 返回 DuckDuckGo HTML 格式的结果页 (a.result__a 跳转链接)，
+    链接指向本服务器上的 /article/<n> 页面。
+        with FakeWebSearchServer() as server:
+            WebReferenceService(..., search_url=server.url)
+    """
+    path = "/html/"
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency_ms: float = 0.0, results: int = 3):
+        self.results = results
+        super().__init__(host, port, latency_ms)
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(_Handler):
+            def do_GET(self):
+                parsed = urlparse(self.path)
+                query = parse_qs(parsed.query)
+                server._record(query)
+                text = query.get("q", [""])[0]
+                if parsed.path == server.path:
+                    links = "".join(
+                        f'<div class="result"><a class="result__a" href="/l/?uddg='
+                        f'{quote(f"{server.base_url}/article/{i}?q={quote(text)}", safe="")}">Result {i}</a></div>'
+                        for i in range(server.results)
+                    )
+                    self._send(200, f"<html><body>{links}</body></html>", "text/html; charset=utf-8")
+                elif parsed.path.startswith("/article/"):
+                    self._send(200, fake_article_html(int(parsed.path.rsplit("/", 1)[-1]), text), "text/html; charset=utf-8")
+                else:
+                    self._send(404, {"error": True})
+
+        return Handler
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Run local Open-Meteo and web search stub servers.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--web-search-port", type=int, help="同时启动网络搜索替身")
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    args = parser.parse_args(argv)
+    server = FakeOpenMeteoServer(args.host, args.port, latency_ms=args.latency_ms)
+    print(f"Fake Open-Meteo listening on {server.url}")
+    search = None
+    if args.web_search_port is not None:
+        search = FakeWebSearchServer(args.host, args.web_search_port, latency_ms=args.latency_ms).start()
+        print(f"Fake web search listening on {search.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if search is not None:
+            search.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,368 @@
+# app/bench/hot_paths.py
+# 热点路径的微基准测试 (与 load_test.py 的端到端压测互补)：在同一进程中分别计时
+#   - image_processor:   ImageProcessor.process / process_many
+#   - classifier:        DiseaseClassifier.predict / predict_batch，批大小 1–32 × 线程数 1–N
+#   - xai:               XaiGenerator.generate_heatmap 与单次前向的 predict_and_explain
+#   - risk:              FuzzyRiskAssessor.assess (预编译网格 / 精确模糊推理) 与 assess_many
+#   - disease_predictor: DiseasePredictorService.predict_daily_risk 与列式的 predict_risk_tensor
+#   - report:            AdvancedNLGGenerator.generate、summarize_articles，以及经由网络搜索替身的完整抓取
+# 每个用例先预热，再重复执行直到同时满足 --min-rounds 和 --min-time，统计方式与 pytest-benchmark 相同
+# (min/max/mean/median/stddev，外加 p95 与 ops)。某一组无法初始化 (例如缺少模型权重) 时记录错误并继续其他组。
+# 结果以 hot_paths_<时间>_<git 提交>.json 保存在 --results-dir 中，--baseline 按用例比较中位数，
+# 出现回归或错误时以非零状态退出。
+#
+# 用法 (在项目根目录运行):
+#   python -m app.bench.hot_paths
+#   python -m app.bench.hot_paths --groups classifier --max-threads 4 --batch-sizes 1 8 32
+#   python -m app.bench.hot_paths --groups risk report --baseline bench_results/hot_paths_20240701-120000_abc1234.json
+import argparse
+import asyncio
+import gc
+import itertools
+import json
+import math
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from contextlib import ExitStack
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from app.bench.fake_servers import FakeWebSearchServer, fake_location_weather
+from app.bench.images import DEFAULT_IMAGE_DIR, image_corpus
+from app.bench.load_test import DEFAULT_RESULTS_DIR, PLACEHOLDER_ENV, _git_commit, percentile
+
+ABSOLUTE_SLACK_MS = 0.05  # 回归判断的绝对余量，避免微秒级用例因计时抖动误报
+DEFAULT_BATCH_SIZES = [1, 2, 4, 8, 16, 32]
+
+
+def measure(fn: Callable[[], Any], min_rounds: int = 5, min_time: float = 0.5, warmup: int = 1,
+            max_rounds: int = 100000) -> Dict[str, float]:
+    """
+    重复调用 fn，直到至少执行 min_rounds 次且累计耗时不少于 min_time 秒 (不超过 max_rounds 次)。
+    计时期间关闭垃圾回收，与 pytest-benchmark 的默认行为一致。返回以毫秒计的统计量。
+    """
+    for _ in range(warmup):
+        fn()
+    timings = []
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        total = 0.0
+        while len(timings) < max_rounds and (len(timings) < min_rounds or total < min_time):
+            start = time.perf_counter()
+            fn()
+            elapsed = time.perf_counter() - start
+            timings.append(elapsed * 1000.0)
+            total += elapsed
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+    values = sorted(timings)
+    mean = statistics.fmean(values)
+    return {
+        "rounds": len(values),
+        "min_ms": values[0],
+        "max_ms": values[-1],
+        "mean_ms": mean,
+        "median_ms": statistics.median(values),
+        "stddev_ms": statistics.stdev(values) if len(values) > 1 else 0.0,
+        "p95_ms": percentile(values, 95),
+        "ops": 1000.0 / mean if mean > 0 else math.inf,
+    }
+
+
+@dataclass
+class Case:
+    name: str
+    fn: Callable[[], Any]
+    params: Dict[str, Any] = field(default_factory=dict)
+    items: int = 1  # 每次调用处理的样本数 (图片/句子/地点)，用于换算 items_per_second
+    setup: Optional[Callable[[], None]] = None  # 计时前执行，例如设置线程数
+
+
+@dataclass
+class HotPathContext:
+    images: List[bytes]
+    batch_sizes: List[int]
+    thread_counts: List[int]
+    # 各组注册的清理动作 (替身服务器、临时目录、事件循环)，在该组结束后执行
+    cleanup: ExitStack = field(default_factory=ExitStack)
+
+
+def _cycle(values):
+    iterator = itertools.cycle(values)
+    return lambda: next(iterator)
+
+
+def _batch(images: List[bytes], size: int) -> List[bytes]:
+    return [images[i % len(images)] for i in range(size)]
+
+
+# --- 各组用例 ---
+# 组函数在第一次迭代时才导入被测模块，导入失败 (如缺少权重) 只影响本组。
+
+def image_processor_cases(ctx: HotPathContext) -> Iterator[Case]:
+    from app.utils.image_processing import image_processor
+
+    next_image = _cycle(ctx.images)
+    yield Case("process", lambda: image_processor.process(next_image()))
+    batch = _batch(ctx.images, 8)
+    yield Case("process_many", lambda: image_processor.process_many(batch), {"batch_size": len(batch)}, items=len(batch))
+
+
+def classifier_cases(ctx: HotPathContext) -> Iterator[Case]:
+    import torch
+    from app.models.disease_classifier import classifier
+    from app.utils.image_processing import image_processor
+
+    tensors = image_processor.process_many(_batch(ctx.images, max(ctx.batch_sizes)))
+    for threads in ctx.thread_counts:
+        setup = lambda threads=threads: torch.set_num_threads(threads)
+        for batch_size in ctx.batch_sizes:
+            batch = tensors[:batch_size].contiguous()
+            if batch_size == 1:
+                fn = lambda batch=batch: classifier.predict(batch)
+            else:
+                fn = lambda batch=batch: classifier.predict_batch(batch)
+            yield Case("predict" if batch_size == 1 else "predict_batch", fn,
+                       {"batch_size": batch_size, "threads": threads}, items=batch_size, setup=setup)
+
+
+def xai_cases(ctx: HotPathContext) -> Iterator[Case]:
+    # generate_heatmap 会在模型上永久注册 GradCAM 钩子，因此本组排在 classifier 之后
+    from app.models.disease_classifier import classifier
+    from app.utils.image_processing import image_processor
+    from app.utils.xai_generator import xai_generator
+
+    if xai_generator is None:
+        raise RuntimeError("XAI 模块未初始化 (找不到 Grad-CAM 目标层)")
+    image_bytes = ctx.images[0]
+    rgb_image = image_processor.decode_and_crop(image_bytes)
+    tensor = image_processor.normalize(rgb_image[None])
+    target = classifier.get_class_index(classifier.predict(tensor).disease)
+    yield Case("predict_and_explain", lambda: xai_generator.predict_and_explain(tensor, rgb_image, target))
+    yield Case("generate_heatmap", lambda: xai_generator.generate_heatmap(tensor, image_bytes, target))
+
+
+def risk_cases(ctx: HotPathContext) -> Iterator[Case]:
+    import numpy as np
+    from app.models.risk_assessor import FuzzyRiskAssessor
+
+    compiled = FuzzyRiskAssessor(compiled=True)
+    compiled.compile()
+    exact = FuzzyRiskAssessor(compiled=False)
+    rng = np.random.default_rng(0)
+    temps = rng.uniform(18.0, 38.0, 1000).tolist()
+    hums = rng.uniform(50.0, 100.0, 1000).tolist()
+    next_pair = _cycle(list(zip(temps, hums)))
+    yield Case("assess", lambda: compiled.assess(*next_pair()), {"mode": "compiled"})
+    yield Case("assess", lambda: exact.assess(*next_pair()), {"mode": "exact"})
+    yield Case("assess_many", lambda: compiled.assess_many(temps, hums), {"mode": "compiled", "size": len(temps)},
+               items=len(temps))
+
+
+def disease_predictor_cases(ctx: HotPathContext) -> Iterator[Case]:
+    from app.services.disease_predictor_service import DiseasePredictorService
+    from app.services.weather_service import WeatherService
+
+    service = DiseasePredictorService()
+    query = {"daily": [""], "forecast_days": ["7"]}
+    forecasts = [WeatherService._parse_forecast(fake_location_weather(1.0 + i * 0.05, 110.0 + i * 0.05, query))
+                 for i in range(100)]
+    for disease_key in service.disease_rules:
+        yield Case("predict_daily_risk", lambda key=disease_key: service.predict_daily_risk(forecasts[0], key),
+                   {"disease": disease_key, "days": len(forecasts[0])})
+    array = DiseasePredictorService.forecast_to_array(forecasts)
+    yield Case("predict_risk_tensor", lambda: service.predict_risk_tensor(array),
+               {"locations": len(forecasts), "days": array.shape[1]}, items=len(forecasts))
+
+
+def report_cases(ctx: HotPathContext) -> Iterator[Case]:
+    from bs4 import BeautifulSoup
+
+    from app.bench.fake_servers import fake_article_html
+    from app.models.recommendation_generator import report_generator_v3 as generator
+    from app.schemas.diagnosis import PredictionResult, RiskAssessment
+    from app.services.knowledge_base_service import kb_service
+    from app.services.web_reference_service import WebReferenceService
+
+    disease_key = next((key for key, info in kb_service.knowledge_base.items() if info), None)
+    if disease_key is None:
+        raise RuntimeError("知识库为空，无法生成报告")
+    prediction = PredictionResult(disease=disease_key, confidence=0.93)
+    risk = RiskAssessment(risk_score=6.5, risk_level="Medium")
+    topic = disease_key.replace("_", " ")
+    articles = [BeautifulSoup(fake_article_html(i, f"{topic} pepper"), "lxml").get_text(" ", strip=True) for i in range(3)]
+    web_summaries = [f"参考资料 #{i + 1}: {text}" for i, text in enumerate(articles)]
+
+    for lang in ("en", "ms", "zh"):
+        yield Case("generate", lambda lang=lang: generator.generate(prediction, risk, lang), {"lang": lang, "web": False})
+        yield Case("generate", lambda lang=lang: generator.generate(prediction, risk, lang, web_summaries=web_summaries),
+                   {"lang": lang, "web": True})
+
+    if generator.embedding_model is None:
+        raise RuntimeError("自研NLG核心未加载，跳过 summarize_articles 与网络参考抓取")
+    yield Case("summarize_articles", lambda: generator.summarize_articles(disease_key, articles),
+               {"articles": len(articles)}, items=len(articles))
+
+    # 网络访问由本地替身提供；TTL 为负使每一轮都走完整的 搜索 → 下载 → 解析 → 摘要 流程
+    server = ctx.cleanup.enter_context(FakeWebSearchServer(results=3))
+    cache_dir = ctx.cleanup.enter_context(tempfile.TemporaryDirectory(prefix="hot_paths_web_"))
+    service = WebReferenceService(cache_dir=Path(cache_dir), ttl_seconds=-1, search_url=server.url)
+    loop = asyncio.new_event_loop()
+    ctx.cleanup.callback(loop.close)
+    loop.run_until_complete(service.start())
+    ctx.cleanup.callback(lambda: loop.run_until_complete(service.close()))
+
+    def fetch_and_generate():
+        summaries = loop.run_until_complete(service.get_summaries(disease_key, "en", generator.summarize_articles))
+        return generator.generate(prediction, risk, "en", web_summaries=summaries)
+
+    yield Case("web_summaries_and_generate", fetch_and_generate, {"lang": "en", "articles": server.results})
+
+
+# 执行顺序固定：xai 必须在 classifier 之后 (见 xai_cases)
+GROUPS: Dict[str, Callable[[HotPathContext], Iterator[Case]]] = {
+    "image_processor": image_processor_cases,
+    "classifier": classifier_cases,
+    "xai": xai_cases,
+    "risk": risk_cases,
+    "disease_predictor": disease_predictor_cases,
+    "report": report_cases,
+}
+
+
+def run(ctx: HotPathContext, groups: Dict[str, Callable[[HotPathContext], Iterator[Case]]],
+        min_rounds: int = 5, min_time: float = 0.5, warmup: int = 1) -> Dict[str, List[Dict]]:
+    """依次运行各组用例；组初始化或单个用例失败时记录到 errors，不中断其他用例。"""
+    import torch
+
+    results, errors = [], []
+    default_threads = torch.get_num_threads()
+    for group, make_cases in groups.items():
+        print(f"⏱️  {group} ...", file=sys.stderr)
+        cases = make_cases(ctx)
+        try:
+            while True:
+                try:
+                    case = next(cases)
+                except StopIteration:
+                    break
+                except Exception as e:
+                    errors.append({"group": group, "error": f"{type(e).__name__}: {e}"})
+                    break
+                try:
+                    if case.setup is not None:
+                        case.setup()
+                    stats = measure(case.fn, min_rounds=min_rounds, min_time=min_time, warmup=warmup)
+                except Exception as e:
+                    errors.append({"group": group, "name": case.name, "params": case.params, "error": f"{type(e).__name__}: {e}"})
+                    continue
+                finally:
+                    torch.set_num_threads(default_threads)
+                results.append({
+                    "group": group, "name": case.name, "params": case.params, **stats,
+                    "items_per_second": stats["ops"] * case.items,
+                })
+        finally:
+            cases.close()
+            ctx.cleanup.close()
+    return {"results": results, "errors": errors}
+
+
+def _key(result: Dict) -> str:
+    return f"{result['group']}.{result['name']}{json.dumps(result.get('params', {}), sort_keys=True)}"
+
+
+def compare(report: Dict, baseline: Dict, tolerance: float) -> List[Dict]:
+    """按 (组, 用例, 参数) 与基线比较中位数耗时，超出 (1 + tolerance) 倍 + 绝对余量即为回归；基线中没有的用例不参与比较。"""
+    previous = {_key(result): result for result in baseline.get("results", [])}
+    regressions = []
+    for result in report["results"]:
+        before = previous.get(_key(result), {}).get("median_ms")
+        if before is None:
+            continue
+        limit = before * (1 + tolerance) + ABSOLUTE_SLACK_MS
+        if result["median_ms"] > limit:
+            regressions.append({"case": _key(result), "baseline_ms": before, "median_ms": result["median_ms"], "limit_ms": limit})
+    return regressions
+
+
+def _thread_counts(max_threads: int) -> List[int]:
+    """1, 2, 4, ... 直到 max_threads (包含 max_threads 本身)。"""
+    counts = [1 << i for i in range(max_threads.bit_length()) if (1 << i) < max_threads]
+    return counts + [max_threads]
+
+
+def _versions() -> Dict[str, Optional[str]]:
+    versions = {"python": platform.python_version()}
+    for package in ("torch", "torchvision", "numpy", "skfuzzy", "pytorch_grad_cam"):
+        try:
+            versions[package] = __import__(package).__version__
+        except Exception:
+            versions[package] = None
+    return versions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Micro-benchmarks for model, preprocessing and report hot paths.")
+    parser.add_argument("--groups", nargs="+", choices=list(GROUPS), default=list(GROUPS))
+    parser.add_argument("--images", type=Path, default=DEFAULT_IMAGE_DIR, help="测试图片文件夹 (递归查找)")
+    parser.add_argument("--image-limit", type=int, default=32)
+    parser.add_argument("--max-threads", type=int, default=os.cpu_count() or 1, help="classifier 组测量的最大线程数")
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=DEFAULT_BATCH_SIZES)
+    parser.add_argument("--min-rounds", type=int, default=5)
+    parser.add_argument("--min-time", type=float, default=0.5, help="每个用例至少计时的秒数")
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--results-dir", type=Path, default=DEFAULT_RESULTS_DIR)
+    parser.add_argument("--baseline", type=Path, help="与之前保存的结果比较")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    for key, value in PLACEHOLDER_ENV.items():
+        os.environ.setdefault(key, value)
+    images, source = image_corpus(args.images, args.image_limit)
+    ctx = HotPathContext(images=images, batch_sizes=sorted(set(args.batch_sizes)),
+                         thread_counts=_thread_counts(max(1, args.max_threads)))
+    # 按 GROUPS 中的顺序执行，与命令行给出的顺序无关
+    selected = {name: make_cases for name, make_cases in GROUPS.items() if name in args.groups}
+    outcome = run(ctx, selected, min_rounds=args.min_rounds, min_time=args.min_time, warmup=args.warmup)
+
+    git = _git_commit()
+    report = {
+        "run": {**git, "started_at": datetime.now().isoformat(timespec="seconds"), "cpu_count": os.cpu_count(),
+                "images": len(images), "image_source": source, "versions": _versions(), "min_rounds": args.min_rounds,
+                "min_time": args.min_time, "tolerance": args.tolerance},
+        **outcome,
+        "regressions": [],
+    }
+    if args.baseline:
+        report["regressions"] = compare(report, json.loads(args.baseline.read_text(encoding="utf-8")), args.tolerance)
+
+    args.results_dir.mkdir(parents=True, exist_ok=True)
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    output = args.results_dir / f"hot_paths_{stamp}_{git['commit'] or 'nogit'}.json"
+    output.write_text(json.dumps(report, indent=4), encoding="utf-8")
+
+    for result in report["results"]:
+        params = " ".join(f"{k}={v}" for k, v in result["params"].items())
+        print(f"{result['group'] + '.' + result['name']:<40} {params:<32} median {result['median_ms']:10.3f} ms  "
+              f"p95 {result['p95_ms']:10.3f} ms  {result['items_per_second']:12.1f} items/s")
+    print(f"📄 结果已保存至: {output}")
+
+    if report["errors"]:
+        print(f"❌ 以下用例无法运行: {report['errors']}", file=sys.stderr)
+    if report["regressions"]:
+        print(f"❌ 性能回归: {[r['case'] for r in report['regressions']]}", file=sys.stderr)
+    return 1 if report["errors"] or report["regressions"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
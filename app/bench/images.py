@@ -0,0 +1,47 @@
+# app/bench/images.py
+# 基准测试使用的叶片图片语料：优先读取 Mydataset/ 中的真实照片，没有时生成合成图片。
+import io
+from pathlib import Path
+from typing import List, Tuple
+
+from PIL import Image
+
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png"}
+DEFAULT_IMAGE_DIR = Path(__file__).resolve().parent.parent.parent / "Mydataset"
+
+
+def load_images(folder: Path, limit: int) -> List[bytes]:
+    images = []
+    for path in sorted(Path(folder).rglob("*")):
+        if path.suffix.lower() not in IMAGE_SUFFIXES:
+            continue
+        data = path.read_bytes()
+        # 跳过 git-lfs 指针文件等无法解码的内容
+        try:
+            Image.open(io.BytesIO(data)).verify()
+        except Exception:
+            continue
+        images.append(data)
+        if len(images) >= limit:
+            break
+    return images
+
+
+def synthetic_images(count: int, size=(4000, 3000)) -> List[bytes]:
+    """生成接近手机照片尺寸的 JPEG，在没有真实数据集时使用。"""
+    images = []
+    for i in range(count):
+        base = Image.effect_mandelbrot((size[0] // 10, size[1] // 10), (-2.0 + i * 0.01, -1.2, 1.0, 1.2), 80)
+        image = Image.merge("RGB", (base, base.rotate(180), base.transpose(Image.FLIP_LEFT_RIGHT))).resize(size, Image.BILINEAR)
+        buffer = io.BytesIO()
+        image.save(buffer, format="JPEG", quality=90)
+        images.append(buffer.getvalue())
+    return images
+
+
+def image_corpus(folder: Path = DEFAULT_IMAGE_DIR, limit: int = 50, synthetic: int = 10) -> Tuple[List[bytes], str]:
+    """返回 (图片列表, 来源说明)；文件夹不存在或没有可解码的图片时退回合成图片。"""
+    images = load_images(folder, limit) if folder and Path(folder).is_dir() else []
+    if images:
+        return images, str(folder)
+    return synthetic_images(synthetic), "synthetic"
@@ -0,0 +1,74 @@
+# app/bench/preprocess.py
+# ImageProcessor 预处理基准测试：对比原始 torchvision 路径与快速路径的耗时和数值差异。
+#
+# 用法 (在项目根目录运行):
+#   python -m app.bench.preprocess --images Mydataset/BLACK_PEPPER_DATASET --limit 50
+#   python -m app.bench.preprocess --synthetic 20 --json bench_output.json
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+from typing import List
+
+import torch
+
+from app.bench.images import load_images, synthetic_images
+from app.utils.image_processing import ImageProcessor
+
+EXACT_ATOL = 1e-5  # 精确路径 (不缩小解码) 与参考路径的最大允许误差
+
+
+def _time_per_image(fn, images: List[bytes], repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(images)
+    return 1000.0 * (time.perf_counter() - start) / (repeat * len(images))
+
+
+def run(images: List[bytes], repeat: int = 3) -> dict:
+    exact = ImageProcessor(fast_decode=False)
+    fast = ImageProcessor(fast_decode=True)
+
+    reference = torch.cat([exact.process_reference(data) for data in images])
+    exact_out = exact.process_many(images)
+    fast_out = fast.process_many(images)
+    exact_diff = (exact_out - reference).abs().max().item()
+
+    return {
+        "images": len(images),
+        "reference_ms_per_image": _time_per_image(lambda batch: [exact.process_reference(d) for d in batch], images, repeat),
+        "exact_ms_per_image": _time_per_image(lambda batch: [exact.process(d) for d in batch], images, repeat),
+        "fast_ms_per_image": _time_per_image(lambda batch: [fast.process(d) for d in batch], images, repeat),
+        "fast_batched_ms_per_image": _time_per_image(fast.process_many, images, repeat),
+        "exact_max_abs_diff": exact_diff,
+        "exact_equivalent": exact_diff <= EXACT_ATOL,
+        # 缩小尺寸解码会带来轻微的重采样差异 (以归一化后的数值计)
+        "fast_max_abs_diff": (fast_out - reference).abs().max().item(),
+        "fast_mean_abs_diff": (fast_out - reference).abs().mean().item(),
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark ImageProcessor preprocessing paths.")
+    parser.add_argument("--images", type=Path, help="包含测试图片的文件夹 (递归查找)")
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--synthetic", type=int, default=10, help="找不到真实图片时生成的合成图片数量")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", type=Path, help="把结果写入 JSON 文件")
+    args = parser.parse_args(argv)
+
+    images = load_images(args.images, args.limit) if args.images else []
+    source = str(args.images) if images else "synthetic"
+    if not images:
+        images = synthetic_images(args.synthetic)
+
+    result = {"source": source, **run(images, args.repeat)}
+    print(json.dumps(result, indent=4))
+    if args.json:
+        args.json.write_text(json.dumps(result, indent=4), encoding="utf-8")
+    return 0 if result["exact_equivalent"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
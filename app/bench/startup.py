@@ -0,0 +1,176 @@
+# app/bench/startup.py
+# 启动耗时基准测试：找出后端容器为什么迟迟不能就绪。
+#   - 在全新的子进程中以 `python -X importtime` 导入每个全局单例所在的模块，
+#     分别记录总耗时、模块自身执行耗时 (≈ 单例构造耗时，不含其依赖的导入) 和最慢的依赖导入；
+#   - 可选地导入 app.main (需要能连接数据库)；
+#   - 输出 JSON 报告，并可与历史报告比较，超出阈值时以非零状态退出 (用于升级模型/依赖库前后的回归检查)。
+#
+# 用法 (在项目根目录运行):
+#   python -m app.bench.startup --json startup_report.json
+#   python -m app.bench.startup --baseline startup_report.json --tolerance 0.25
+#   python -m app.bench.startup --targets kb_service nlp_service --include-main
+import argparse
+import json
+import platform
+import re
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional
+
+BASE_DIR = Path(__file__).resolve().parent.parent.parent
+
+# 名称 -> (模块, 全局实例, 导入后额外执行的首次使用代码)
+# 懒加载的单例在导入时并不做重活，额外代码触发它们真正的初始化，使测量结果反映首个请求的开销。
+TARGETS = {
+    "classifier": ("app.models.disease_classifier", "classifier", ""),
+    "xai_generator": ("app.utils.xai_generator", "xai_generator", ""),
+    "report_generator_v3": ("app.models.recommendation_generator", "report_generator_v3", ""),
+    "risk_assessor": ("app.models.risk_assessor", "risk_assessor", "instance.compile() if instance.compiled else None"),
+    "kb_service": ("app.services.knowledge_base_service", "kb_service", ""),
+    "nlp_service": ("app.services.nlp_service", "nlp_service", "instance.pipeline"),
+}
+
+MAIN_TARGET = ("app.main", "app", "")
+
+CHILD_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+__import__({module!r})  # 经过 C 层的导入路径，-X importtime 才会记录目标模块本身
+module = sys.modules[{module!r}]
+imported = time.perf_counter()
+instance = getattr(module, {attribute!r})
+{first_use}
+done = time.perf_counter()
+print("__STARTUP_BENCH__" + json.dumps({{"import_seconds": imported - start, "first_use_seconds": done - imported}}))
+"""
+
+IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S.*)$")
+
+# 回归判断的绝对余量：很快的目标 (几十毫秒) 的抖动不应触发回归
+ABSOLUTE_SLACK_SECONDS = 0.05
+
+
+def parse_importtime(stderr: str) -> List[Dict]:
+    """解析 -X importtime 的输出: 每个模块的自身耗时、累计耗时 (秒) 和嵌套深度。"""
+    modules = []
+    for line in stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            modules.append({
+                "module": name.strip(),
+                "self_seconds": int(self_us) / 1e6,
+                "cumulative_seconds": int(cumulative_us) / 1e6,
+                "depth": (len(indent) - 1) // 2,
+            })
+    return modules
+
+
+def measure_target(name: str, module: str, attribute: str, first_use: str = "", top: int = 15,
+                   timeout: float = 600, python: str = sys.executable) -> Dict:
+    """在全新的解释器中导入模块并触发单例初始化，返回耗时明细。"""
+    script = CHILD_SCRIPT.format(module=module, attribute=attribute, first_use=first_use or "pass")
+    try:
+        completed = subprocess.run(
+            [python, "-X", "importtime", "-c", script],
+            cwd=BASE_DIR, capture_output=True, text=True, timeout=timeout,
+        )
+    except subprocess.TimeoutExpired:
+        return {"target": name, "module": module, "error": f"timed out after {timeout}s"}
+
+    imports = parse_importtime(completed.stderr)
+    marker = next((line for line in completed.stdout.splitlines() if line.startswith("__STARTUP_BENCH__")), None)
+    result = {"target": name, "module": module}
+    if completed.returncode != 0 or marker is None:
+        error_lines = [line for line in completed.stderr.splitlines() if not line.startswith("import time:")]
+        result["error"] = "\n".join(error_lines[-5:]) or f"exit code {completed.returncode}"
+        return result
+
+    timings = json.loads(marker[len("__STARTUP_BENCH__"):])
+    own = next((m for m in imports if m["module"] == module), None)
+    result.update({
+        "total_seconds": timings["import_seconds"] + timings["first_use_seconds"],
+        "import_seconds": timings["import_seconds"],
+        # 目标模块自身的执行时间，主要就是全局单例的构造 (加载权重、解析文件等)
+        "construction_seconds": own["self_seconds"] if own else None,
+        "first_use_seconds": timings["first_use_seconds"],
+        "modules_imported": len(imports),
+        "slowest_imports": sorted(
+            (m for m in imports if m["module"] != module), key=lambda m: m["self_seconds"], reverse=True
+        )[:top],
+    })
+    return result
+
+
+def compare(report: Dict, baseline: Dict, tolerance: float) -> List[Dict]:
+    """与基线报告比较每个目标的 total_seconds，返回超出 (1 + tolerance) 倍 + 绝对余量的回归项。"""
+    regressions = []
+    previous = {item["target"]: item for item in baseline.get("targets", [])}
+    for item in report["targets"]:
+        before = previous.get(item["target"], {}).get("total_seconds")
+        now = item.get("total_seconds")
+        if before is None or now is None:
+            continue
+        limit = before * (1 + tolerance) + ABSOLUTE_SLACK_SECONDS
+        if now > limit:
+            regressions.append({"target": item["target"], "baseline_seconds": before, "seconds": now, "limit_seconds": limit})
+    return regressions
+
+
+def _versions() -> Dict[str, Optional[str]]:
+    versions = {"python": platform.python_version()}
+    for package in ("torch", "torchvision", "numpy", "sklearn", "skfuzzy", "fastapi"):
+        try:
+            versions[package] = __import__(package).__version__
+        except Exception:
+            versions[package] = None
+    return versions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Profile API import time and global singleton construction.")
+    parser.add_argument("--targets", nargs="+", choices=sorted(TARGETS), default=list(TARGETS))
+    parser.add_argument("--include-main", action="store_true", help="同时测量导入 app.main (需要可连接的数据库)")
+    parser.add_argument("--top", type=int, default=15, help="每个目标列出的最慢依赖导入数量")
+    parser.add_argument("--json", type=Path, help="把报告写入 JSON 文件")
+    parser.add_argument("--baseline", type=Path, help="与之前的 JSON 报告比较")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="允许相对基线变慢的比例")
+    parser.add_argument("--max-total-seconds", type=float, help="所有目标总耗时的绝对上限")
+    args = parser.parse_args(argv)
+
+    selected = [(name, *TARGETS[name]) for name in args.targets]
+    if args.include_main:
+        selected.append(("app.main", *MAIN_TARGET))
+
+    results = []
+    for name, module, attribute, first_use in selected:
+        print(f"⏱️  measuring {name} ({module}) ...", file=sys.stderr)
+        results.append(measure_target(name, module, attribute, first_use, top=args.top))
+
+    report = {
+        "versions": _versions(),
+        "targets": results,
+        "total_seconds": sum(item.get("total_seconds") or 0 for item in results),
+        "tolerance": args.tolerance,
+        "regressions": [],
+    }
+    if args.baseline:
+        report["regressions"] = compare(report, json.loads(args.baseline.read_text(encoding="utf-8")), args.tolerance)
+    if args.max_total_seconds is not None and report["total_seconds"] > args.max_total_seconds:
+        report["regressions"].append({"target": "total", "seconds": report["total_seconds"], "limit_seconds": args.max_total_seconds})
+
+    print(json.dumps(report, indent=4))
+    if args.json:
+        args.json.write_text(json.dumps(report, indent=4), encoding="utf-8")
+
+    failed = [item["target"] for item in results if "error" in item]
+    if failed:
+        print(f"❌ 以下目标加载失败: {failed}", file=sys.stderr)
+    if report["regressions"]:
+        print(f"❌ 启动耗时回归: {[r['target'] for r in report['regressions']]}", file=sys.stderr)
+    return 1 if failed or report["regressions"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -15,17 +15,85 @@ class Settings(BaseSettings):
     DB_USER: str
     DB_PASSWORD: str
     DB_NAME: str
+    DATABASE_URL: Optional[str] = None  # 完整的 SQLAlchemy URL (例如压测用的 sqlite:///temp/bench.sqlite3)，设置后覆盖上面的 MySQL 配置
 
     # --- Application Core Settings ---
     PROJECT_NAME: str
     CONFIDENCE_THRESHOLD: float = 0.75
+    MODEL_BACKEND: str = "eager"  # 'eager', 'torchscript', 'onnxruntime' or 'quantized'
+    STARTUP_WARMUP: bool = True  # 启动后在后台预加载模型；False 则在第一次用到时才加载
+    IMAGE_FAST_DECODE: bool = False  # JPEG 缩小尺寸解码 (更快，但与训练时的预处理有轻微数值差异，见 app/bench/preprocess.py)
+
+    # --- Inference Micro-batching ---
+    INFERENCE_BATCH_MAX_SIZE: int = 8
+    INFERENCE_BATCH_MAX_WAIT_MS: float = 10.0
+
+    # --- Executors & Backpressure ---
+    INFERENCE_WORKERS: int = 2
+    INFERENCE_MAX_PENDING: int = 32
+    IO_WORKERS: int = 8
+    IO_MAX_PENDING: int = 64
+    EXECUTOR_RETRY_AFTER_SECONDS: int = 2
+
+    # --- XAI (Grad-CAM) ---
+    XAI_MODE: str = "sync"  # 'sync' (in the /diagnose response), 'deferred' (background job) or 'off'
+    # 'deferred' 的任务状态只保存在进程内，要求单个 uvicorn worker；多 worker 部署请使用 'sync'
+    XAI_JOB_TTL_SECONDS: int = 3600
+
+    # --- Environmental Risk Assessment ---
+    RISK_ASSESSOR_MODE: str = "compiled"  # 'compiled' (precomputed grid + interpolation) or 'exact' (skfuzzy per call)
+    RISK_GRID_STEP: float = 0.25
+    RISK_BATCH_MAX_LOCATIONS: int = 500
+
+    # --- Diagnosis Result Cache ---
+    DIAGNOSIS_CACHE_BACKEND: str = "memory"  # 'memory', 'redis' or 'off'
+    DIAGNOSIS_CACHE_MAX_ENTRIES: int = 1024
+    DIAGNOSIS_CACHE_TTL_SECONDS: int = 86400
+    REDIS_URL: str = "redis://redis:6379/1"
 
     # --- External APIs ---
     SERPAPI_KEY: Optional[str] = None
     RESEND_API_KEY: Optional[str] = None
     # --- ↓↓↓ 在这里添加下面这一行 ↓↓↓ ---
     NGROK_AUTHTOKEN: Optional[str] = None 
+
+    # --- Weather (Open-Meteo) ---
+    OPEN_METEO_API_URL: str = "https://api.open-meteo.com/v1/forecast"
+    WEATHER_BULK_MAX_LOCATIONS: int = 50  # 每次上游请求最多携带的坐标数
+    WEATHER_HTTP_TIMEOUT_SECONDS: float = 10.0
+    WEATHER_GRID_DEGREES: float = 0.1  # 缓存网格 (约 11 km)，同一网格内的坐标共用一次上游请求
+    WEATHER_CURRENT_TTL_SECONDS: int = 900  # Open-Meteo 当前天气每 15 分钟更新
+    WEATHER_FORECAST_TTL_SECONDS: int = 3600  # 预报模型每小时更新
+    WEATHER_CACHE_MAX_ENTRIES: int = 4096
+    WEATHER_LIVE_TIMEOUT_SECONDS: float = 3.0  # 没有本地快照时等待上游的上限，超时返回默认值
+    WEATHER_SNAPSHOT_PATH: str = "temp/weather_snapshots.sqlite3"  # 相对项目根目录；留空则不启用快照库
+    WEATHER_SNAPSHOT_MAX_STALE_SECONDS: int = 21600
+    WEATHER_REFRESH_INTERVAL_SECONDS: float = 600  # 后台刷新活跃区域的周期，0 表示关闭
+    WEATHER_ACTIVE_REGION_SECONDS: int = 86400
     
+    # --- Web References (report enrichment) ---
+    WEB_REFERENCES_MODE: str = "inline"  # 'inline' (wait up to the inline budget), 'deferred' (attach later) or 'off'
+    WEB_REFERENCES_INLINE_WAIT_SECONDS: float = 3.0
+    WEB_REFERENCES_DEADLINE_SECONDS: float = 8.0  # 搜索 + 下载文章的总期限
+    WEB_REFERENCES_REQUEST_TIMEOUT_SECONDS: float = 4.0
+    WEB_REFERENCES_TTL_SECONDS: int = 604800
+    WEB_REFERENCES_CACHE_DIR: str = "temp/web_references"  # 相对项目根目录
+    WEB_SEARCH_URL: str = "https://html.duckduckgo.com/html/"
+
+    # --- Knowledge Base ---
+    KB_RELOAD_INTERVAL_SECONDS: float = 5.0  # 检查 knowledge_base/*.yaml 修改并自动重新加载的周期，0 表示关闭
+    KB_COMPILED_CACHE_DIR: str = "temp/kb_compiled"  # 相对项目根目录，YAML 编译缓存；留空则每次都解析 YAML
+
+    # --- Knowledge Base Embedding Index (offline retrieval) ---
+    KB_INDEX_DIR: str = "models_store/kb_index"  # 相对项目根目录，由 app/train/build_kb_index.py 生成
+    KB_INDEX_TOP_K: int = 3
+    KB_INDEX_MIN_SCORE: float = 0.5
+
+    # --- Observability ---
+    TRACE_SAMPLE_RATE: float = 0.0  # 保留分阶段明细的请求比例 (GET /diagnose/traces)；直方图 (GET /metrics) 始终统计所有请求
+    TRACE_MAX_SAMPLES: int = 100
+    LOG_PREDICTION_DETAILS: bool = False  # 每次预测都记录 Top-5 概率分布 (仅调试用)
+
     # --- Email Configuration (for SMTP) ---
     SMTP_SERVER: Optional[str] = None
     SMTP_PORT: Optional[int] = None
@@ -12,12 +12,14 @@ from app.config import settings
 
 # --- Database Connection Setup ---
 encoded_password = quote_plus(settings.DB_PASSWORD)
-SQLALCHEMY_DATABASE_URL = (
+SQLALCHEMY_DATABASE_URL = settings.DATABASE_URL or (
     f"mysql+pymysql://{settings.DB_USER}:{encoded_password}@"
     f"{settings.DB_HOST}:{settings.DB_PORT}/{settings.DB_NAME}"
 )
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+# SQLite (压测/本地开发) 的连接会被 FastAPI 线程池中的不同线程使用
+connect_args = {"check_same_thread": False} if SQLALCHEMY_DATABASE_URL.startswith("sqlite") else {}
+engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args=connect_args)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
@@ -8,6 +8,7 @@ from loguru import logger # <-- 核心添加: 确保导入了 loguru
 from app import crud, database
 from app.auth import security
 from app.services.weather_service import weather_service
+from app.utils.stage_metrics import stage_metrics
 
 # --- 认证依赖 ---
 async def get_current_user(token: str = Header(..., alias="Authorization"), db: Session = Depends(database.get_db)) -> database.User:
@@ -28,13 +29,15 @@ async def get_current_user(token: str = Header(..., alias="Authorization"), db:
 
 # --- 天气数据依赖 ---
 async def get_weather_data(latitude: float = Form(...), longitude: float = Form(...)) -> Dict[str, Any]:
+    # /diagnose 在 stage_metrics.trace 内直接调用本函数；作为 Depends 使用时会在 trace 之前解析，weather 阶段不会计入明细
     try:
         # 调用 weather_service 实例上的 get_current_weather 方法
-        weather_data = await weather_service.get_current_weather(latitude, longitude)
+        with stage_metrics.span("weather"):
+            weather_data = await weather_service.get_current_weather(latitude, longitude)
         
         # 【【【 核心添加: 增强日志记录 】】】
         # 这样我们在后端日志里就能清楚地看到获取到的天气数据
-        logger.info(f"Weather data retrieved: Temp={weather_data['temperature']}°C, Humidity={weather_data['humidity']}%")
+        logger.info(f"Weather data retrieved: Temp={weather_data['temperature']}°C, Humidity={weather_data['humidity']}%, Source={weather_data.get('source')}")
         
         return weather_data
     except ConnectionError as e:
@@ -13,8 +13,9 @@ os.environ['MPLCONFIGDIR'] = str(temp_mpl_dir)
 
 
 # --- Part 2: Standard & App Imports ---
+import asyncio
+import time
 import uuid
-import shutil
 from typing import Dict, Any, Optional
 
 from fastapi import (
@@ -35,21 +36,22 @@ database.Base.metadata.create_all(bind=database.engine)
 from app.config import settings
 from app.schemas import diagnosis as schemas_diagnosis
 from app.schemas import prediction as schemas_prediction
-from app.utils import image_processing, xai_generator
-from app.models import disease_classifier, risk_assessor, recommendation_generator
+from app.models.inference_batcher import InferenceBatcher
+from app.utils.executors import inference_executor, io_executor, ExecutorSaturatedError
+from app.utils.service_registry import ServiceRegistry, module_attribute
+from app.utils.stage_metrics import stage_metrics
 from app.services.weather_service import weather_service
-from app.services.disease_predictor_service import disease_predictor_service
-from app.services.knowledge_discovery_service import knowledge_discovery_service
-from app.services.data_management_service import data_management_service
 from app.services.knowledge_base_service import kb_service
+from app.services.diagnosis_cache_service import diagnosis_cache, CachedDiagnosis
+from app.services.xai_job_service import xai_job_service
+from app.services.web_reference_service import web_reference_service
 from app.services import permission_service
-from app.background_tasks import trigger_background_retraining
 # 确保导入了所有路由模块
 from app.routers import users, token, diagnoses, products, posts, orders, chat
 from app import crud
 # 依赖项
 from app.dependencies import get_current_user, get_weather_data
-from fastapi.responses import JSONResponse 
+from fastapi.responses import JSONResponse, PlainTextResponse
 
 
 # --- Part 3: FastAPI Application Setup ---
@@ -75,6 +77,36 @@ async def generic_exception_handler(request: Request, exc: Exception):
         content={"detail": f"An internal server error occurred: {exc}"},
     )
 
+# --- 重量级子系统 (按需加载) ---
+# 导入本模块时不加载任何模型：/token、/posts 等路由无需等待；
+# 第一次用到时才加载，或在启动后由后台预热 (STARTUP_WARMUP) 提前加载。
+def _load_optional(module_name: str, attribute: str):
+    """可选子系统 (如 Grad-CAM)：加载失败时返回 None，诊断功能照常工作。"""
+    try:
+        return module_attribute(module_name, attribute)()
+    except Exception as e:
+        logger.error(f"Optional subsystem '{module_name}' failed to load: {e}")
+        return None
+
+services = ServiceRegistry()
+services.register("classifier", module_attribute("app.models.disease_classifier", "classifier"))
+services.register("image_processor", module_attribute("app.utils.image_processing", "image_processor"))
+services.register("risk_assessor", module_attribute("app.models.risk_assessor", "risk_assessor"))
+services.register("report_generator", module_attribute("app.models.recommendation_generator", "report_generator_v3"))
+services.register("xai_generator", lambda: _load_optional("app.utils.xai_generator", "xai_generator"))  # 初始化失败时为 None
+services.register("disease_predictor", module_attribute("app.services.disease_predictor_service", "disease_predictor_service"))
+# /diagnose 所需的子系统；全部加载完成后 /health/ready 才返回 200
+DIAGNOSIS_SUBSYSTEMS = ["classifier", "image_processor", "risk_assessor", "report_generator"]
+
+# --- 推理微批处理调度器 ---
+# 并发的 /diagnose 请求会在一个很短的时间窗口内被合并为一次批量前向推理
+inference_batcher = InferenceBatcher(
+    predict_batch_fn=lambda image_batch: services.classifier.predict_batch(image_batch),
+    max_batch_size=settings.INFERENCE_BATCH_MAX_SIZE,
+    max_wait_ms=settings.INFERENCE_BATCH_MAX_WAIT_MS,
+    executor=inference_executor,
+)
+
 # --- 中间件 (CORS) ---
 app.add_middleware(
     CORSMiddleware,
@@ -111,16 +143,48 @@ app.include_router(chat.router) # 聊天路由
 @app.on_event("startup")
 async def startup_event():
     logger.info(f"Starting up {settings.PROJECT_NAME} API...")
-    logger.info(f"AI model ready on device: {disease_classifier.classifier.device}")
-    if xai_generator.xai_generator:
+    await weather_service.start()
+    await web_reference_service.start()
+    await kb_service.start()
+    inference_batcher.start()
+    if settings.STARTUP_WARMUP:
+        # 预热在后台进行：应用立即开始接受请求，诊断相关的子系统随后陆续就绪
+        global _warmup_task
+        _warmup_task = asyncio.get_running_loop().create_task(services.warm_up(
+            DIAGNOSIS_SUBSYSTEMS + ["xai_generator", "disease_predictor"],
+            after_load={"classifier": _log_classifier_ready, "risk_assessor": _compile_risk_surface, "xai_generator": _log_xai_ready},
+        ))
+    logger.info(f"Application startup complete in {time.perf_counter() - services.created_at:.2f}s since import.")
+
+_warmup_task: Optional[asyncio.Task] = None
+
+def _log_classifier_ready(classifier):
+    logger.info(f"AI model ready on device: {classifier.device}")
+
+def _compile_risk_surface(assessor):
+    if assessor.compiled:
+        # 预先构建模糊风险曲面网格，避免第一个诊断请求承担这部分开销
+        assessor.compile()
+        logger.info("Fuzzy risk surface compiled.")
+
+def _log_xai_ready(generator):
+    if generator:
         logger.info("XAI (Grad-CAM) module initialized.")
     else:
         logger.warning("XAI (Grad-CAM) module failed to initialize.")
-    logger.info("Application startup complete.")
 
 @app.on_event("shutdown")
 async def shutdown_event():
     logger.info(f"Shutting down {settings.PROJECT_NAME} API...")
+    if _warmup_task is not None:
+        _warmup_task.cancel()
+    await xai_job_service.shutdown()
+    await inference_batcher.stop()
+    await weather_service.close()
+    await web_reference_service.close()
+    await kb_service.close()
+    inference_executor.shutdown()
+    io_executor.shutdown()
 
 
 # --- Part 5: API 端点 (只保留根路径和核心功能) ---
@@ -128,11 +192,34 @@ async def shutdown_event():
 def read_root():
     return {"status": "ok", "message": f"Welcome to {settings.PROJECT_NAME} API!"}
 
+@app.get("/health/live", summary="Liveness probe", tags=["General"])
+def read_liveness():
+    """进程存活即可返回 200，不依赖任何模型。"""
+    return {"status": "alive"}
+
+@app.get("/health/ready", summary="Readiness probe", tags=["General"])
+def read_readiness():
+    """诊断所需的模型全部加载后返回 200，否则返回 503 (负载均衡器可据此延迟导入流量)。"""
+    ready = services.ready(DIAGNOSIS_SUBSYSTEMS)
+    body = {"status": "ready" if ready else "loading", **services.stats()}
+    return JSONResponse(status_code=200 if ready else 503, content=body)
+
+@app.get("/health/startup", summary="Startup time breakdown per subsystem", tags=["General"])
+def read_startup_report():
+    """返回每个子系统的加载状态与耗时，以及后台预热的总耗时。"""
+    return services.stats()
+
+@app.get("/metrics", summary="Prometheus metrics", tags=["General"], response_class=PlainTextResponse)
+def read_metrics():
+    """各诊断阶段及整体请求的延迟直方图 (Prometheus 文本格式)。"""
+    return PlainTextResponse(stage_metrics.render_prometheus(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 @app.post("/diagnose", response_model=schemas_diagnosis.FullDiagnosisReport, summary="Get crop health diagnosis", tags=["Diagnosis"])
 async def create_diagnosis_report(
     image: UploadFile = File(...),
     language: str = Form("en", enum=["en", "ms", "zh"]),
-    weather: Dict[str, Any] = Depends(get_weather_data),
+    latitude: float = Form(...),
+    longitude: float = Form(...),
     current_user: database.User = Depends(get_current_user),
     db: Session = Depends(database.get_db)
 ):
@@ -140,46 +227,209 @@ async def create_diagnosis_report(
     
     permission_service.check_api_limit(db, user=current_user)
 
+    # 每个阶段计入 /metrics 的直方图；按 TRACE_SAMPLE_RATE 采样的请求保留完整明细 (/diagnose/traces)
+    # 天气在 trace 内获取 (而不是作为依赖项提前解析)，weather 阶段才会出现在明细和整体请求耗时中
+    with stage_metrics.trace("diagnose") as trace:
+        weather = await get_weather_data(latitude, longitude)
+        return await _run_diagnosis(image, language, weather, current_user, db, trace)
+
+async def _run_diagnosis(image: UploadFile, language: str, weather: Dict[str, Any], current_user: database.User, db: Session, trace):
     try:
         unique_filename = f"{uuid.uuid4().hex}{Path(image.filename).suffix.lower()}"
         file_path = static_path / "uploads" / unique_filename
         
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(image.file, buffer)
+        with stage_metrics.span("upload_write"):
+            image_bytes = await image.read()
+            await io_executor.run(file_path.write_bytes, image_bytes)
         
         image_url = f"/static/uploads/{unique_filename}"
-        image.file.seek(0)
-        image_bytes = await image.read()
         
+    except ExecutorSaturatedError as e:
+        raise _service_busy(e)
     except Exception as e:
         logger.error(f"Failed to save uploaded file: {e}")
         raise HTTPException(status_code=500, detail="Error saving image file.")
 
     try:
-        image_tensor = image_processing.image_processor.process(image_bytes)
-        prediction = disease_classifier.classifier.predict(image_tensor)
-        risk = risk_assessor.risk_assessor.assess(weather["temperature"], weather["humidity"])
-        
-        report = recommendation_generator.report_generator_v3.generate(prediction, risk, lang=language)
+        # 首个请求到来时如果模型尚未预热，在后台线程中加载，不阻塞事件循环
+        with stage_metrics.span("subsystem_load"):
+            await services.ensure(DIAGNOSIS_SUBSYSTEMS + ["xai_generator"])
+        # 所有阻塞型的推理与 IO 都分派到专用线程池，事件循环保持空闲以服务其他请求 (包括聊天 WebSocket)
+        with stage_metrics.span("risk"):
+            risk = await inference_executor.run(services.risk_assessor.assess, weather["temperature"], weather["humidity"])
 
-        if xai_generator.xai_generator and report:
-            xai_url = await _generate_and_attach_xai(image_tensor, image_bytes, prediction.disease)
-            if xai_url:
-                report.xai_image_url = xai_url
+        # 先查诊断缓存：同一张 (或几乎相同的) 照片命中时完全跳过模型推理和 Grad-CAM
+        with stage_metrics.span("cache_lookup"):
+            cache_key = await inference_executor.run(
+                diagnosis_cache.compute_key, image_bytes, services.classifier.model_version, language
+            )
+            cached = await io_executor.run(diagnosis_cache.get, cache_key)
+        trace.attributes["cache_hit"] = cached is not None
 
-        permission_service.log_api_usage(db, user_id=current_user.id, endpoint="/diagnose")
-        crud.create_diagnosis_history(
-            db=db, user_id=current_user.id, report=report,
-            prediction=prediction, risk=risk, image_url=image_url
-        )
+        if cached:
+            logger.info(f"Diagnosis cache hit for user ID {current_user.id}: {cached.prediction.disease}")
+            prediction = cached.prediction
+            if _same_risk(cached.risk, risk) and cached.report.references_status not in ("pending", "unavailable"):
+                report = cached.report.model_copy()
+            else:
+                # 图像结论相同但天气变了 (或当时网络参考信息尚未就绪/抓取失败)：只重新生成报告，沿用缓存的预测和热力图
+                report = await _generate_report(prediction, risk, language)
+                report.xai_image_url = cached.report.xai_image_url
+                report.xai_status, report.xai_job_id = cached.report.xai_status, cached.report.xai_job_id
+                with stage_metrics.span("cache_write"):
+                    await io_executor.run(diagnosis_cache.put, cache_key, CachedDiagnosis(
+                        prediction=prediction, risk=risk, report=report, xai_image_url=cached.xai_image_url,
+                        owner_id=cached.owner_id,
+                    ))
+            if cached.owner_id != current_user.id:
+                # 缓存的热力图叠加在首个上传者自己的照片上 (后台任务也属于对方)，不能返回给其他用户
+                report.xai_image_url, report.xai_status, report.xai_job_id = None, None, None
+            elif report.xai_status == "pending":
+                _refresh_deferred_xai(report)
+        else:
+            # 只解码一次：裁剪后的 RGB 图像既用于生成模型输入，也用于叠加热力图
+            with stage_metrics.span("decode_preprocess"):
+                rgb_image = await inference_executor.run(services.image_processor.decode_and_crop, image_bytes)
+                image_tensor = services.image_processor.normalize(rgb_image[None])
+            xai_mode = settings.XAI_MODE.lower() if services.xai_generator else "off"
+            trace.attributes["xai_mode"] = xai_mode
+            # eager 后端 + sync 模式：预测直接取自 Grad-CAM 的那一次前向 (predict_and_explain 的 logits)，不再经过微批处理队列。
+            # TorchScript/ONNX/INT8 后端无法在模型上挂钩子求梯度：预测走微批处理队列和选定的后端 (与缓存键中的
+            # model_version 一致)，Grad-CAM 再在 eager 模型上单独计算一次。
+            heatmap = None
+            if xai_mode == "sync" and services.classifier.backend == "eager":
+                prediction, heatmap = await _predict_and_explain(image_tensor, rgb_image)
+            else:
+                with stage_metrics.span("forward"):
+                    prediction = await inference_batcher.submit(image_tensor)
+                if xai_mode == "sync":
+                    heatmap = await _explain(image_tensor, rgb_image, prediction)
+            
+            report = await _generate_report(prediction, risk, language)
+
+            if heatmap is not None and report:
+                xai_url = await _save_xai_heatmap(heatmap)
+                if xai_url:
+                    report.xai_image_url = xai_url
+                    report.xai_status = "ready"
+            elif xai_mode == "deferred" and report:
+                # 热力图不在关键路径上：先返回报告，前端稍后通过 GET /diagnose/xai/{job_id} 获取
+                report.xai_status = "pending"
+                report.xai_job_id = uuid.uuid4().hex
+
+            with stage_metrics.span("cache_write"):
+                await io_executor.run(diagnosis_cache.put, cache_key, CachedDiagnosis(
+                    prediction=prediction, risk=risk, report=report, xai_image_url=report.xai_image_url,
+                    owner_id=current_user.id,
+                ))
+            if report.xai_status == "pending":
+                _schedule_deferred_xai(image_tensor, rgb_image, prediction, risk, report, cache_key, current_user.id)
+
+        trace.attributes["disease"] = prediction.disease
+        report.weather_source = weather.get("source")
+        with stage_metrics.span("db_write"):
+            await io_executor.run(_save_diagnosis_records, db, current_user.id, report, prediction, risk, image_url)
         logger.success(f"Diagnosis and history saved for user ID: {current_user.id}")
         
         return report
 
+    except ExecutorSaturatedError as e:
+        logger.warning(f"Diagnosis rejected for user ID {current_user.id}: {e}")
+        raise _service_busy(e)
     except Exception as e:
         logger.error(f"An unexpected error occurred during diagnosis: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="An internal error occurred during diagnosis.")
 
+async def _generate_report(prediction, risk, language: str):
+    """
+    先异步获取网络参考摘要 (WEB_REFERENCES_MODE)，再在 IO 线程池中生成报告。
+    inline 模式最多等待 WEB_REFERENCES_INLINE_WAIT_SECONDS；deferred 模式只使用已缓存的摘要。
+    未就绪时 references_status = "pending"，抓取在后台完成，可通过 GET /diagnose/references/{disease_key} 获取；
+    抓取失败时为 "unavailable" (不写缓存，下一次请求重新抓取)。
+    """
+    generator = services.report_generator
+    web_summaries, references_status = None, None
+    mode = settings.WEB_REFERENCES_MODE.lower()
+    if mode != "off" and generator.wants_web_references(prediction):
+        wait = 0 if mode == "deferred" else settings.WEB_REFERENCES_INLINE_WAIT_SECONDS
+        with stage_metrics.span("web_references"):
+            web_summaries = await generator.web_search_and_summarize(prediction.disease, language, wait=wait)
+        if web_summaries is not None:
+            references_status = "ready"
+        else:
+            # None: 等待超时 (抓取仍在后台进行) 或抓取失败 (未写缓存，下一次请求会重试)
+            pending = web_reference_service.is_pending(prediction.disease, language)
+            references_status = "pending" if pending else "unavailable"
+    with stage_metrics.span("report"):
+        report = await io_executor.run(generator.generate, prediction, risk, lang=language, web_summaries=web_summaries)
+    report.references_status = references_status
+    return report
+
+def _service_busy(e: ExecutorSaturatedError) -> HTTPException:
+    """推理/IO 线程池饱和时的背压响应：503 + Retry-After。"""
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="The diagnosis service is busy. Please retry shortly.",
+        headers={"Retry-After": str(e.retry_after)},
+    )
+
+def _same_risk(a, b) -> bool:
+    """报告中风险评分只保留一位小数，两者一致时缓存的报告文本可以原样复用。"""
+    return a.risk_level == b.risk_level and round(a.risk_score, 1) == round(b.risk_score, 1)
+
+def _save_diagnosis_records(db: Session, user_id: int, report, prediction, risk, image_url: str):
+    """同步的数据库写入，由 io_executor 在线程池中执行。"""
+    permission_service.log_api_usage(db, user_id=user_id, endpoint="/diagnose")
+    crud.create_diagnosis_history(
+        db=db, user_id=user_id, report=report,
+        prediction=prediction, risk=risk, image_url=image_url
+    )
+
+@app.get("/diagnose/xai/{job_id}", response_model=schemas_diagnosis.XaiJobStatus, summary="Get deferred XAI heatmap status", tags=["Diagnosis"])
+def read_xai_job(job_id: str):
+    """XAI_MODE=deferred 时，查询后台热力图任务的状态；完成后返回图片 URL。任务只保存在提交它的进程中 (见 XaiJobService)。"""
+    job = xai_job_service.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="XAI job not found or expired.")
+    return job
+
+@app.get("/diagnose/references/{disease_key}", response_model=schemas_diagnosis.WebReferences, summary="Get web references for a disease", tags=["Diagnosis"])
+def read_web_references(disease_key: str, language: str = "en"):
+    """报告的 references_status 为 pending 时，前端稍后通过此接口获取网络参考信息。"""
+    summaries = web_reference_service.cached(disease_key, language)
+    if summaries is not None:
+        status_text = "ready"
+    elif web_reference_service.is_pending(disease_key, language):
+        status_text = "pending"
+    else:
+        status_text = "unavailable"
+    return schemas_diagnosis.WebReferences(disease=disease_key, language=language, status=status_text, references=summaries or [])
+
+@app.get("/diagnose/traces", summary="Sampled per-stage diagnosis traces", tags=["Diagnosis"])
+def read_diagnosis_traces(limit: int = 20):
+    """返回最近被采样 (TRACE_SAMPLE_RATE) 的诊断请求的分阶段耗时明细，以及各阶段的累计次数与耗时。"""
+    return {**stage_metrics.stats(), "traces": stage_metrics.recent_traces(limit)}
+
+@app.get("/diagnose/batching/stats", summary="Inference micro-batching metrics", tags=["Diagnosis"])
+def read_batching_stats():
+    """返回推理队列深度、批大小直方图和每个请求的排队等待时间，用于调优吞吐与延迟。"""
+    return inference_batcher.stats()
+
+@app.get("/diagnose/executors/stats", summary="Inference and blocking-IO executor metrics", tags=["Diagnosis"])
+def read_executor_stats():
+    """返回推理线程池与阻塞IO线程池的并发占用和拒绝次数，以及本进程内后台热力图任务的状态计数。"""
+    return {"inference": inference_executor.stats(), "io": io_executor.stats(), "xai_jobs": xai_job_service.stats()}
+
+@app.get("/diagnose/cache/stats", summary="Diagnosis result cache metrics", tags=["Diagnosis"])
+def read_diagnosis_cache_stats():
+    """返回诊断结果缓存的命中/未命中次数和命中率。"""
+    return diagnosis_cache.stats()
+
+@app.get("/weather/cache/stats", summary="Weather cache metrics", tags=["General"])
+def read_weather_cache_stats():
+    """返回天气缓存的命中、请求合并与上游调用次数。"""
+    return weather_service.stats()
+
 @app.post("/predict_risk", response_model=schemas_prediction.RiskPredictionResponse, summary="Predict future 7-day disease risk", tags=["Prediction"])
 async def predict_disease_risk(
     latitude: float = Form(...),
@@ -187,11 +437,12 @@ async def predict_disease_risk(
     disease_key: str = Form(...)
 ):
     try:
+        await services.ensure(["disease_predictor"])
         forecast_data = await weather_service.get_7_day_forecast(latitude, longitude)
         if not forecast_data:
             raise HTTPException(status_code=503, detail="Unable to retrieve valid weather forecast data.")
 
-        daily_risks = disease_predictor_service.predict_daily_risk(forecast_data, disease_key)
+        daily_risks = services.disease_predictor.predict_daily_risk(forecast_data, disease_key)
         
         kb_info = kb_service.get_disease_info(disease_key)
         disease_name = kb_info.get("name", {}).get("en", disease_key) if kb_info else disease_key
@@ -207,27 +458,126 @@ async def predict_disease_risk(
         logger.error(f"Error during risk prediction: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Internal server error during risk prediction.")
         
-async def _generate_and_attach_xai(image_tensor: torch.Tensor, image_bytes: bytes, predicted_class: str) -> Optional[str]:
+@app.post("/predict_risk/batch", response_model=schemas_prediction.BatchRiskPredictionResponse, summary="Predict 7-day risk for many diseases and locations", tags=["Prediction"])
+async def predict_disease_risk_batch(request: schemas_prediction.BatchRiskPredictionRequest):
     """
-    Helper function to generate and save XAI heatmap.
+    面向农技推广人员看板：一次请求评估多个地块坐标 × 多种病害的未来逐日风险。
+    预报通过 Open-Meteo 的多坐标请求批量获取，风险由列式引擎一次性计算。
     """
+    if len(request.locations) > settings.RISK_BATCH_MAX_LOCATIONS:
+        raise HTTPException(status_code=400, detail=f"At most {settings.RISK_BATCH_MAX_LOCATIONS} locations per request.")
     try:
-        target_idx = disease_classifier.classifier.get_class_index(predicted_class)
-        if target_idx is None:
-            logger.warning(f"Cannot find class index for '{predicted_class}' in XAI.")
-            return None
-        
-        heatmap = xai_generator.xai_generator.generate_heatmap(
-            image_tensor=image_tensor.to(disease_classifier.classifier.device), 
-            image_bytes=image_bytes, 
-            target_category=target_idx
+        await services.ensure(["disease_predictor"])
+        forecasts = await weather_service.get_7_day_forecast_many(
+            [(loc.latitude, loc.longitude) for loc in request.locations]
         )
-        
+        scores, disease_keys = services.disease_predictor.predict_risk_tensor(
+            services.disease_predictor.forecast_to_array(forecasts), request.disease_keys
+        )
+        levels = services.disease_predictor.risk_levels(scores)
+
+        results = []
+        for i, (location, forecast) in enumerate(zip(request.locations, forecasts)):
+            days = len(forecast or [])
+            results.append(schemas_prediction.LocationRiskForecast(
+                location={"latitude": location.latitude, "longitude": location.longitude},
+                dates=[day["date"] for day in forecast or []],
+                risk_scores={key: scores[i, :days, k].tolist() for k, key in enumerate(disease_keys)},
+                risk_levels={key: levels[i, :days, k].tolist() for k, key in enumerate(disease_keys)},
+                error=None if forecast else "Unable to retrieve valid weather forecast data.",
+            ))
+
+        diseases = {}
+        for key in disease_keys:
+            kb_info = kb_service.get_disease_info(key)
+            diseases[key] = kb_info.get("name", {}).get("en", key) if kb_info else key
+        return schemas_prediction.BatchRiskPredictionResponse(diseases=diseases, results=results)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error during batch risk prediction: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Internal server error during batch risk prediction.")
+
+async def _gradcam(image_tensor: torch.Tensor, rgb_image, prediction):
+    """在 eager 模型上为已预测的类别计算 Grad-CAM 热力图 (一次前向 + 对目标层的反向)。"""
+    target_idx = services.classifier.get_class_index(prediction.disease)
+    with stage_metrics.span("gradcam"):
+        _, heatmap = await inference_executor.run(
+            services.xai_generator.predict_and_explain,
+            image_tensor.to(services.classifier.device),
+            rgb_image,
+            target_idx,
+        )
+    return heatmap
+
+async def _predict_and_explain(image_tensor: torch.Tensor, rgb_image):
+    """
+    eager 后端 + XAI_MODE=sync：一次前向 (加对目标层的反向) 同时得到预测和热力图。
+    Grad-CAM 失败时退回微批处理队列做普通预测，报告照常返回 (热力图为 None)。
+    """
+    try:
+        with stage_metrics.span("forward_gradcam"):
+            probabilities, heatmap = await inference_executor.run(
+                services.xai_generator.predict_and_explain,
+                image_tensor.to(services.classifier.device),
+                rgb_image,
+            )
+        return services.classifier.to_prediction(probabilities), heatmap
+    except ExecutorSaturatedError:
+        raise
+    except Exception as e:
+        logger.error(f"Failed to generate XAI heatmap: {e}", exc_info=True)
+    with stage_metrics.span("forward"):
+        return await inference_batcher.submit(image_tensor), None
+
+async def _explain(image_tensor: torch.Tensor, rgb_image, prediction) -> Optional[Any]:
+    """XAI_MODE=sync：在返回报告前生成热力图；失败时只记录日志，报告照常返回 (热力图为 None)。"""
+    try:
+        return await _gradcam(image_tensor, rgb_image, prediction)
+    except ExecutorSaturatedError:
+        raise
+    except Exception as e:
+        logger.error(f"Failed to generate XAI heatmap: {e}", exc_info=True)
+        return None
+
+def _schedule_deferred_xai(image_tensor: torch.Tensor, rgb_image, prediction, risk, report, cache_key: Optional[str], owner_id: int):
+    """在后台生成热力图，完成后把图片 URL 回填到诊断缓存中。"""
+    async def work() -> str:
+        heatmap = await _gradcam(image_tensor, rgb_image, prediction)
+        xai_url = await _save_xai_heatmap(heatmap)
+        if xai_url is None:
+            raise RuntimeError("Failed to save XAI heatmap.")
+        return xai_url
+
+    async def on_done(xai_url: str):
+        ready_report = report.model_copy(update={"xai_image_url": xai_url, "xai_status": "ready", "xai_job_id": None})
+        await io_executor.run(diagnosis_cache.put, cache_key, CachedDiagnosis(
+            prediction=prediction, risk=risk, report=ready_report, xai_image_url=xai_url, owner_id=owner_id
+        ))
+
+    xai_job_service.submit(work, on_done=on_done, job_id=report.xai_job_id)
+
+def _refresh_deferred_xai(report):
+    """缓存命中时，缓存中的报告可能仍标记为 pending：用任务的最新状态更新它。"""
+    job = xai_job_service.get(report.xai_job_id) if report.xai_job_id else None
+    if job is None:
+        report.xai_status, report.xai_job_id = None, None
+    elif job.status == "ready":
+        report.xai_image_url, report.xai_status, report.xai_job_id = job.xai_image_url, "ready", None
+    else:
+        report.xai_status = job.status
+
+async def _save_xai_heatmap(heatmap) -> Optional[str]:
+    """
+    Helper function to save the XAI heatmap and return its URL.
+    """
+    try:
         unique_filename = f"xai_{uuid.uuid4().hex}"
-        xai_generator.save_xai_image(heatmap, unique_filename)
+        from app.utils.xai_generator import save_xai_image
+        with stage_metrics.span("jpeg_encode"):
+            await io_executor.run(save_xai_image, heatmap, unique_filename)
         
         return f"/static/xai_images/{unique_filename}.jpg"
     except Exception as e:
-        logger.error(f"Failed to generate XAI heatmap: {e}", exc_info=True)
+        logger.error(f"Failed to save XAI heatmap: {e}", exc_info=True)
         return None
-    
@@ -1,22 +1,72 @@
 # ====================================================================
 #  app/models/disease_classifier.py (Final & Complete Version)
 # ====================================================================
+import numpy as np
 import torch
 import torch.nn as nn
 from pathlib import Path
 import json
+import hashlib
 from loguru import logger
-from typing import Dict, Optional
+from typing import Dict, List, Optional
 
 # 导入我们的数据结构
 # 假设 schemas 文件夹位于 app/ 目录下
 from ..schemas.diagnosis import PredictionResult
+from ..config import settings
 
 # 导入需要用到的模型结构
 from torchvision.models import efficientnet_b0, efficientnet_b2, convnext_tiny
 
+# onnxruntime 是可选依赖，只有选择 onnxruntime 推理后端时才需要
+try:
+    import onnxruntime as ort
+except ImportError:
+    ort = None
+
+SUPPORTED_BACKENDS = ('eager', 'torchscript', 'onnxruntime', 'quantized')
+
+
+def build_model(architecture: str, num_classes: int) -> nn.Module:
+    """根据指定的架构，构建一个“空白”的模型结构。"""
+    if architecture == 'b0':
+        return efficientnet_b0(weights=None, num_classes=num_classes)
+    elif architecture == 'b2':
+        return efficientnet_b2(weights=None, num_classes=num_classes)
+    elif architecture == 'convnext_tiny':
+        return convnext_tiny(weights=None, num_classes=num_classes)
+    raise ValueError(f"Unsupported model architecture: '{architecture}'. Choose 'b0', 'b2', or 'convnext_tiny'.")
+
+
+def exported_model_paths(model_path: Path) -> Dict[str, Path]:
+    """由 .pth 权重路径推导出导出产物 (TorchScript / ONNX / INT8 量化) 的存放路径。"""
+    return {
+        'torchscript': model_path.with_suffix('.torchscript.pt'),
+        'onnxruntime': model_path.with_suffix('.onnx'),
+        'quantized': model_path.with_suffix('.int8.pt'),
+    }
+
+
+class OnnxRuntimeModel:
+    """把 onnxruntime 推理会话包装成与 nn.Module 相同的调用方式: logits = model(tensor)。"""
+
+    def __init__(self, onnx_path: Path, num_threads: int = 0):
+        if ort is None:
+            raise RuntimeError("'onnxruntime' 未安装，无法使用 onnxruntime 推理后端。")
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(str(onnx_path), sess_options=options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, image_tensor: torch.Tensor) -> torch.Tensor:
+        inputs = image_tensor.detach().cpu().numpy().astype(np.float32, copy=False)
+        return torch.from_numpy(self.session.run(None, {self.input_name: inputs})[0])
+
+
 class DiseaseClassifier:
-    def __init__(self, model_path: Path, labels_path: Path, architecture: str = 'b0'):
+    def __init__(self, model_path: Path, labels_path: Path, architecture: str = 'b0', backend: str = 'eager'):
         """
         初始化分类器，加载自研模型。
         
@@ -24,11 +74,17 @@ class DiseaseClassifier:
             model_path (Path): 训练好的模型权重文件 (.pth) 的路径。
             labels_path (Path): 类别标签的JSON文件路径。
             architecture (str): 训练时使用的模型架构 ('b0', 'b2', 'convnext_tiny')。
+            backend (str): 推理后端 ('eager', 'torchscript', 'onnxruntime', 'quantized')。
+                非 eager 后端需要先运行 app/train/export_model.py (或 quantize_model.py) 导出模型；
+                若导出产物不存在，会记录警告并回退到 eager。
         """
         self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
         logger.info(f"DiseaseClassifier is using device: {self.device}")
         
         try:
+            if backend not in SUPPORTED_BACKENDS:
+                raise ValueError(f"Unsupported inference backend: '{backend}'. Choose one of {SUPPORTED_BACKENDS}.")
+
             # 1. 加载标签文件
             with open(labels_path, 'r', encoding='utf-8') as f:
                 # 将json的key从字符串 '0', '1'... 转为整数 0, 1...
@@ -38,30 +94,66 @@ class DiseaseClassifier:
             self.class_to_idx = {name: idx for idx, name in self.labels.items()}
             logger.info(f"Loaded {self.num_classes} classes from labels file.")
 
-            # 2. 根据指定的架构，构建一个“空白”的模型结构
-            logger.info(f"Building a new '{architecture}' model structure...")
-            if architecture == 'b0':
-                self.model = efficientnet_b0(weights=None, num_classes=self.num_classes)
-            elif architecture == 'b2':
-                self.model = efficientnet_b2(weights=None, num_classes=self.num_classes)
-            elif architecture == 'convnext_tiny':
-                self.model = convnext_tiny(weights=None, num_classes=self.num_classes)
+            self.model_path = model_path
+            self.architecture = architecture
+            self._model: Optional[nn.Module] = None
+
+            # 2. 选择推理后端
+            export_path = exported_model_paths(model_path).get(backend)
+            if export_path is not None and not export_path.is_file():
+                logger.warning(f"Exported '{backend}' model not found at {export_path}, falling back to eager backend.")
+                backend, export_path = 'eager', None
+            self.backend = backend
+
+            if backend == 'torchscript':
+                logger.info(f"Loading TorchScript model from: {export_path}")
+                self._forward = torch.jit.load(str(export_path), map_location=self.device)
+                self._forward.eval()
+            elif backend == 'quantized':
+                if self.device.type != 'cpu':
+                    raise ValueError("The quantized backend only supports CPU inference.")
+                engines = torch.backends.quantized.supported_engines
+                torch.backends.quantized.engine = 'x86' if 'x86' in engines else ('fbgemm' if 'fbgemm' in engines else engines[-1])
+                logger.info(f"Loading INT8 quantized model from: {export_path}")
+                self._forward = torch.jit.load(str(export_path), map_location=self.device)
+                self._forward.eval()
+            elif backend == 'onnxruntime':
+                if self.device.type != 'cpu':
+                    raise ValueError("The onnxruntime backend only supports CPU inference.")
+                logger.info(f"Loading ONNX model from: {export_path}")
+                self._forward = OnnxRuntimeModel(export_path, num_threads=torch.get_num_threads())
             else:
-                raise ValueError(f"Unsupported model architecture: '{architecture}'. Choose 'b0', 'b2', or 'convnext_tiny'.")
+                self._forward = self.model
 
-            # 3. 加载你亲手训练的权重
-            logger.info(f"Loading your trained model weights from: {model_path}")
-            # 使用 weights_only=True 是更安全和推荐的做法
-            self.model.load_state_dict(torch.load(model_path, map_location=self.device, weights_only=True))
-            
-            self.model.to(self.device)
-            self.model.eval() # 切换到评估模式
-            logger.success("DiseaseClassifier initialized successfully.")
+            # 模型版本 = 架构 + 后端 + 权重文件内容摘要，用于让诊断缓存等随模型更新自动失效
+            digest = self._file_digest(export_path or model_path)
+            self.model_version = f"{architecture}-{digest}" if backend == 'eager' else f"{architecture}-{backend}-{digest}"
+            logger.success(f"DiseaseClassifier initialized successfully (backend: {self.backend}).")
 
         except Exception as e:
             logger.error(f"Error loading the model: {e}", exc_info=True)
             raise RuntimeError(f"加载自研模型时出错: {e}")
 
+    @property
+    def model(self) -> nn.Module:
+        """
+        Eager 模式的 PyTorch 模型。Grad-CAM 需要在真实的 nn.Module 上挂钩子，
+        因此即使推理使用 TorchScript/ONNX 后端，也会在第一次访问时按需构建。
+        """
+        if self._model is None:
+            logger.info(f"Building a new '{self.architecture}' model structure...")
+            model = build_model(self.architecture, self.num_classes)
+
+            # 加载你亲手训练的权重
+            logger.info(f"Loading your trained model weights from: {self.model_path}")
+            # 使用 weights_only=True 是更安全和推荐的做法
+            model.load_state_dict(torch.load(self.model_path, map_location=self.device, weights_only=True))
+            
+            model.to(self.device)
+            model.eval() # 切换到评估模式
+            self._model = model
+        return self._model
+
     def predict(self, image_tensor: torch.Tensor) -> PredictionResult:
         """
         对输入的图像张量执行预测。
@@ -71,33 +163,55 @@ class DiseaseClassifier:
             image_tensor = image_tensor.to(self.device)
             
             # 模型推理
-            outputs = self.model(image_tensor)
+            outputs = self._forward(image_tensor)
             
             # 计算概率
             probabilities = torch.nn.functional.softmax(outputs, dim=1)[0]
             
             # 获取最高概率的预测结果
-            confidence_tensor, predicted_idx_tensor = torch.max(probabilities, 0)
-            
-            top_prediction = PredictionResult(
-                disease=self.labels.get(predicted_idx_tensor.item(), "Unknown Disease"),
-                confidence=confidence_tensor.item()
-            )
+            top_prediction = self.to_prediction(probabilities)
             
-            # 打印 Top-k 概率分布以供调试
-            k = min(self.num_classes, 5)
-            topk_prob, topk_indices = torch.topk(probabilities, k)
-            
-            logger.info(f"--- Probability Distribution (Top {k}) ---")
-            for i in range(topk_prob.size(0)):
-                idx = topk_indices[i].item()
-                label = self.labels.get(idx, f"Unknown_Class_{idx}")
-                prob = topk_prob[i].item()
-                logger.info(f"  - {label:<40}: {prob:.2%}")
-            logger.info("---------------------------------------")
+            # 打印 Top-k 概率分布以供调试 (LOG_PREDICTION_DETAILS)；默认关闭，避免每次预测都写多行日志
+            if settings.LOG_PREDICTION_DETAILS:
+                self._log_topk(probabilities)
             
             return top_prediction
 
+    def _log_topk(self, probabilities: torch.Tensor, k: int = 5):
+        k = min(self.num_classes, k)
+        topk_prob, topk_indices = torch.topk(probabilities, k)
+        lines = [f"--- Probability Distribution (Top {k}) ---"]
+        for prob, idx in zip(topk_prob.tolist(), topk_indices.tolist()):
+            label = self.labels.get(idx, f"Unknown_Class_{idx}")
+            lines.append(f"  - {label:<40}: {prob:.2%}")
+        logger.debug("\n".join(lines))
+
+    def predict_batch(self, image_batch: torch.Tensor) -> List[PredictionResult]:
+        """
+        对一个批次 (N, C, H, W) 的图像张量执行一次前向推理，按顺序返回每张图片的预测结果。
+        供 InferenceBatcher 合并并发请求时调用。
+        """
+        with torch.no_grad():
+            outputs = self._forward(image_batch.to(self.device))
+            probabilities = torch.nn.functional.softmax(outputs, dim=1)
+            return [self.to_prediction(row) for row in probabilities]
+
+    def to_prediction(self, probabilities: torch.Tensor) -> PredictionResult:
+        """将单张图片的概率向量转换为 PredictionResult。"""
+        confidence_tensor, predicted_idx_tensor = torch.max(probabilities, 0)
+        return PredictionResult(
+            disease=self.labels.get(predicted_idx_tensor.item(), "Unknown Disease"),
+            confidence=confidence_tensor.item()
+        )
+
+    @staticmethod
+    def _file_digest(path: Path) -> str:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+        return digest.hexdigest()[:12]
+
     def get_class_index(self, class_name: str) -> Optional[int]:
         """根据类别名称，高效地反向查找它对应的数字索引。"""
         return self.class_to_idx.get(class_name)
@@ -136,7 +250,9 @@ try:
         raise FileNotFoundError(f"Labels file not found at: {LABELS_PATH}")
 
     # 创建一个全局分类器实例，供 app/main.py 等模块导入
-    classifier = DiseaseClassifier(model_path=MODEL_PATH, labels_path=LABELS_PATH, architecture=MODEL_ARCH)
+    classifier = DiseaseClassifier(
+        model_path=MODEL_PATH, labels_path=LABELS_PATH, architecture=MODEL_ARCH, backend=settings.MODEL_BACKEND
+    )
 
 except Exception as e:
     logger.critical(f"Failed to initialize the global classifier: {e}")
@@ -0,0 +1,153 @@
+# app/models/inference_batcher.py
+import asyncio
+import time
+from collections import Counter, deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+import torch
+from loguru import logger
+
+from ..schemas.diagnosis import PredictionResult
+
+
+class InferenceBatcher:
+    """
+    异步微批处理调度器：把并发 /diagnose 请求的图像张量在一个很短的时间窗口内攒成一批，
+    只做一次批量前向推理，再把结果分发回各自等待的请求。
+
+    - max_batch_size: 一批最多合并多少张图片，攒满立即推理。
+    - max_wait_ms: 第一张图片入队后最多等待多少毫秒，超时即使未攒满也立即推理。
+    - executor: 执行批量前向推理的执行器。可以是 BoundedExecutor (带背压，饱和时整批请求收到
+      ExecutorSaturatedError)，也可以是普通的 concurrent.futures 执行器或 None (事件循环默认线程池)。
+    """
+
+    def __init__(
+        self,
+        predict_batch_fn: Callable[[torch.Tensor], List[PredictionResult]],
+        max_batch_size: int = 8,
+        max_wait_ms: float = 10.0,
+        executor: Optional[Any] = None,
+        wait_window: int = 1000,
+    ):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size 必须大于等于 1")
+        self.predict_batch_fn = predict_batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.executor = executor
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        # 已从队列取出、尚未分发结果的请求 (正在攒批或正在推理)；stop() 时需要让它们失败返回
+        self._current_batch: List[Tuple[torch.Tensor, asyncio.Future, float]] = []
+
+        # --- 监控指标 ---
+        self.batch_size_histogram: Counter = Counter()
+        self._wait_times_ms: Deque[float] = deque(maxlen=wait_window)
+        self.total_requests = 0
+        self.total_batches = 0
+
+    # --- 生命周期 ---
+    def start(self):
+        """在当前事件循环中启动后台批处理任务 (重复调用是安全的)。"""
+        if self._worker is not None and not self._worker.done():
+            return
+        self._queue = asyncio.Queue()
+        self._worker = asyncio.get_running_loop().create_task(self._run())
+        logger.info(f"InferenceBatcher started (max_batch_size={self.max_batch_size}, max_wait_ms={self.max_wait_ms}).")
+
+    async def stop(self):
+        """停止后台任务，并让正在攒批/推理以及仍在排队的请求失败返回，而不是永远挂起。"""
+        if self._worker is None:
+            return
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+        pending = [future for _, future, _ in self._current_batch]
+        self._current_batch = []
+        while self._queue is not None and not self._queue.empty():
+            pending.append(self._queue.get_nowait()[1])
+        for future in pending:
+            if not future.done():
+                future.set_exception(RuntimeError("InferenceBatcher has been stopped."))
+
+    # --- 对外接口 ---
+    async def submit(self, image_tensor: torch.Tensor) -> PredictionResult:
+        """提交一张 (1, C, H, W) 的图像张量，等待其所在批次推理完成后返回预测结果。"""
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((image_tensor, future, time.perf_counter()))
+        return await future
+
+    def stats(self) -> Dict[str, Any]:
+        """返回用于调优吞吐/延迟的运行指标。"""
+        waits = sorted(self._wait_times_ms)
+
+        def percentile(p: float) -> float:
+            if not waits:
+                return 0.0
+            return waits[min(len(waits) - 1, int(round(p * (len(waits) - 1))))]
+
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait_ms,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "total_requests": self.total_requests,
+            "total_batches": self.total_batches,
+            "avg_batch_size": (self.total_requests / self.total_batches) if self.total_batches else 0.0,
+            "batch_size_histogram": {str(size): count for size, count in sorted(self.batch_size_histogram.items())},
+            "wait_time_ms": {
+                "p50": percentile(0.50),
+                "p95": percentile(0.95),
+                "p99": percentile(0.99),
+                "max": waits[-1] if waits else 0.0,
+            },
+        }
+
+    # --- 内部实现 ---
+    async def _collect_batch(self) -> List[Tuple[torch.Tensor, asyncio.Future, float]]:
+        batch = self._current_batch = [await self._queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_wait_ms / 1000.0
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect_batch()
+            dispatched_at = time.perf_counter()
+            for _, _, enqueued_at in batch:
+                self._wait_times_ms.append((dispatched_at - enqueued_at) * 1000.0)
+            self.batch_size_histogram[len(batch)] += 1
+            self.total_batches += 1
+            self.total_requests += len(batch)
+
+            try:
+                image_batch = torch.cat([tensor for tensor, _, _ in batch], dim=0)
+                if hasattr(self.executor, "run"):
+                    results = await self.executor.run(self.predict_batch_fn, image_batch)
+                else:
+                    results = await loop.run_in_executor(self.executor, self.predict_batch_fn, image_batch)
+            except Exception as e:
+                logger.error(f"Batched inference failed for {len(batch)} request(s): {e}")
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                self._current_batch = []
+                continue
+
+            for (_, future, _), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+            self._current_batch = []
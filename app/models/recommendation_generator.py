@@ -1,23 +1,51 @@
 import torch
 import torch.nn as nn
-import requests
-from bs4 import BeautifulSoup
-from newspaper import Article
-from typing import Dict, List, Any
+from torch.nn.utils.rnn import pack_padded_sequence, pad_sequence
+from typing import Dict, List, Any, NamedTuple, Optional, Tuple
+from collections import OrderedDict
 from pathlib import Path
 import json
+import threading
 
 # 导入我们自己创建的模块
 from ..schemas.diagnosis import PredictionResult, RiskAssessment, FullDiagnosisReport
 from ..services.knowledge_base_service import kb_service
+from ..services.knowledge_index_service import kb_index, LANGUAGES
+from ..config import settings
+from ..services.web_reference_service import web_reference_service
 
-# 动态导入，如果失败则禁用网络搜索功能
-try:
-    from sentence_transformers import util
-except ImportError:
-    # 这个库现在只用于计算余弦相似度，我们可以自己实现一个简单的替代品
-    print("⚠️ 警告: 'sentence-transformers' 未安装。将使用内置函数计算相似度。")
-    util = None
+I18N = {
+    "report_title": {"en": "Crop Health Diagnosis Report", "ms": "Laporan Diagnosis Kesihatan Tanaman", "zh": "作物健康诊断报告"},
+    "diagnosis_summary_label": {"en": "Diagnosis:", "ms": "Diagnosis:", "zh": "诊断结果:"},
+    "confidence_label": {"en": "Model Confidence", "ms": "Keyakinan Model", "zh": "模型置信度"},
+    "env_risk_analysis_label": {"en": "Environmental Risk Analysis:", "ms": "Analisis Risiko Persekitaran:", "zh": "环境风险分析:"},
+    "risk_level_label": {"en": "Risk", "ms": "Risiko", "zh": "风险"},
+    "risk_score_label": {"en": "Score", "ms": "Skor", "zh": "评分"},
+    "core_suggestion_title": {"en": "Core Suggestions", "ms": "Cadangan Teras", "zh": "核心建议"},
+    "web_reference_title": {"en": "Web References", "ms": "Rujukan Web", "zh": "网络参考信息"},
+    "similar_conditions_title": {"en": "Similar Conditions (for comparison only, not treatment advice)",
+                                 "ms": "Keadaan Serupa (untuk perbandingan sahaja, bukan nasihat rawatan)",
+                                 "zh": "相似病害 (仅供对照，并非防治建议)"},
+    "unknown_condition_title": {"en": "Uncertain Diagnosis Report", "ms": "Laporan Diagnosis Tidak Pasti", "zh": "不确定诊断报告"},
+    "unknown_summary_prefix": {"en": "The model identified a condition with code", "ms": "Model telah mengenal pasti keadaan dengan kod", "zh": "模型识别出一个代号为"},
+    "unknown_summary_suffix": {"en": "but the confidence is below the threshold or the disease is not in the knowledge base. Please consult an expert.", "ms": "tetapi keyakinan berada di bawah ambang atau penyakit tiada dalam pangkalan pengetahuan. Sila rujuk pakar.", "zh": "但置信度低于阈值或知识库中无此病害。请咨询专家。"}
+}
+
+RISK_TEXT = {
+    "High": {"en": "The current conditions are highly favorable for disease.", "ms": "Keadaan semasa sangat sesuai untuk penyakit.", "zh": "当前环境极易诱发病害。"},
+    "Medium": {"en": "The environment may encourage disease development.", "ms": "Persekitaran mungkin menggalakkan perkembangan penyakit.", "zh": "当前环境可能诱发病害。"},
+    "Low": {"en": "Current environmental conditions are relatively stable.", "ms": "Keadaan persekitaran semasa agak stabil.", "zh": "当前环境条件相对有利。"}
+}
+
+
+class ReportTemplate(NamedTuple):
+    """某个 (病害, 语言, 风险等级) 报告中与单次请求无关的部分。"""
+    title: str
+    summary: str
+    summary_prefix: str  # 后接置信度百分比和 ")"
+    environmental_prefix: str  # 后接风险评分
+    environmental_suffix: str
+    management_suggestion: str  # 本地知识库建议 (网络/检索参考在生成时追加)
 
 
 # --- 关键：在这里重新定义一遍我们训练时用的模型结构！---
@@ -35,11 +63,29 @@ class SentenceEncoder(nn.Module):
         hidden = self.dropout(hidden)
         return hidden.squeeze(0)
 
+    def encode_batch(self, padded: torch.Tensor, lengths: torch.Tensor) -> torch.Tensor:
+        """
+        一次前向计算整批句子的向量。
+        :param padded: (batch, max_len)，用 <PAD> (索引 0) 右侧补齐。
+        :param lengths: 每个句子的真实长度；打包后 LSTM 不会读到补齐位，结果与逐句调用 forward 一致。
+        :return: (batch, hidden_dim)
+        """
+        embedded = self.embedding(padded)
+        packed = pack_padded_sequence(embedded, lengths.cpu(), batch_first=True, enforce_sorted=False)
+        _, (hidden, _) = self.lstm(packed)
+        return self.dropout(hidden[-1])
+
 
 class AdvancedNLGGenerator:
+    EMBEDDING_BATCH_SIZE = 256  # 每次前向计算的最大句子数，限制补齐后张量的内存占用
+    EMBEDDING_CACHE_MAX_ENTRIES = 4096
+
     def __init__(self):
         self.embedding_model = None
         self.word_to_idx: Dict[str, int] = {}
+        # 句子/病害名称 -> 向量 (CPU) 的 LRU 缓存，summarize_articles 在多个线程中调用，需加锁
+        self._embedding_cache: "OrderedDict[str, torch.Tensor]" = OrderedDict()
+        self._embedding_cache_lock = threading.Lock()
         self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
         
         print(">>> 正在加载自研NLG核心...")
@@ -74,90 +120,148 @@ class AdvancedNLGGenerator:
             print(f"❌ 加载自研NLG核心失败: {e}. 网络搜索增强功能将被禁用。")
             self.embedding_model = None
 
+        # 模板字典只整体替换 (写时复制)，读取无需加锁；_templates_lock 只串行化替换操作
+        self._templates: Dict[Tuple[str, str, str], ReportTemplate] = {}
+        self._templates_lock = threading.Lock()
+        self.compile_templates()
+
     def _sentence_to_tensor(self, sentence: str) -> torch.Tensor:
         indices = [self.word_to_idx.get(word, self.word_to_idx.get("<UNK>", 1)) for word in sentence.lower().split()]
         return torch.tensor(indices, dtype=torch.long, device=self.device)
 
     def _get_embedding(self, text: str) -> torch.Tensor:
-        tensor = self._sentence_to_tensor(text)
-        with torch.no_grad():
-            return self.embedding_model(tensor)
+        return self._get_embeddings([text])
+
+    def _get_embeddings(self, texts: List[str]) -> torch.Tensor:
+        """
+        批量计算句子向量，返回 (len(texts), hidden_dim)。
+        已缓存的句子直接复用，其余按 EMBEDDING_BATCH_SIZE 分块补齐后一次前向计算。
+        """
+        vectors: Dict[str, torch.Tensor] = {}
+        with self._embedding_cache_lock:
+            for text in texts:
+                cached = self._embedding_cache.get(text)
+                if cached is not None:
+                    self._embedding_cache.move_to_end(text)
+                    vectors[text] = cached
 
-    def _cosine_similarity(self, vec1: torch.Tensor, vec2: torch.Tensor) -> float:
-        if util:
-            return util.cos_sim(vec1, vec2)[0].item()
-        else: # 如果 sentence-transformers 没装，用PyTorch内置函数
-            return nn.functional.cosine_similarity(vec1, vec2, dim=-1).item()
+        missing = list(dict.fromkeys(text for text in texts if text not in vectors))
+        for start in range(0, len(missing), self.EMBEDDING_BATCH_SIZE):
+            chunk = missing[start:start + self.EMBEDDING_BATCH_SIZE]
+            sequences = [self._sentence_to_tensor(text) for text in chunk]
+            # 空句子用一个 <PAD> 占位，打包序列要求长度至少为 1
+            sequences = [seq if len(seq) else torch.zeros(1, dtype=torch.long, device=self.device) for seq in sequences]
+            lengths = torch.tensor([len(seq) for seq in sequences])
+            padded = pad_sequence(sequences, batch_first=True, padding_value=0)
+            with torch.no_grad():
+                encoded = self.embedding_model.encode_batch(padded, lengths).cpu()
+            with self._embedding_cache_lock:
+                for text, vector in zip(chunk, encoded):
+                    vectors[text] = vector
+                    self._embedding_cache[text] = vector
+                while len(self._embedding_cache) > self.EMBEDDING_CACHE_MAX_ENTRIES:
+                    self._embedding_cache.popitem(last=False)
 
-    def web_search_and_summarize(self, disease_name: str, lang: str) -> List[str]:
+        return torch.stack([vectors[text] for text in texts])
+
+    @staticmethod
+    def _rank_by_similarity(query: torch.Tensor, candidates: torch.Tensor) -> torch.Tensor:
+        """候选向量与查询向量的余弦相似度：归一化后一次矩阵-向量乘积。"""
+        query = nn.functional.normalize(query.reshape(-1), dim=0)
+        return nn.functional.normalize(candidates, dim=1) @ query
+
+    def retrieve_similar_conditions(self, query: str, lang: str, exclude_disease: Optional[str] = None) -> List[str]:
+        """
+        从预计算的知识库向量索引中检索症状描述与 query 最接近的病害 (本地计算，无网络访问)。
+        只检索 summary 段落：其他病害的防治措施不能混入当前诊断的建议中。
+        """
+        if self.embedding_model is None or not kb_index.available:
+            return []
+        query_vector = self._get_embeddings([query])[0].numpy()
+        hits = kb_index.search(query_vector, lang, k=settings.KB_INDEX_TOP_K, field="summary",
+                               exclude_disease=exclude_disease, min_score=settings.KB_INDEX_MIN_SCORE)
+        return [f"{self._disease_name(hit['disease'], lang)}: {hit['text']}" for hit in hits]
+
+    def _similar_conditions_section(self, query: str, lang: str, exclude_disease: Optional[str] = None) -> str:
+        similar = self.retrieve_similar_conditions(query, lang, exclude_disease=exclude_disease)
+        if not similar:
+            return ""
+        return (f"\n\n【{self._get_i18n('similar_conditions_title', lang)} (本地知识索引)】:\n"
+                + "".join(f"- {condition}\n" for condition in similar))
+
+    @staticmethod
+    def _disease_name(disease_key: str, lang: str) -> str:
+        name_map = (kb_service.get_disease_info(disease_key) or {}).get("name", {})
+        return name_map.get(lang, name_map.get("en", disease_key.replace("_", " ")))
+
+    def wants_web_references(self, prediction: PredictionResult, confidence_threshold: float = 0.75) -> bool:
+        """只有高置信度、且知识库中有该病害时，报告才会附带网络参考信息。"""
+        return (self.embedding_model is not None and prediction.confidence >= confidence_threshold
+                and kb_service.get_disease_info(prediction.disease) is not None)
+
+    async def web_search_and_summarize(self, disease_name: str, lang: str, wait: Optional[float] = None) -> Optional[List[str]]:
+        """
+        异步获取网络参考摘要 (磁盘缓存 + 并发抓取，见 web_reference_service)。
+        :param wait: 最多等待的秒数，超时返回 None (抓取在后台继续，完成后写入缓存)。
+        """
         if not self.embedding_model: return []
 
         print(f"🔎 正在为 '{disease_name}' 进行网络搜索增强...")
+        return await web_reference_service.get_summaries(disease_name, lang, self.summarize_articles, wait=wait)
+
+    def summarize_articles(self, disease_name: str, articles: List[str]) -> List[str]:
+        """从每篇文章中挑出与病害名称语义最接近的一句话 (CPU 计算，在线程池中调用)。"""
         summaries = []
-        try:
-            query = f"{disease_name.replace('_', ' ')} pepper plant treatment {lang}"
-            search_url = f"https://html.duckduckgo.com/html/?q={requests.utils.quote(query)}"
-            headers = {'User-Agent': 'Mozilla/5.0'}
-            
-            response = requests.get(search_url, headers=headers, timeout=10)
-            response.raise_for_status()
-            soup = BeautifulSoup(response.text, 'lxml')
-            
-            links = [a['href'] for a in soup.find_all('a', class_='result__a', limit=3)]
-            disease_embedding = self._get_embedding(disease_name.replace("_", " "))
-
-            for i, link in enumerate(links):
-                try:
-                    article = Article(link, language=lang)
-                    article.download(); article.parse()
-                    
-                    sentences = [s.strip() for s in article.text.split('.') if len(s.strip()) > 50]
-                    if not sentences: continue
-
-                    best_sentence, max_similarity = "", -1
-                    for sentence in sentences:
-                        sentence_embedding = self._get_embedding(sentence)
-                        similarity = self._cosine_similarity(disease_embedding, sentence_embedding)
-                        if similarity > max_similarity:
-                            max_similarity = similarity
-                            best_sentence = sentence
-                    
-                    if best_sentence:
-                        summaries.append(f"参考资料 #{i+1}: {best_sentence}.")
-                        print(f"   - 提取到相关信息 (相似度: {max_similarity:.2f}): {best_sentence[:60]}...")
-                except Exception: continue
-        except Exception as e:
-            print(f"   - ❌ 网络搜索失败: {e}")
-        return summaries
+        article_sentences = [[s.strip() for s in text.split('.') if len(s.strip()) > 50] for text in articles]
+        all_sentences = [sentence for sentences in article_sentences for sentence in sentences]
+        if not all_sentences: return summaries
 
-    def generate(self, prediction: PredictionResult, risk: RiskAssessment, lang: str = 'en', confidence_threshold: float = 0.75) -> FullDiagnosisReport:
-        if prediction.confidence < confidence_threshold:
-            return self._generate_default_report(prediction, risk, lang)
+        # 所有文章的句子和病害名称一起编码，再一次性算出全部相似度
+        disease_text = disease_name.replace("_", " ")
+        embeddings = self._get_embeddings([disease_text] + all_sentences)
+        similarities = self._rank_by_similarity(embeddings[0], embeddings[1:])
 
-        disease_key = prediction.disease
-        base_info = kb_service.get_disease_info(disease_key)
-        
-        if not base_info:
-            return self._generate_default_report(prediction, risk, lang)
+        offset = 0
+        for i, sentences in enumerate(article_sentences):
+            if not sentences: continue
+            scores = similarities[offset:offset + len(sentences)]
+            offset += len(sentences)
+
+            best_index = int(torch.argmax(scores))
+            best_sentence, max_similarity = sentences[best_index], scores[best_index].item()
+            summaries.append(f"参考资料 #{i+1}: {best_sentence}.")
+            print(f"   - 提取到相关信息 (相似度: {max_similarity:.2f}): {best_sentence[:60]}...")
+        return summaries
+
+    def compile_templates(self):
+        """
+        预先渲染每个 (病害, 语言, 风险等级) 报告中的静态部分 (标题、摘要、环境说明、本地知识库建议)。
+        启动时执行一次；全局实例在知识库重新加载时由 kb_service 回调触发。整个字典一次性替换，并发读取时不会看到半成品。
+        """
+        templates = {}
+        for disease_key, base_info in kb_service.knowledge_base.items():
+            if not base_info:
+                continue
+            for lang in LANGUAGES:
+                for risk_level in RISK_TEXT:
+                    templates[(disease_key, lang, risk_level)] = self._compile_template(disease_key, base_info, lang, risk_level)
+        with self._templates_lock:
+            self._templates = templates
 
+    def _compile_template(self, disease_key: str, base_info: Dict[str, Any], lang: str, risk_level: str) -> ReportTemplate:
         name_map = base_info.get("name", {})
         name_local = name_map.get(lang, name_map.get("en", disease_key))
-        
         title = f"{self._get_i18n('report_title', lang)} ({name_local})"
-        
+
         summary_map = base_info.get("summary", {})
         summary = summary_map.get(lang, summary_map.get("en", "No detailed description."))
-        diagnosis_summary = f"{self._get_i18n('diagnosis_summary_label', lang)} {summary} ({self._get_i18n('confidence_label', lang)}: {prediction.confidence:.2%})"
-        
-        risk_text_map = {
-            "High": {"en": "The current conditions are highly favorable for disease.", "ms": "Keadaan semasa sangat sesuai untuk penyakit.", "zh": "当前环境极易诱发病害。"},
-            "Medium": {"en": "The environment may encourage disease development.", "ms": "Persekitaran mungkin menggalakkan perkembangan penyakit.", "zh": "当前环境可能诱发病害。"},
-            "Low": {"en": "Current environmental conditions are relatively stable.", "ms": "Keadaan persekitaran semasa agak stabil.", "zh": "当前环境条件相对有利。"}
-        }
-        risk_text = risk_text_map.get(risk.risk_level, {}).get(lang, "")
-        environmental_context = (f"{self._get_i18n('env_risk_analysis_label', lang)} {self._get_i18n('risk_level_label', lang)} {risk.risk_level} "
-                                 f"({self._get_i18n('risk_score_label', lang)}: {risk.risk_score:.1f}/10). {risk_text}")
-        
+        summary_prefix = f"{self._get_i18n('diagnosis_summary_label', lang)} {summary} ({self._get_i18n('confidence_label', lang)}: "
+
+        risk_text = RISK_TEXT.get(risk_level, {}).get(lang, "")
+        environmental_prefix = (f"{self._get_i18n('env_risk_analysis_label', lang)} {self._get_i18n('risk_level_label', lang)} {risk_level} "
+                                f"({self._get_i18n('risk_score_label', lang)}: ")
+        environmental_suffix = f"/10). {risk_text}"
+
         management_suggestion = ""
         treatments = base_info.get("treatments", [])
         if treatments:
@@ -172,18 +276,53 @@ class AdvancedNLGGenerator:
                         step_map = step if isinstance(step, dict) else {"en": str(step)}
                         step_text = step_map.get(lang, step_map.get("en", ""))
                         management_suggestion += f"{i+1}. {step_text}\n"
+
+        return ReportTemplate(title, summary, summary_prefix, environmental_prefix, environmental_suffix, management_suggestion)
+
+    def _get_template(self, disease_key: str, lang: str, risk_level: str) -> Optional[ReportTemplate]:
+        template = self._templates.get((disease_key, lang, risk_level))
+        if template is None:
+            # 不在预编译范围内的组合 (例如其他语言代码)：现场渲染，复制一份新字典记住它 (报告在多个工作线程中生成)
+            with self._templates_lock:
+                base_info = kb_service.get_disease_info(disease_key)
+                if not base_info:
+                    return None
+                template = self._compile_template(disease_key, base_info, lang, risk_level)
+                self._templates = {**self._templates, (disease_key, lang, risk_level): template}
+        return template
+
+    def generate(self, prediction: PredictionResult, risk: RiskAssessment, lang: str = 'en', confidence_threshold: float = 0.75,
+                 web_summaries: Optional[List[str]] = None) -> FullDiagnosisReport:
+        """
+        生成诊断报告 (纯本地计算，不访问网络)。静态文本来自预编译模板，这里只填入置信度、风险评分和参考信息。
+        :param web_summaries: 调用方预先通过 web_search_and_summarize 获取的网络参考摘要。
+        """
+        if prediction.confidence < confidence_threshold:
+            return self._generate_default_report(prediction, risk, lang)
+
+        disease_key = prediction.disease
+        template = self._get_template(disease_key, lang, risk.risk_level)
         
-        web_summaries = self.web_search_and_summarize(disease_key, lang)
+        if template is None:
+            return self._generate_default_report(prediction, risk, lang)
+
+        diagnosis_summary = f"{template.summary_prefix}{prediction.confidence:.2%})"
+        environmental_context = f"{template.environmental_prefix}{risk.risk_score:.1f}{template.environmental_suffix}"
+        
+        management_suggestion = template.management_suggestion
         if web_summaries:
             management_suggestion += f"\n\n【{self._get_i18n('web_reference_title', lang)} (实时网络参考)】:\n"
             for web_sum in web_summaries:
                 management_suggestion += f"- {web_sum}\n"
+        else:
+            # 没有网络参考时，列出症状相近、需要对照排除的其他病害 (单独标注，不混入防治建议)
+            management_suggestion += self._similar_conditions_section(template.summary, lang, exclude_disease=disease_key)
         
         if not management_suggestion:
             management_suggestion = self._get_default_suggestion(lang)
 
         return FullDiagnosisReport(
-            title=title,
+            title=template.title,
             diagnosis_summary=diagnosis_summary,
             environmental_context=environmental_context,
             management_suggestion=management_suggestion.strip(),
@@ -191,20 +330,7 @@ class AdvancedNLGGenerator:
         )
 
     def _get_i18n(self, key: str, lang: str) -> str:
-        i18n_dict = {
-            "report_title": {"en": "Crop Health Diagnosis Report", "ms": "Laporan Diagnosis Kesihatan Tanaman", "zh": "作物健康诊断报告"},
-            "diagnosis_summary_label": {"en": "Diagnosis:", "ms": "Diagnosis:", "zh": "诊断结果:"},
-            "confidence_label": {"en": "Model Confidence", "ms": "Keyakinan Model", "zh": "模型置信度"},
-            "env_risk_analysis_label": {"en": "Environmental Risk Analysis:", "ms": "Analisis Risiko Persekitaran:", "zh": "环境风险分析:"},
-            "risk_level_label": {"en": "Risk", "ms": "Risiko", "zh": "风险"},
-            "risk_score_label": {"en": "Score", "ms": "Skor", "zh": "评分"},
-            "core_suggestion_title": {"en": "Core Suggestions", "ms": "Cadangan Teras", "zh": "核心建议"},
-            "web_reference_title": {"en": "Web References", "ms": "Rujukan Web", "zh": "网络参考信息"},
-            "unknown_condition_title": {"en": "Uncertain Diagnosis Report", "ms": "Laporan Diagnosis Tidak Pasti", "zh": "不确定诊断报告"},
-            "unknown_summary_prefix": {"en": "The model identified a condition with code", "ms": "Model telah mengenal pasti keadaan dengan kod", "zh": "模型识别出一个代号为"},
-            "unknown_summary_suffix": {"en": "but the confidence is below the threshold or the disease is not in the knowledge base. Please consult an expert.", "ms": "tetapi keyakinan berada di bawah ambang atau penyakit tiada dalam pangkalan pengetahuan. Sila rujuk pakar.", "zh": "但置信度低于阈值或知识库中无此病害。请咨询专家。"}
-        }
-        return i18n_dict.get(key, {}).get(lang, i18n_dict.get(key, {}).get("en", f"[{key}]"))
+        return I18N.get(key, {}).get(lang, I18N.get(key, {}).get("en", f"[{key}]"))
 
     def _get_default_suggestion(self, lang: str) -> str:
         suggestions = {
@@ -223,14 +349,24 @@ class AdvancedNLGGenerator:
         
         environmental_context = (f"{self._get_i18n('env_risk_analysis_label', lang)} {self._get_i18n('risk_level_label', lang)} {risk.risk_level} "
                                  f"({self._get_i18n('risk_score_label', lang)}: {risk.risk_score:.1f}/10).")
-        
+
+        management_suggestion = self._get_default_suggestion(lang)
+        # 置信度不足时，列出症状与模型判断最接近的候选病害供专家对照 (不给出防治措施)
+        base_info = kb_service.get_disease_info(prediction.disease) or {}
+        summary_map = base_info.get("summary", {})
+        management_suggestion += self._similar_conditions_section(
+            summary_map.get(lang, prediction.disease.replace("_", " ")), lang
+        )
+
         return FullDiagnosisReport(
             title=title,
             diagnosis_summary=diagnosis_summary,
             environmental_context=environmental_context,
-            management_suggestion=self._get_default_suggestion(lang),
+            management_suggestion=management_suggestion.strip(),
             xai_image_url=None
         )
 
 # 创建一个全局实例
-report_generator_v3 = AdvancedNLGGenerator()
\ No newline at end of file
+report_generator_v3 = AdvancedNLGGenerator()
+# 只有全局实例跟随知识库热重载 (其他实例，例如测试中创建的，不会被 kb_service 永久引用)
+kb_service.add_reload_listener(report_generator_v3.compile_templates)
\ No newline at end of file
@@ -1,10 +1,28 @@
+import threading
+import warnings
+from typing import List, Optional, Sequence
+
 import numpy as np
 import skfuzzy as fuzz
 from skfuzzy import control as ctrl
+from ..config import settings
 from ..schemas.diagnosis import RiskAssessment
 
+# 输入变量的论域 (超出范围的输入会被截断到边界，与 skfuzzy 的 clip_to_bounds 行为一致)
+TEMPERATURE_RANGE = (15.0, 40.0)
+HUMIDITY_RANGE = (40.0, 100.0)
+
 class FuzzyRiskAssessor:
-    def __init__(self):
+    def __init__(self, compiled: bool = True, grid_step: float = 0.25):
+        """
+        :param compiled: True 时预先把整个 (温度, 湿度) 风险曲面计算成 NumPy 网格，
+            之后每次评估只做一次双线性插值，不再运行 skfuzzy 的规则推理与重心法解模糊。
+            False 时每次都调用 skfuzzy (精确结果，但较慢且需要加锁串行执行)。
+        :param grid_step: 网格分辨率 (°C / %RH)。0.25 时与 skfuzzy 的最大偏差约 0.11 (满分 10)。
+        """
+        self.compiled = compiled
+        self.grid_step = grid_step
+
         # 定义输入变量
         temperature = ctrl.Antecedent(np.arange(15, 41, 1), 'temperature')
         humidity = ctrl.Antecedent(np.arange(40, 101, 1), 'humidity')
@@ -35,22 +53,94 @@ class FuzzyRiskAssessor:
             ctrl.Rule(temperature['cool'], disease_risk['low'])
         ]
         
-        risk_ctrl_system = ctrl.ControlSystem(self.rules)
-        self.risk_simulator = ctrl.ControlSystemSimulation(risk_ctrl_system)
+        self.control_system = ctrl.ControlSystem(self.rules)
+        # ControlSystemSimulation 带有可变的输入/输出状态，不能被多个线程同时使用
+        self.risk_simulator = ctrl.ControlSystemSimulation(self.control_system)
+        self._simulator_lock = threading.Lock()
+
+        self._grid: Optional[np.ndarray] = None
+        self._grid_lock = threading.Lock()
+
+    def compute_exact(self, temp_value: float, humidity_value: float) -> float:
+        """用 skfuzzy 精确计算风险分数 (线程安全)。"""
+        with self._simulator_lock:
+            self.risk_simulator.input['temperature'] = temp_value
+            self.risk_simulator.input['humidity'] = humidity_value
+            self.risk_simulator.compute()
+            return float(self.risk_simulator.output['disease_risk'])
+
+    def compile(self) -> np.ndarray:
+        """构建 (只构建一次) 风险曲面网格，形状为 (温度点数, 湿度点数)。构建完成后网格只读，可被任意线程共享。"""
+        if self._grid is None:
+            with self._grid_lock:
+                if self._grid is None:
+                    self._grid = self._build_grid()
+        return self._grid
+
+    def _build_grid(self) -> np.ndarray:
+        temps = self._axis(*TEMPERATURE_RANGE)
+        hums = self._axis(*HUMIDITY_RANGE)
+        temp_mesh, hum_mesh = np.meshgrid(temps, hums, indexing='ij')
+        # 使用独立的 simulation 一次性对整个网格做向量化推理，不干扰 risk_simulator 的标量状态
+        simulator = ctrl.ControlSystemSimulation(self.control_system, cache=False)
+        simulator.input['temperature'] = temp_mesh.ravel()
+        simulator.input['humidity'] = hum_mesh.ravel()
+        with warnings.catch_warnings():
+            # skfuzzy 内部对每个网格点都会触发 numpy 的 DeprecationWarning，量大时明显拖慢构建
+            warnings.simplefilter("ignore", DeprecationWarning)
+            simulator.compute()
+        grid = np.asarray(simulator.output['disease_risk'], dtype=np.float64).reshape(temp_mesh.shape)
+        grid.setflags(write=False)
+        return grid
+
+    def _axis(self, low: float, high: float) -> np.ndarray:
+        points = int(round((high - low) / self.grid_step)) + 1
+        return np.linspace(low, high, points)
+
+    def score_many(self, temps: Sequence[float], hums: Sequence[float]) -> np.ndarray:
+        """向量化评估：对任意形状 (可广播) 的温度/湿度数组返回同形状的风险分数。"""
+        temps = np.asarray(temps, dtype=np.float64)
+        hums = np.asarray(hums, dtype=np.float64)
+        if not self.compiled:
+            temps, hums = np.broadcast_arrays(temps, hums)
+            return np.vectorize(self.compute_exact, otypes=[np.float64])(temps, hums)
+
+        grid = self.compile()
+        ti, tw = self._cell(temps, TEMPERATURE_RANGE, grid.shape[0])
+        hi, hw = self._cell(hums, HUMIDITY_RANGE, grid.shape[1])
+        # 双线性插值
+        return ((1 - tw) * (1 - hw) * grid[ti, hi] + tw * (1 - hw) * grid[ti + 1, hi]
+                + (1 - tw) * hw * grid[ti, hi + 1] + tw * hw * grid[ti + 1, hi + 1])
+
+    @staticmethod
+    def _cell(values: np.ndarray, bounds, points: int):
+        low, high = bounds
+        position = (np.clip(values, low, high) - low) / (high - low) * (points - 1)
+        index = np.minimum(np.floor(position).astype(np.intp), points - 2)
+        return index, position - index
 
     def assess(self, temp_value: float, humidity_value: float) -> RiskAssessment:
-        self.risk_simulator.input['temperature'] = temp_value
-        self.risk_simulator.input['humidity'] = humidity_value
-        self.risk_simulator.compute()
-        
-        score = self.risk_simulator.output['disease_risk']
+        if self.compiled:
+            score = float(self.score_many(temp_value, humidity_value))
+        else:
+            score = self.compute_exact(temp_value, humidity_value)
+        return RiskAssessment(risk_score=score, risk_level=self.risk_level(score))
+
+    def assess_many(self, temps: Sequence[float], hums: Sequence[float]) -> List[RiskAssessment]:
+        scores = np.atleast_1d(self.score_many(temps, hums)).ravel()
+        return [RiskAssessment(risk_score=float(s), risk_level=self.risk_level(s)) for s in scores]
+
+    @staticmethod
+    def risk_level(score: float) -> str:
         level = "Low"
         if score > 7.0:
             level = "High"
         elif score > 4.0:
             level = "Medium"
-            
-        return RiskAssessment(risk_score=score, risk_level=level)
+        return level
 
 # 创建一个全局实例
-risk_assessor = FuzzyRiskAssessor()
\ No newline at end of file
+risk_assessor = FuzzyRiskAssessor(
+    compiled=settings.RISK_ASSESSOR_MODE.lower() == "compiled",
+    grid_step=settings.RISK_GRID_STEP,
+)
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime
 
 class PredictionResult(BaseModel):
@@ -17,6 +17,22 @@ class FullDiagnosisReport(BaseModel):
     management_suggestion: str = Field(..., description="管理和防治建议")
     # --- ↓↓↓ 新增字段 ↓↓↓ ---
     xai_image_url: Optional[str] = Field(None, description="指向XAI解释图的URL")
+    xai_status: Optional[str] = Field(None, description="XAI解释图状态 (ready, pending, failed)")
+    xai_job_id: Optional[str] = Field(None, description="延迟生成XAI解释图时的任务ID")
+    weather_source: Optional[str] = Field(None, description="风险评估所用天气数据的来源 (live, cached, default)")
+    references_status: Optional[str] = Field(None, description="网络参考信息状态 (ready, pending, unavailable)")
+
+class XaiJobStatus(BaseModel):
+    job_id: str
+    status: str = Field(..., description="任务状态 (pending, ready, failed)")
+    xai_image_url: Optional[str] = None
+    error: Optional[str] = None
+
+class WebReferences(BaseModel):
+    disease: str
+    language: str
+    status: str = Field(..., description="ready, pending 或 unavailable")
+    references: List[str] = []
 
 class DiagnosisHistory(BaseModel):
     id: int
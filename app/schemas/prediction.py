@@ -1,6 +1,6 @@
 # app/schemas/prediction.py
 from pydantic import BaseModel, Field
-from typing import List, Dict
+from typing import List, Dict, Optional
 
 class DailyRisk(BaseModel):
     date: str
@@ -11,4 +11,23 @@ class DailyRisk(BaseModel):
 class RiskPredictionResponse(BaseModel):
     disease_name: str
     location: Dict[str, float]
-    daily_risks: List[DailyRisk]
\ No newline at end of file
+    daily_risks: List[DailyRisk]
+
+class RiskLocation(BaseModel):
+    latitude: float = Field(..., ge=-90, le=90)
+    longitude: float = Field(..., ge=-180, le=180)
+
+class BatchRiskPredictionRequest(BaseModel):
+    locations: List[RiskLocation] = Field(..., min_length=1)
+    disease_keys: Optional[List[str]] = Field(None, description="默认评估所有已知病害")
+
+class LocationRiskForecast(BaseModel):
+    location: Dict[str, float]
+    dates: List[str]
+    risk_scores: Dict[str, List[int]] = Field(..., description="病害 key -> 逐日风险分数")
+    risk_levels: Dict[str, List[str]] = Field(..., description="病害 key -> 逐日风险等级")
+    error: Optional[str] = None
+
+class BatchRiskPredictionResponse(BaseModel):
+    diseases: Dict[str, str] = Field(..., description="病害 key -> 显示名称")
+    results: List[LocationRiskForecast]
@@ -0,0 +1,206 @@
+# app/services/diagnosis_cache_service.py
+import io
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+import imagehash
+from PIL import Image
+from loguru import logger
+from pydantic import BaseModel
+
+from ..config import settings
+from ..schemas.diagnosis import FullDiagnosisReport, PredictionResult, RiskAssessment
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+
+class CachedDiagnosis(BaseModel):
+    """缓存的一次完整诊断结果。"""
+    prediction: PredictionResult
+    risk: RiskAssessment
+    report: FullDiagnosisReport
+    xai_image_url: Optional[str] = None
+    # 热力图叠加在上传者自己的照片上：只有同一用户命中时才能返回 xai_image_url
+    owner_id: Optional[int] = None
+
+
+class InMemoryCacheBackend:
+    """进程内 LRU + TTL 缓存 (线程安全)。"""
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: int = 86400):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class RedisCacheBackend:
+    """基于 docker-compose 中 Redis 服务的共享缓存，多个 worker 进程之间共享命中。"""
+
+    def __init__(self, url: str, ttl_seconds: int = 86400):
+        if redis is None:
+            raise RuntimeError("'redis' 未安装，无法使用 Redis 诊断缓存。")
+        self.ttl_seconds = ttl_seconds
+        self._client = redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+        # from_url 不会建立连接：启动时 ping 一次，Redis 不可达时由 _build_backend 退回进程内缓存
+        self._client.ping()
+
+    def get(self, key: str) -> Optional[str]:
+        value = self._client.get(key)
+        return value.decode("utf-8") if value is not None else None
+
+    def set(self, key: str, value: str):
+        self._client.setex(key, self.ttl_seconds, value)
+
+
+class DiagnosisCache:
+    """
+    以感知哈希 (pHash) 为键的诊断结果缓存。
+    农户经常重复上传同一张或几乎相同的叶片照片，命中缓存时可以完全跳过模型推理、Grad-CAM 和报告生成。
+    键 = 模型版本 + 语言 + 图像 pHash，模型更新后旧条目自然失效。
+    后端连续失败 max_failures 次后在 cooldown_seconds 内直接跳过 (例如 Redis 运行中宕机)，
+    避免每个请求都等待两次套接字超时。
+    """
+
+    def __init__(self, backend: Optional[Any], max_failures: int = 3, cooldown_seconds: float = 30.0):
+        self.backend = backend
+        self.max_failures = max_failures
+        self.cooldown_seconds = cooldown_seconds
+        self._consecutive_failures = 0
+        self._bypass_until = 0.0
+        # get/put 既在事件循环中也在 io_executor 线程中调用：计数器和熔断状态的更新都要持锁
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.errors = 0
+        self.bypassed = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.backend is not None
+
+    def compute_key(self, image_bytes: bytes, model_version: str, lang: str) -> Optional[str]:
+        """计算缓存键；图片无法解码时返回 None (交由正常流程报错)。"""
+        if not self.enabled:
+            return None
+        try:
+            with Image.open(io.BytesIO(image_bytes)) as image:
+                image.draft("RGB", (256, 256))
+                phash = imagehash.phash(image.convert("RGB"))
+        except Exception as e:
+            logger.warning(f"Unable to compute perceptual hash for diagnosis cache: {e}")
+            return None
+        return f"diagnosis:{model_version}:{lang}:{phash}"
+
+    def _count(self, counter: str):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _usable(self) -> bool:
+        if self._bypass_until > time.monotonic():
+            self._count("bypassed")
+            return False
+        return True
+
+    def _record_success(self):
+        with self._lock:
+            self._consecutive_failures = 0
+
+    def _record_failure(self, action: str, error: Exception):
+        logger.warning(f"Diagnosis cache {action} failed: {error}")
+        with self._lock:
+            self.errors += 1
+            self._consecutive_failures += 1
+            tripped = self._consecutive_failures >= self.max_failures
+            if tripped:
+                self._consecutive_failures = 0
+                self._bypass_until = time.monotonic() + self.cooldown_seconds
+        if tripped:
+            logger.warning(f"Diagnosis cache backend failed {self.max_failures} times in a row, "
+                           f"bypassing it for {self.cooldown_seconds:.0f}s.")
+
+    def get(self, key: Optional[str]) -> Optional[CachedDiagnosis]:
+        if not self.enabled or key is None or not self._usable():
+            return None
+        try:
+            raw = self.backend.get(key)
+        except Exception as e:
+            self._record_failure("read", e)
+            return None
+        self._record_success()
+        if raw is None:
+            self._count("misses")
+            return None
+        self._count("hits")
+        return CachedDiagnosis(**json.loads(raw))
+
+    def put(self, key: Optional[str], entry: CachedDiagnosis):
+        if not self.enabled or key is None or not self._usable():
+            return
+        try:
+            self.backend.set(key, entry.model_dump_json())
+            self._count("stores")
+            self._record_success()
+        except Exception as e:
+            self._record_failure("write", e)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            hits, misses, stores, errors, bypassed = self.hits, self.misses, self.stores, self.errors, self.bypassed
+        lookups = hits + misses
+        return {
+            "backend": self.backend.__class__.__name__ if self.backend else None,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": (hits / lookups) if lookups else 0.0,
+            "stores": stores,
+            "errors": errors,
+            "bypassed": bypassed,
+        }
+
+
+def _build_backend():
+    backend = settings.DIAGNOSIS_CACHE_BACKEND.lower()
+    if backend == "off":
+        return None
+    if backend == "redis":
+        try:
+            return RedisCacheBackend(settings.REDIS_URL, ttl_seconds=settings.DIAGNOSIS_CACHE_TTL_SECONDS)
+        except Exception as e:
+            logger.warning(f"Redis diagnosis cache unavailable ({e}), falling back to in-process cache.")
+    return InMemoryCacheBackend(
+        max_entries=settings.DIAGNOSIS_CACHE_MAX_ENTRIES,
+        ttl_seconds=settings.DIAGNOSIS_CACHE_TTL_SECONDS,
+    )
+
+# 创建全局实例
+diagnosis_cache = DiagnosisCache(backend=_build_backend())
@@ -1,19 +1,26 @@
 # app/services/disease_predictor_service.py
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Sequence, Tuple
+
+import numpy as np
+
+# 风险张量引擎使用的天气变量 (forecast 数组最后一维的顺序)
+FORECAST_VARIABLES = ("temp_max", "temp_min", "humidity_mean", "precipitation")
 
 class DiseasePredictorService:
     def __init__(self):
         # 定义病害爆发的“专家规则”
         # 这是一个可扩展的知识库
+        # 注意：conditions 只能使用 & | ~ 和比较运算 (不要用 and/or 或链式比较)，
+        # 这样同一条规则既能作用于单日的 dict，也能作用于 predict_risk_tensor 中的整列 NumPy 数组。
         self.disease_rules = {
             "Phytophthora_blight": {
                 "name": "疫霉病 (Phytophthora Blight)",
-                "conditions": lambda day: day["temp_max"] > 25 and day["humidity_mean"] > 85 and day["precipitation"] > 5,
+                "conditions": lambda day: (day["temp_max"] > 25) & (day["humidity_mean"] > 85) & (day["precipitation"] > 5),
                 "message": "炎热、高湿且有显著降雨，是疫霉病爆发的极高风险条件。"
             },
             "Pepper__Anthracnose": {
                 "name": "炭疽病 (Anthracnose)",
-                "conditions": lambda day: 24 < day["temp_max"] < 32 and day["humidity_mean"] > 90,
+                "conditions": lambda day: (day["temp_max"] > 24) & (day["temp_max"] < 32) & (day["humidity_mean"] > 90),
                 "message": "温暖、极高湿度的天气有利于炭疽病的孢子传播和侵染。"
             },
             # 可以为其他病害添加更多规则...
@@ -57,5 +64,43 @@ class DiseasePredictorService:
         
         return daily_predictions
 
+    @staticmethod
+    def forecast_to_array(forecasts: Sequence[Optional[List[Dict[str, Any]]]]) -> np.ndarray:
+        """
+        把多个地点的逐日预报 (weather_service.get_7_day_forecast 的返回值) 转成
+        (地点数, 天数, len(FORECAST_VARIABLES)) 的 float 数组。天数不足或缺失的值用 NaN 填充。
+        """
+        days = max((len(f) for f in forecasts if f), default=0)
+        array = np.full((len(forecasts), days, len(FORECAST_VARIABLES)), np.nan)
+        for i, forecast in enumerate(forecasts):
+            for j, day in enumerate(forecast or []):
+                array[i, j] = [np.nan if day.get(v) is None else day[v] for v in FORECAST_VARIABLES]
+        return array
+
+    def predict_risk_tensor(self, forecast: np.ndarray, disease_keys: Optional[Sequence[str]] = None) -> Tuple[np.ndarray, List[str]]:
+        """
+        列式风险引擎：一次性对所有地点、所有天、所有病害求值，与 predict_daily_risk 的逐日打分规则完全一致。
+        :param forecast: (地点数, 天数, len(FORECAST_VARIABLES)) 的数组，NaN 视为不满足任何条件。
+        :param disease_keys: 需要评估的病害，默认 disease_rules 中的全部病害。
+        :return: (地点数, 天数, 病害数) 的整数风险分数张量，以及对应的病害 key 列表。
+        """
+        disease_keys = list(disease_keys) if disease_keys else list(self.disease_rules)
+        unknown = [k for k in disease_keys if k not in self.disease_rules]
+        if unknown:
+            raise ValueError(f"未知的病害密钥: {', '.join(unknown)}。无法进行风险预测。")
+
+        forecast = np.asarray(forecast, dtype=np.float64)
+        columns = {name: forecast[..., i] for i, name in enumerate(FORECAST_VARIABLES)}
+        with np.errstate(invalid="ignore"):
+            base = ((columns["humidity_mean"] > 80).astype(np.int64)
+                    + (columns["temp_max"] > 28) + (columns["precipitation"] > 1))
+            outbreak = np.stack([self.disease_rules[k]["conditions"](columns) for k in disease_keys], axis=-1)
+        return base[..., None] + 3 * outbreak.astype(np.int64), disease_keys
+
+    @staticmethod
+    def risk_levels(scores: np.ndarray) -> np.ndarray:
+        """把风险分数张量映射为等级字符串张量 (与 predict_daily_risk 的阈值一致)。"""
+        return np.select([scores >= 4, scores >= 2], ["High", "Medium"], default="Low")
+
 # 创建全局实例
-disease_predictor_service = DiseasePredictorService()
\ No newline at end of file
+disease_predictor_service = DiseasePredictorService()
@@ -1,42 +1,284 @@
 # app/services/knowledge_base_service.py
+import asyncio
+import hashlib
+import json
+import os
+import re
+import threading
 import yaml
 from pathlib import Path
-from typing import Dict, Any
+from types import MappingProxyType
+from typing import Callable, Dict, Any, List, Mapping, NamedTuple, Optional, Tuple
+
+from ..config import settings
+
+LANGUAGES = ("en", "ms", "zh")
+
+# 优先使用 libyaml 的 C 加载器，未编译 libyaml 时退回纯 Python 实现
+YamlLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+
+def normalize_key(text: str) -> str:
+    """别名索引使用的标准化键：小写，所有非字母数字字符折叠为单个下划线。"""
+    return re.sub(r"[\W_]+", "_", str(text).strip().lower(), flags=re.UNICODE).strip("_")
+
+
+class KnowledgeSnapshot(NamedTuple):
+    """某一时刻知识库的只读快照。重新加载时整体替换，读取方不会看到加载到一半的知识库。"""
+    version: int
+    diseases: Mapping[str, Any]  # 病害 key -> YAML 中的原始条目
+    aliases: Mapping[str, str]  # 标准化的 key / 各语言名称 -> 病害 key
+    by_language: Mapping[str, Mapping[str, Dict[str, str]]]  # 语言 -> 病害 key -> {"name", "summary"}
+
 
 class KnowledgeBaseService:
-    def __init__(self, kb_path: Path):
-        self.knowledge_base = self._load_all_knowledge(kb_path)
+    def __init__(self, kb_path: Path, watch_interval: float = 0, compiled_dir: Optional[Path] = None):
+        """
+        :param watch_interval: 后台检查 YAML 文件修改时间的周期 (秒)，0 表示不自动重新加载。
+        :param compiled_dir: YAML 编译缓存目录 (JSON + 源文件 SHA-1)，None 表示每次都解析 YAML。
+        """
+        self.kb_path = kb_path
+        self.compiled_dir = Path(compiled_dir) if compiled_dir else None
+        self.watch_interval = watch_interval
+        self._reload_listeners: List[Callable[[], None]] = []
+        self._reload_lock = threading.Lock()
+        # 文件 -> ((mtime_ns, size), 解析结果)；只有签名变化的文件才重新解析
+        self._parsed_files: Dict[Path, Tuple[Tuple[int, int], Dict[str, Any]]] = {}
+        self._snapshot = KnowledgeSnapshot(0, MappingProxyType({}), MappingProxyType({}), MappingProxyType({}))
+        self._watcher: Optional[asyncio.Task] = None
+        self._refresh()
         print(f"知识库加载成功，共加载 {len(self.knowledge_base)} 条病害记录。")
 
-    def _load_all_knowledge(self, kb_path: Path) -> Dict[str, Any]:
-        """加载 knowledge_base 文件夹下所有的 .yaml 文件"""
-        full_kb = {}
-        if not kb_path.is_dir():
-            print(f"警告: 知识库路径 '{kb_path}' 不存在。")
-            return full_kb
-            
-        for yaml_file in kb_path.glob("*.yaml"):
-            with open(yaml_file, 'r', encoding='utf-8') as f:
+    @property
+    def snapshot(self) -> KnowledgeSnapshot:
+        return self._snapshot
+
+    @property
+    def knowledge_base(self) -> Mapping[str, Any]:
+        return self._snapshot.diseases
+
+    @property
+    def version(self) -> int:
+        """每次内容变化后递增，依赖知识库内容的缓存可据此判断是否过期。"""
+        return self._snapshot.version
+
+    def add_reload_listener(self, callback: Callable[[], None]):
+        """注册知识库重新加载后的回调 (例如使预编译的报告模板失效)。"""
+        self._reload_listeners.append(callback)
+
+    def remove_reload_listener(self, callback: Callable[[], None]):
+        """取消注册 add_reload_listener 添加的回调；未注册时忽略。"""
+        try:
+            self._reload_listeners.remove(callback)
+        except ValueError:
+            pass
+
+    # --- 加载 ---
+    def _scan(self) -> Dict[Path, Tuple[int, int]]:
+        if not self.kb_path.is_dir():
+            print(f"警告: 知识库路径 '{self.kb_path}' 不存在。")
+            return {}
+        signatures = {}
+        for yaml_file in sorted(self.kb_path.glob("*.yaml")):
+            try:
+                stat = yaml_file.stat()
+            except OSError:
+                continue  # 扫描和 stat 之间文件被删除
+            signatures[yaml_file] = (stat.st_mtime_ns, stat.st_size)
+        return signatures
+
+    def _parse_file(self, yaml_file: Path, force: bool = False) -> Dict[str, Any]:
+        """
+        解析单个 YAML 文件 (优先读取编译缓存；force=True 时忽略缓存重新解析并覆盖缓存)。
+        语法错误 (yaml.YAMLError) 或顶层不是映射 (ValueError) 时抛出，由调用方决定是否保留旧内容。
+        """
+        source = yaml_file.read_bytes()
+        digest = hashlib.sha1(source).hexdigest()
+        entries = None if force else self._load_compiled(yaml_file, digest)
+        if entries is not None:
+            return entries
+
+        entries = {}
+        data = yaml.load(source.decode("utf-8"), Loader=YamlLoader)
+        if data and not isinstance(data, dict):
+            raise ValueError(f"顶层应为映射 (病害 key -> 信息)，实际为 {type(data).__name__}")
+        for key, value in (data or {}).items():
+            # 将key进行标准化，去除可能存在的多余空格或特殊字符
+            entries[str(key).strip()] = value
+        self._write_compiled(yaml_file, digest, entries)
+        return entries
+
+    # --- 编译缓存 ---
+    def _compiled_path(self, yaml_file: Path) -> Path:
+        # 以源文件绝对路径的哈希区分：指向不同 kb_path (例如测试中的临时目录) 的服务不会互相覆盖同名文件的缓存
+        path_digest = hashlib.sha1(str(yaml_file.resolve()).encode("utf-8")).hexdigest()[:12]
+        return self.compiled_dir / f"{yaml_file.stem}-{path_digest}.json"
+
+    def _load_compiled(self, yaml_file: Path, digest: str) -> Optional[Dict[str, Any]]:
+        """源文件内容哈希与缓存一致时直接读取 JSON (C 实现的解析器)，否则返回 None。"""
+        if self.compiled_dir is None:
+            return None
+        try:
+            compiled = json.loads(self._compiled_path(yaml_file).read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        if compiled.get("source_sha1") != digest:
+            return None
+        return compiled.get("entries", {})
+
+    def _write_compiled(self, yaml_file: Path, digest: str, entries: Dict[str, Any]):
+        if self.compiled_dir is None:
+            return
+        try:
+            payload = json.dumps({"source": str(yaml_file.resolve()), "source_sha1": digest, "entries": entries}, ensure_ascii=False)
+        except (TypeError, ValueError):
+            return  # 含有 JSON 无法表示的 YAML 类型 (例如日期)，该文件不缓存
+        try:
+            self.compiled_dir.mkdir(parents=True, exist_ok=True)
+            path = self._compiled_path(yaml_file)
+            tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+            tmp_path.write_text(payload, encoding="utf-8")
+            os.replace(tmp_path, path)  # 多个 worker 同时启动时也不会读到半个文件
+        except OSError as e:
+            print(f"写入知识库编译缓存失败: {e}")
+
+    def compile_all(self, force: bool = False) -> int:
+        """
+        编译 (或刷新) 所有 YAML 文件的缓存，返回文件数。用于部署时的构建步骤。
+        force=True 时即使缓存有效也重新解析每个文件 (例如测量真实的编译耗时)。
+        """
+        files = list(self._scan())
+        for yaml_file in files:
+            self._parse_file(yaml_file, force=force)
+        return len(files)
+
+    def _refresh(self, force: bool = False) -> bool:
+        """增量重新加载：只解析新增或修改过的文件。内容有变化时构建新快照并返回 True。"""
+        with self._reload_lock:
+            signatures = self._scan()
+            changed = [path for path, sig in signatures.items()
+                       if force or self._parsed_files.get(path, (None,))[0] != sig]
+            removed = [path for path in self._parsed_files if path not in signatures]
+            if not changed and not removed and self._snapshot.version > 0:
+                return False
+
+            parsed = {path: self._parsed_files[path] for path in signatures if path not in changed}
+            failed = []
+            for path in changed:
                 try:
-                    data = yaml.safe_load(f)
-                    if data:
-                        # --- ↓↓↓ 在这里进行修复 ↓↓↓ ---
-                        for key, value in data.items():
-                            # 将key进行标准化，去除可能存在的多余空格或特殊字符
-                            cleaned_key = str(key).strip()
-                            full_kb[cleaned_key] = value
-                        # --- ↑↑↑ 修复结束 ↑↑↑ ---
-                except yaml.YAMLError as e:
-                    print(f"加载YAML文件 '{yaml_file.name}' 时出错: {e}")
-        return full_kb
+                    parsed[path] = (signatures[path], self._parse_file(path))
+                except (OSError, UnicodeDecodeError, yaml.YAMLError, ValueError) as e:
+                    # 文件可能正在被写入：保留旧签名和旧条目，下一次扫描会重新尝试解析
+                    print(f"读取YAML文件 '{path.name}' 失败，继续使用上一次的内容: {e}")
+                    failed.append(path)
+                    if path in self._parsed_files:
+                        parsed[path] = self._parsed_files[path]
+            self._parsed_files = parsed
+            if len(failed) == len(changed) and not removed and self._snapshot.version > 0:
+                return False  # 内容没有变化，不必构建新快照或通知监听者
+
+            full_kb = {}
+            for path in signatures:  # 按文件名顺序合并，后加载的文件覆盖同名条目
+                if path in parsed:
+                    full_kb.update(parsed[path][1])
+            self._snapshot = self._build_snapshot(full_kb, self._snapshot.version + 1)
+            if changed or removed:
+                print(f"知识库文件变化: {[p.name for p in changed]} 已解析, {[p.name for p in removed]} 已移除。")
+            return True
+
+    @staticmethod
+    def _build_snapshot(full_kb: Dict[str, Any], version: int) -> KnowledgeSnapshot:
+        aliases: Dict[str, str] = {}
+        by_language: Dict[str, Dict[str, Dict[str, str]]] = {lang: {} for lang in LANGUAGES}
+        for key, info in full_kb.items():
+            aliases.setdefault(normalize_key(key), key)
+            if not isinstance(info, dict):
+                continue
+            name_map = info.get("name", {}) or {}
+            summary_map = info.get("summary", {}) or {}
+            for lang in LANGUAGES:
+                if name_map.get(lang) or summary_map.get(lang):
+                    by_language[lang][key] = {"name": name_map.get(lang, ""), "summary": summary_map.get(lang, "")}
+            for name in name_map.values():
+                if name:
+                    aliases.setdefault(normalize_key(name), key)
+        for key in full_kb:
+            aliases[normalize_key(key)] = key  # 病害 key 本身优先于其他条目的名称
+        return KnowledgeSnapshot(
+            version=version,
+            diseases=MappingProxyType(full_kb),
+            aliases=MappingProxyType(aliases),
+            by_language=MappingProxyType({lang: MappingProxyType(entries) for lang, entries in by_language.items()}),
+        )
 
+    def reload_knowledge_base(self, force: bool = False) -> bool:
+        """检查 YAML 文件并重新加载有变化的部分；内容变化时通知已注册的监听者。"""
+        if not self._refresh(force=force):
+            return False
+        print(f"知识库已重新加载 (版本 {self.version})，共 {len(self.knowledge_base)} 条病害记录。")
+        for callback in self._reload_listeners:
+            try:
+                callback()
+            except Exception as e:
+                print(f"知识库重新加载回调执行失败: {e}")
+        return True
+
+    # --- 后台监视 ---
+    async def start(self):
+        if self.watch_interval > 0 and self._watcher is None:
+            self._watcher = asyncio.get_running_loop().create_task(self._watch_loop())
+
+    async def close(self):
+        if self._watcher is not None:
+            self._watcher.cancel()
+            await asyncio.gather(self._watcher, return_exceptions=True)
+            self._watcher = None
+
+    async def _watch_loop(self):
+        from ..utils.executors import io_executor
+        while True:
+            await asyncio.sleep(self.watch_interval)
+            try:
+                await io_executor.run(self.reload_knowledge_base)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"知识库自动重新加载失败: {e}")
+
+    # --- 查询 ---
     def get_disease_info(self, disease_key: str) -> Dict[str, Any]:
-        """根据内部病害名称 (key) 获取知识"""
-        return self.knowledge_base.get(disease_key)
+        """根据内部病害名称 (key) 获取知识；也接受大小写/分隔符不同的写法以及任一语言的病害名称。"""
+        snapshot = self._snapshot
+        info = snapshot.diseases.get(disease_key)
+        if info is None and disease_key:
+            canonical = snapshot.aliases.get(normalize_key(disease_key))
+            if canonical is not None:
+                info = snapshot.diseases.get(canonical)
+        return info
+
+    def resolve_key(self, name: str) -> Optional[str]:
+        """把病害 key、别名或本地化名称解析为知识库中的 key。"""
+        snapshot = self._snapshot
+        if name in snapshot.diseases:
+            return name
+        return snapshot.aliases.get(normalize_key(name))
+
+    def get_localized(self, disease_key: str, lang: str) -> Optional[Dict[str, str]]:
+        """返回某病害在指定语言下的名称和摘要；该语言没有内容时返回 None。"""
+        snapshot = self._snapshot
+        key = self.resolve_key(disease_key)
+        return snapshot.by_language.get(lang, {}).get(key) if key else None
+
+    def diseases_in_language(self, lang: str) -> List[str]:
+        return list(self._snapshot.by_language.get(lang, {}))
 
 # --- 全局实例初始化 ---
 BASE_DIR = Path(__file__).resolve().parent.parent.parent
 KB_PATH = BASE_DIR / "knowledge_base"
 
 # 创建一个全局知识库服务实例
-kb_service = KnowledgeBaseService(kb_path=KB_PATH)
\ No newline at end of file
+kb_service = KnowledgeBaseService(
+    kb_path=KB_PATH,
+    watch_interval=settings.KB_RELOAD_INTERVAL_SECONDS,
+    compiled_dir=BASE_DIR / settings.KB_COMPILED_CACHE_DIR if settings.KB_COMPILED_CACHE_DIR else None,
+)
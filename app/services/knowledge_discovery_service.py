@@ -65,7 +65,7 @@ class KnowledgeDiscoveryService:
         """主函数：执行完整的知识发现流程。"""
         # (这个函数的主体逻辑不需要修改，因为它现在会自动使用上面的备用方案)
         keywords = self._generate_keywords_from_image(image_bytes)
-        summaries = report_generator.web_search_and_summarize(keywords, lang)
+        summaries = await report_generator.web_search_and_summarize(keywords, lang)
         
         if not summaries:
             logger.warning("网络探索失败：未能找到相关的、有价值的信息。")
@@ -0,0 +1,181 @@
+# app/services/knowledge_index_service.py
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+import numpy as np
+
+from ..config import settings
+from .knowledge_base_service import LANGUAGES, kb_service
+
+MATRIX_FILE = "kb_embeddings.npy"
+METADATA_FILE = "kb_index.json"
+
+
+def kb_fingerprint(kb_path: Path) -> str:
+    """知识库所有 YAML 文件内容的摘要，用于判断索引是否过期。"""
+    digest = hashlib.sha1()
+    for yaml_file in sorted(Path(kb_path).glob("*.yaml")):
+        digest.update(yaml_file.name.encode("utf-8"))
+        digest.update(yaml_file.read_bytes())
+    return digest.hexdigest()
+
+
+def iter_kb_passages(knowledge_base: Dict[str, Any]) -> Iterable[Dict[str, str]]:
+    """把知识库展开为可检索的文本段落：每种语言的 summary 和每一条 treatment 步骤。"""
+    for disease_key, info in knowledge_base.items():
+        if not isinstance(info, dict):
+            continue
+        summary_map = info.get("summary", {}) or {}
+        for lang in LANGUAGES:
+            if summary_map.get(lang):
+                yield {"disease": disease_key, "field": "summary", "lang": lang, "title": "", "text": summary_map[lang]}
+        for treatment in info.get("treatments", []) or []:
+            title_map = treatment.get("title", {}) or {}
+            for step in treatment.get("steps", []) or []:
+                step_map = step if isinstance(step, dict) else {"en": str(step)}
+                for lang in LANGUAGES:
+                    if step_map.get(lang):
+                        yield {"disease": disease_key, "field": "treatment", "lang": lang,
+                               "title": title_map.get(lang, title_map.get("en", "")), "text": step_map[lang]}
+
+
+class KnowledgeIndex:
+    """
+    知识库文本的预计算向量索引 (由 app/train/build_kb_index.py 生成)：
+      - kb_embeddings.npy: (N, hidden_dim) float32，已 L2 归一化，按语言连续存放，以 mmap 方式只读加载；
+      - kb_index.json: 每一行对应的病害/字段/语言/原文，以及每种语言的行区间和知识库指纹。
+    检索时只对目标语言的连续切片做一次矩阵-向量乘积，不复制数据、不访问网络。
+    """
+
+    def __init__(self, index_dir: Path):
+        self.index_dir = Path(index_dir)
+        self.matrix: Optional[np.ndarray] = None
+        self.entries: List[Dict[str, str]] = []
+        self.lang_ranges: Dict[str, List[int]] = {}
+        self.kb_fingerprint: Optional[str] = None
+        # 每一行的字段/病害，load() 时预先转成数组，检索时用向量运算构造过滤掩码
+        self._fields = np.empty(0, dtype=object)
+        self._diseases = np.empty(0, dtype=object)
+        # 知识库已修改而索引尚未重建：段落原文可能已过时，暂停检索
+        self.stale = False
+
+    @property
+    def available(self) -> bool:
+        return self.matrix is not None and len(self.entries) > 0 and not self.stale
+
+    def load(self) -> bool:
+        """加载索引；文件不存在或损坏时返回 False，检索功能保持关闭。"""
+        try:
+            metadata = json.loads((self.index_dir / METADATA_FILE).read_text(encoding="utf-8"))
+            matrix = np.load(self.index_dir / MATRIX_FILE, mmap_mode="r")
+        except (OSError, ValueError) as e:
+            print(f"⚠️ 知识库向量索引未加载 ({e})。可运行 python -m app.train.build_kb_index 生成。")
+            return False
+        if matrix.shape[0] != len(metadata.get("entries", [])):
+            print("⚠️ 知识库向量索引与元数据不一致，已忽略。")
+            return False
+        self.matrix = matrix
+        self.entries = metadata["entries"]
+        self.lang_ranges = metadata.get("lang_ranges", {})
+        self.kb_fingerprint = metadata.get("kb_fingerprint")
+        self._fields = np.array([entry["field"] for entry in self.entries], dtype=object)
+        self._diseases = np.array([entry["disease"] for entry in self.entries], dtype=object)
+        self.stale = False
+        print(f"✅ 知识库向量索引加载完成，共 {len(self.entries)} 条段落。")
+        return True
+
+    def is_stale(self, kb_path: Path) -> bool:
+        return self.kb_fingerprint != kb_fingerprint(kb_path)
+
+    def refresh(self, kb_path: Path) -> bool:
+        """
+        知识库 (重新) 加载后调用：重新读取磁盘上的索引 (可能已由 build_kb_index 重建)，
+        与知识库内容不一致时标记为过期并暂停检索。返回索引当前是否可用。
+        """
+        self.load()
+        if self.matrix is not None and self.is_stale(kb_path):
+            self.stale = True
+            print("⚠️ 知识库已修改，向量索引已过期，检索暂停。请重新运行 python -m app.train.build_kb_index。")
+        return self.available
+
+    def search(self, query: np.ndarray, lang: str, k: int = 3, field: Optional[str] = None,
+               exclude_disease: Optional[str] = None, min_score: float = -1.0) -> List[Dict[str, Any]]:
+        """
+        返回与 query 向量余弦相似度最高的 k 条段落 (同一语言)，按相似度降序。
+        :param field: 只检索 'summary' 或 'treatment'。
+        :param exclude_disease: 排除某个病害自身的段落 (报告中已经列出)。
+        """
+        if not self.available or lang not in self.lang_ranges:
+            return []
+        start, end = self.lang_ranges[lang]
+        query = np.asarray(query, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(query)
+        if norm == 0:
+            return []
+        scores = self.matrix[start:end] @ (query / norm)
+
+        mask = scores >= min_score
+        if field is not None:
+            mask &= self._fields[start:end] == field
+        if exclude_disease is not None:
+            mask &= self._diseases[start:end] != exclude_disease
+        candidates = np.flatnonzero(mask)
+        if len(candidates) == 0:
+            return []
+        if len(candidates) > k:
+            top = np.argpartition(-scores[candidates], k - 1)[:k]
+            candidates = candidates[top]
+        ordered = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [dict(self.entries[start + i], score=float(scores[i])) for i in ordered]
+
+    @staticmethod
+    def build(knowledge_base: Dict[str, Any], encode: Callable[[List[str]], np.ndarray], index_dir: Path,
+              kb_path: Optional[Path] = None) -> "KnowledgeIndex":
+        """
+        编码所有段落并写入 index_dir。
+        :param encode: 文本列表 -> (len, hidden_dim) 向量矩阵 (通常是 AdvancedNLGGenerator._get_embeddings)。
+        """
+        passages = list(iter_kb_passages(knowledge_base))
+        passages.sort(key=lambda p: LANGUAGES.index(p["lang"]))  # 稳定排序：每种语言的段落连续存放
+        vectors = np.asarray(encode([p["text"] for p in passages]), dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms == 0, 1, norms)
+
+        lang_ranges, start = {}, 0
+        for lang in LANGUAGES:
+            count = sum(1 for p in passages if p["lang"] == lang)
+            if count:
+                lang_ranges[lang] = [start, start + count]
+            start += count
+
+        index_dir = Path(index_dir)
+        index_dir.mkdir(parents=True, exist_ok=True)
+        # 先写临时文件再原子替换，正在运行的服务不会读到写了一半的索引
+        tmp_matrix = index_dir / f"{MATRIX_FILE}.{os.getpid()}.tmp.npy"
+        np.save(tmp_matrix, vectors)
+        os.replace(tmp_matrix, index_dir / MATRIX_FILE)
+        tmp_metadata = index_dir / f"{METADATA_FILE}.{os.getpid()}.tmp"
+        tmp_metadata.write_text(json.dumps({
+            "kb_fingerprint": kb_fingerprint(kb_path) if kb_path else None,
+            "dim": int(vectors.shape[1]) if vectors.ndim == 2 else 0,
+            "lang_ranges": lang_ranges,
+            "entries": passages,
+        }, ensure_ascii=False, indent=2), encoding="utf-8")
+        os.replace(tmp_metadata, index_dir / METADATA_FILE)
+
+        index = KnowledgeIndex(index_dir)
+        index.load()
+        return index
+
+
+# --- 全局实例初始化 ---
+BASE_DIR = Path(__file__).resolve().parent.parent.parent
+KB_PATH = BASE_DIR / "knowledge_base"
+
+kb_index = KnowledgeIndex(BASE_DIR / settings.KB_INDEX_DIR)
+kb_index.refresh(KB_PATH)
+# 知识库热重载后重新检查索引 (重建后的索引会被重新加载，否则标记为过期)
+kb_service.add_reload_listener(lambda: kb_index.refresh(kb_service.kb_path))
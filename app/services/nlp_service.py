@@ -1,53 +1,144 @@
+# app/services/nlp_service.py
+import hashlib
 import json
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import joblib
+import sklearn
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.pipeline import Pipeline
 from sklearn.svm import LinearSVC
-from typing import List, Dict
+
+BASE_DIR = Path(__file__).resolve().parent.parent.parent
+DATA_PATH = BASE_DIR / "nlp_training_data.json"
+MODEL_PATH = BASE_DIR / "models_store" / "nlp_sentence_classifier.joblib"
+
+DEFAULT_TRAINING_DATA = [  # 放一些默认数据以防文件不存在
+    {"text": "symptoms appear on leaves", "label": "symptom"},
+    {"text": "use fungicide to treat", "label": "treatment"},
+    {"text": "our privacy policy", "label": "other"}
+]
+
+
+def load_training_data(data_path: Path) -> List[Dict[str, str]]:
+    try:
+        with open(data_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        print(f"警告: 未找到 {data_path.name}，NLP句子分类器将使用默认数据。")
+        return DEFAULT_TRAINING_DATA
+
+
+def training_data_hash(training_data: List[Dict[str, str]]) -> str:
+    return hashlib.sha1(json.dumps(training_data, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def metadata_path(model_path: Path) -> Path:
+    return model_path.with_suffix(".json")
+
+
+def train_pipeline(data_path: Path = DATA_PATH, model_path: Optional[Path] = MODEL_PATH) -> Pipeline:
+    """训练 TF-IDF + LinearSVC 句子分类器；提供 model_path 时连同训练数据哈希一起保存。"""
+    training_data = load_training_data(data_path)
+    X_train = [item["text"] for item in training_data]
+    y_train = [item["label"] for item in training_data]
+
+    pipeline = Pipeline([
+        ('tfidf', TfidfVectorizer(ngram_range=(1, 2), stop_words='english')),
+        ('clf', LinearSVC()),
+    ])
+
+    print("正在训练自研NLP句子分类模型...")
+    pipeline.fit(X_train, y_train)
+    print("✅ NLP模型训练完成。")
+
+    if model_path is not None:
+        model_path.parent.mkdir(parents=True, exist_ok=True)
+        # 不压缩：这样加载时 joblib 可以直接 mmap 其中的 numpy 数组 (词表权重、SVM 系数)
+        joblib.dump(pipeline, model_path)
+        metadata_path(model_path).write_text(json.dumps({
+            "data_sha1": training_data_hash(training_data),
+            "samples": len(training_data),
+            "labels": sorted(set(y_train)),
+            "sklearn_version": sklearn.__version__,
+        }, indent=2), encoding="utf-8")
+        print(f"✅ NLP模型已保存至: {model_path}")
+    return pipeline
+
 
 class NlpService:
-    def __init__(self):
-        # 假设你已经创建了 nlp_training_data.json
+    """
+    句子分类服务 (症状 / 防治方法 / 其他)。
+    模型由 app/train/train_nlp_classifier.py 预先训练并保存，首次调用时才加载 (mmap)，
+    导入模块本身不再触发训练。保存的模型缺失或训练数据已变化时，会在首次使用时重新训练并保存。
+    """
+
+    def __init__(self, model_path: Path = MODEL_PATH, data_path: Path = DATA_PATH):
+        self.model_path = model_path
+        self.data_path = data_path
+        self._pipeline: Optional[Pipeline] = None
+        self._lock = threading.Lock()
+
+    @property
+    def pipeline(self) -> Pipeline:
+        if self._pipeline is None:
+            with self._lock:
+                if self._pipeline is None:
+                    self._pipeline = self._load_or_train()
+        return self._pipeline
+
+    def _is_current(self) -> bool:
         try:
-            with open("nlp_training_data.json", "r", encoding="utf-8") as f:
-                training_data = json.load(f)
-        except FileNotFoundError:
-            print("警告: 未找到 nlp_training_data.json，NLP句子分类器将使用默认数据。")
-            training_data = [ # 放一些默认数据以防文件不存在
-                {"text": "symptoms appear on leaves", "label": "symptom"},
-                {"text": "use fungicide to treat", "label": "treatment"},
-                {"text": "our privacy policy", "label": "other"}
-            ]
-
-        X_train = [item["text"] for item in training_data]
-        y_train = [item["label"] for item in training_data]
-
-        self.pipeline = Pipeline([
-            ('tfidf', TfidfVectorizer(ngram_range=(1, 2), stop_words='english')),
-            ('clf', LinearSVC()),
-        ])
-
-        print("正在训练自研NLP句子分类模型...")
-        self.pipeline.fit(X_train, y_train)
-        print("✅ NLP模型训练完成。")
+            metadata = json.loads(metadata_path(self.model_path).read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return False
+        if metadata.get("sklearn_version") != sklearn.__version__:
+            return False
+        return metadata.get("data_sha1") == training_data_hash(load_training_data(self.data_path))
+
+    def _load_or_train(self) -> Pipeline:
+        if self.model_path.is_file() and self._is_current():
+            try:
+                return joblib.load(self.model_path, mmap_mode="r")
+            except Exception as e:
+                print(f"警告: 加载NLP模型失败 ({e})，将重新训练。")
+        else:
+            print("警告: NLP模型不存在或训练数据已变化，将重新训练。可运行 python -m app.train.train_nlp_classifier 预先训练。")
+        try:
+            return train_pipeline(self.data_path, self.model_path)
+        except OSError as e:
+            print(f"警告: 无法保存NLP模型 ({e})，仅在内存中使用。")
+            return train_pipeline(self.data_path, None)
 
     def extract_key_info(self, full_text: str) -> Dict[str, List[str]]:
         """
         从长文本中提取'症状'和'防治方法'的关键句子。
         """
-        if not full_text:
-            return {"symptoms": [], "treatments": []}
+        return self.extract_key_info_many([full_text])[0]
+
+    def extract_key_info_many(self, full_texts: List[str]) -> List[Dict[str, List[str]]]:
+        """批量版本：所有文档的句子合并后只调用一次 predict，再按文档拆分结果。"""
+        results = [{"symptoms": [], "treatments": []} for _ in full_texts]
+        owners, sentences = [], []
+        for doc_index, full_text in enumerate(full_texts):
+            if not full_text:
+                continue
+            for sentence in full_text.split('\n'):  # 基于我们之前的清理，按行分割
+                if sentence.strip():
+                    owners.append(doc_index)
+                    sentences.append(sentence)
+        if not sentences:
+            return results
 
-        sentences = full_text.split('\n') # 基于我们之前的清理，按行分割
         predictions = self.pipeline.predict(sentences)
-        
-        extracted_info = {"symptoms": [], "treatments": []}
-        for sentence, label in zip(sentences, predictions):
+        for doc_index, sentence, label in zip(owners, sentences, predictions):
             if label == "symptom":
-                extracted_info["symptoms"].append(sentence)
+                results[doc_index]["symptoms"].append(sentence)
             elif label == "treatment":
-                extracted_info["treatments"].append(sentence)
-        
-        return extracted_info
+                results[doc_index]["treatments"].append(sentence)
+        return results
 
-# 创建全局实例
-nlp_service = NlpService()
\ No newline at end of file
+# 创建全局实例 (模型在首次使用时才加载)
+nlp_service = NlpService()
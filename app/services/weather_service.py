@@ -3,78 +3,416 @@
 # 【【【 诊断标记已升级到 v4 】】】
 print(">>> 正在加载 weather_service.py 版本 v4！已修正天气API的URL。 <<<")
 
+import asyncio
+import math
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Sequence, Tuple
+
 import httpx
-from typing import Dict, Any, List, Optional
+from loguru import logger
+
+from ..config import settings
+from ..utils.executors import ExecutorSaturatedError, io_executor
+from .weather_snapshot_store import WeatherSnapshotStore
+
+BASE_DIR = Path(__file__).resolve().parent.parent.parent
 
 class WeatherService:
-    def __init__(self):
+    def __init__(self, api_url: str = "https://api.open-meteo.com/v1/forecast", grid_degrees: float = 0.1,
+                 current_ttl: int = 900, forecast_ttl: int = 3600,
+                 max_entries: int = 4096, bulk_max_locations: int = 50, timeout: float = 10.0,
+                 transport: Optional[httpx.AsyncBaseTransport] = None,
+                 snapshot_store: Optional[WeatherSnapshotStore] = None, live_timeout: Optional[float] = None,
+                 max_stale_seconds: int = 6 * 3600, refresh_interval: float = 0, active_window: int = 86400):
+        """
+        :param grid_degrees: 缓存网格大小。坐标先对齐到网格中心再请求上游，同一网格内的所有请求共享结果。
+        :param current_ttl / forecast_ttl: 缓存有效期，按 Open-Meteo 的更新周期对齐到整点边界
+            (例如 900 秒 → 在 :00/:15/:30/:45 过期)，而不是从写入时刻起算。
+        :param snapshot_store: 本地天气快照库。内存缓存过期时先立即返回不超过 max_stale_seconds 的快照 (source = "cached")，
+            同时在后台向上游重新验证 (stale-while-revalidate)。
+        :param live_timeout: 没有可用快照时等待上游的最长时间，超时返回默认值 (source = "default")，
+            上游请求仍在后台完成并写入缓存。None 表示只受 HTTP 超时约束。
+        :param refresh_interval: 后台刷新周期 (秒)，定期刷新 active_window 内被请求过的网格；0 表示不启用。
+        """
         # 【【【 核心修复：修正了这里的 URL，移除了多余的'-' 】】】
-        self.api_url = "https://api.open-meteo.com/v1/forecast"
+        self.api_url = api_url
+        self.grid_degrees = grid_degrees
+        self.ttls = {"current": current_ttl, "forecast": forecast_ttl}
+        self.max_entries = max_entries
+        self.bulk_max_locations = bulk_max_locations
+        self.timeout = timeout
+        self.transport = transport
+        self.snapshots = snapshot_store
+        self.live_timeout = live_timeout
+        self.max_stale_seconds = max_stale_seconds
+        self.refresh_interval = refresh_interval
+        self.active_window = active_window
 
-    async def get_current_weather(self, latitude: float, longitude: float) -> Dict[str, Any]:
+        # 长生命周期的连接池客户端，由应用的 startup/shutdown 管理 (start/close)
+        self._client: Optional[httpx.AsyncClient] = None
+        self._cache: "OrderedDict[Tuple, Tuple[float, Any]]" = OrderedDict()
+        # 正在进行中的上游请求：同一网格的并发请求只会触发一次上游调用
+        self._inflight: Dict[Tuple, asyncio.Future] = {}
+        self._chunk_tasks = set()
+        # 快照库的写入在 io_executor 中进行，关闭前等待它们完成
+        self._snapshot_writes = set()
+        # 最近被请求过的网格 (活跃区域) -> 最后请求时间，后台刷新器只刷新这些网格
+        self._active: Dict[Tuple, float] = {}
+        self._refresher: Optional[asyncio.Task] = None
+        # close() 之后不再懒加载新的客户端，直到再次显式调用 start()
+        self._closed = False
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.upstream_calls = 0
+        self.stale_served = 0
+        self.deadline_exceeded = 0
+
+    async def start(self):
+        self._closed = False
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                transport=self.transport,
+                limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+            )
+        if self.refresh_interval > 0 and self._refresher is None:
+            if self.snapshots is not None:
+                # 重启后从快照库恢复活跃区域，内存缓存为空时也能持续刷新
+                now = time.time()
+                for kind in self.ttls:
+                    for cell in await io_executor.run(self.snapshots.recent_cells, kind, self.active_window):
+                        self._active.setdefault((kind, cell), now)
+            self._refresher = asyncio.get_running_loop().create_task(self._refresh_loop())
+
+    async def close(self):
+        self._closed = True
+        if self._refresher is not None:
+            self._refresher.cancel()
+            await asyncio.gather(self._refresher, return_exceptions=True)
+            self._refresher = None
+        # 取消仍在进行的上游分块请求，并让等待这些网格的调用方拿到 default，而不是一直挂起
+        tasks = list(self._chunk_tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for future in list(self._inflight.values()):
+            future.cancel()
+        await asyncio.gather(*list(self._snapshot_writes), return_exceptions=True)
+        if self.snapshots is not None:
+            # 与其他快照库操作一样在 io_executor 中关闭连接 (存储内部的锁保证不会与仍在线程中执行的查询交错)
+            try:
+                await io_executor.run(self.snapshots.close)
+            except ExecutorSaturatedError:
+                self.snapshots.close()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        self._inflight.clear()
+
+    async def _get(self, params: Dict[str, Any]) -> Any:
+        if self._closed:
+            raise RuntimeError("WeatherService 已关闭")
+        if self._client is None:
+            await self.start()
+        self.upstream_calls += 1
+        response = await self._client.get(self.api_url, params=params)
+        response.raise_for_status()
+        return response.json()
+
+    def _cell(self, latitude: float, longitude: float) -> Tuple[int, int]:
+        return round(latitude / self.grid_degrees), round(longitude / self.grid_degrees)
+
+    def _cell_center(self, cell: Tuple[int, int]) -> Tuple[float, float]:
+        return round(cell[0] * self.grid_degrees, 4), round(cell[1] * self.grid_degrees, 4)
+
+    def _expires_at(self, kind: str) -> float:
+        ttl = self.ttls[kind]
+        return (math.floor(time.time() / ttl) + 1) * ttl
+
+    def _lookup(self, key: Tuple) -> Tuple[bool, Any]:
+        item = self._cache.get(key)
+        if item is not None:
+            if item[0] > time.time():
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return True, item[1]
+            del self._cache[key]
+        return False, None
+
+    def _register(self, key: Tuple, kind: str, future: asyncio.Future):
+        self._inflight[key] = future
+        future.add_done_callback(lambda f, key=key: self._store(key, kind, f))
+
+    def _is_fresh(self, key: Tuple) -> bool:
+        item = self._cache.get(key)
+        return item is not None and item[0] > time.time()
+
+    def _latest_snapshots(self, keys: List[Tuple]) -> Dict[Tuple, Any]:
+        found = {}
+        for key in keys:
+            row = self.snapshots.latest(key[0], key[1], self.max_stale_seconds)
+            if row is not None:
+                found[key] = row[1]
+        return found
+
+    async def _snapshots(self, keys: List[Tuple]) -> Dict[Tuple, Any]:
+        """在 io_executor 中一次查出这些网格的近期快照；查询失败 (包括线程池饱和) 时视为没有快照。"""
+        if self.snapshots is None or not keys:
+            return {}
+        try:
+            return await io_executor.run(self._latest_snapshots, keys)
+        except Exception as e:
+            logger.warning(f"Weather snapshot lookup failed: {e}")
+            return {}
+
+    async def _save_snapshot(self, kind: str, cell: Tuple[int, int], payload: Any):
+        try:
+            await io_executor.run(self.snapshots.save, kind, cell, payload)
+        except Exception as e:
+            logger.warning(f"Weather snapshot write failed: {e}")
+
+    async def _cached_many(self, kind: str, coordinates: Sequence[Tuple[float, float]]) -> List[Tuple[Any, str]]:
         """
-        根据经纬度从Open-Meteo获取当前天气数据。
+        按 (类型, 网格) 查缓存：命中缓存或已在请求中的网格直接复用 (合并并发请求)，其余网格去重后按 bulk_max_locations 分块，
+        每块只发一次上游请求 (Open-Meteo 支持逗号分隔的多坐标)。
+        内存缓存未命中但快照库中有近期数据时，立即返回快照并让上游请求在后台完成。
+        返回与 coordinates 对齐的 (结果, 来源) 列表，来源为 live (本次上游请求) / cached (内存缓存或本地快照) / default；
+        失败的位置结果为对应的异常对象 (失败结果不会被缓存)。
         """
+        keys = [(kind, self._cell(lat, lon)) for lat, lon in coordinates]
+        resolved: Dict[Tuple, Tuple[Any, str]] = {}
+        pending: Dict[Tuple, asyncio.Future] = {}
+        unresolved: Dict[Tuple, asyncio.Future] = {}
+        missing: List[Tuple] = []
+        loop = asyncio.get_running_loop()
+        now = time.time()
+        for key in dict.fromkeys(keys):
+            self._active[key] = now
+            hit, value = self._lookup(key)
+            if hit:
+                resolved[key] = (value, "cached")
+                continue
+            if key in self._inflight:
+                self.coalesced += 1
+                future = self._inflight[key]
+            else:
+                self.misses += 1
+                future = loop.create_future()
+                self._register(key, kind, future)
+                missing.append(key)
+            unresolved[key] = future
+
+        # 先发起上游请求，再查快照，两者并行
+        self._fetch(kind, missing)
+        stale = await self._snapshots(list(unresolved))
+        for key, future in unresolved.items():
+            if key in stale and not (future.done() and not future.cancelled() and future.exception() is None):
+                self.stale_served += 1
+                resolved[key] = (stale[key], "cached")
+            else:
+                pending[key] = future
+
+        if pending:
+            # asyncio.wait 超时或调用方被取消时都不会取消这些共享的 future，上游请求会在后台完成
+            await asyncio.wait(set(pending.values()), timeout=self.live_timeout)
+            for key, future in pending.items():
+                if not future.done():
+                    self.deadline_exceeded += 1
+                    resolved[key] = (asyncio.TimeoutError(f"天气API在 {self.live_timeout} 秒内未响应"), "default")
+                elif future.cancelled():
+                    # CancelledError 是 BaseException，不能作为失败结果交给调用方按 Exception 处理
+                    resolved[key] = (RuntimeError("天气请求已取消"), "default")
+                elif future.exception() is not None:
+                    resolved[key] = (future.exception(), "default")
+                else:
+                    resolved[key] = (future.result(), "live")
+        return [resolved[key] for key in keys]
+
+    def _fetch(self, kind: str, keys: List[Tuple]):
+        """为已登记 future 的网格分块发起上游请求。"""
+        loop = asyncio.get_running_loop()
+        for i in range(0, len(keys), self.bulk_max_locations):
+            chunk = keys[i:i + self.bulk_max_locations]
+            task = loop.create_task(self._resolve_chunk(kind, chunk, [self._inflight[key] for key in chunk]))
+            self._chunk_tasks.add(task)
+            task.add_done_callback(self._chunk_tasks.discard)
+
+    async def refresh_active_regions(self) -> int:
+        """刷新活跃区域中已过期的网格，返回刷新的网格数。"""
+        cutoff = time.time() - self.active_window
+        self._active = {key: t for key, t in self._active.items() if t >= cutoff}
+        loop = asyncio.get_running_loop()
+        futures = []
+        for kind in self.ttls:
+            due = [key for key in self._active if key[0] == kind and key not in self._inflight and not self._is_fresh(key)]
+            for key in due:
+                future = loop.create_future()
+                self._register(key, kind, future)
+                futures.append(future)
+            self._fetch(kind, due)
+        if futures:
+            await asyncio.wait(futures)
+        return len(futures)
+
+    async def _refresh_loop(self):
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                refreshed = await self.refresh_active_regions()
+                if self.snapshots is not None:
+                    await io_executor.run(self.snapshots.prune)
+                logger.debug(f"Weather refresher updated {refreshed} grid cells.")
+            except Exception as e:
+                logger.warning(f"Weather refresher failed: {e}")
+
+    async def _resolve_chunk(self, kind: str, keys: List[Tuple], futures: List[asyncio.Future]):
+        try:
+            results = await self._fetch_many(kind, [self._cell_center(key[1]) for key in keys])
+        except Exception as e:
+            results = [e] * len(keys)
+        for future, result in zip(futures, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    def _store(self, key: Tuple, kind: str, future: asyncio.Future):
+        self._inflight.pop(key, None)
+        if future.cancelled() or future.exception() is not None:
+            return
+        self._cache[key] = (self._expires_at(kind), future.result())
+        if self.snapshots is not None:
+            task = asyncio.ensure_future(self._save_snapshot(kind, key[1], future.result()))
+            self._snapshot_writes.add(task)
+            task.add_done_callback(self._snapshot_writes.discard)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+
+    async def _fetch_many(self, kind: str, centers: List[Tuple[float, float]]) -> List[Any]:
+        """一次上游请求获取多个坐标的数据，按位置拆分解析；单个位置解析失败时该位置为异常对象。"""
         params = {
-            "latitude": latitude,
-            "longitude": longitude,
-            "current": "temperature_2m,relative_humidity_2m",
-            "timezone": "auto"
+            "latitude": ",".join(str(lat) for lat, _ in centers),
+            "longitude": ",".join(str(lon) for _, lon in centers),
+            "timezone": "auto",
         }
-        try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(self.api_url, params=params)
-                response.raise_for_status()
-                data = response.json()
-                
-                current = data.get("current", {})
-                temperature = current.get("temperature_2m")
-                humidity = current.get("relative_humidity_2m")
+        if kind == "current":
+            params["current"] = "temperature_2m,relative_humidity_2m"
+            parse = self._parse_current
+        else:
+            params["daily"] = "temperature_2m_max,temperature_2m_min,relative_humidity_2m_mean,precipitation_sum"
+            params["forecast_days"] = 7
+            parse = self._parse_forecast
 
-                if temperature is None or humidity is None:
-                    raise ValueError("API返回的数据不完整")
+        data = await self._get(params)
+        # 多个坐标时 Open-Meteo 返回数组，单个坐标时返回对象
+        locations = data if isinstance(data, list) else [data]
+        if len(locations) != len(centers):
+            raise ValueError(f"天气API返回了 {len(locations)} 个地点，预期 {len(centers)} 个")
+        results = []
+        for location in locations:
+            try:
+                results.append(parse(location))
+            except Exception as e:
+                results.append(e)
+        return results
 
-                return {"temperature": temperature, "humidity": humidity}
+    @staticmethod
+    def _parse_current(data: Dict[str, Any]) -> Dict[str, Any]:
+        current = data.get("current", {})
+        temperature = current.get("temperature_2m")
+        humidity = current.get("relative_humidity_2m")
 
-        except Exception as e:
-            print(f"!!! 获取当前天气时出错: {e}. 返回默认值。")
-            return {"temperature": 28.0, "humidity": 75.0}
+        if temperature is None or humidity is None:
+            raise ValueError("API返回的数据不完整")
+
+        return {"temperature": temperature, "humidity": humidity}
+
+    @staticmethod
+    def _parse_forecast(data: Dict[str, Any]) -> List[Dict[str, Any]]:
+        data = data.get("daily", {})
+        required_keys = ["time", "temperature_2m_max", "temperature_2m_min", "relative_humidity_2m_mean", "precipitation_sum"]
+        if not data or not all(k in data for k in required_keys):
+            raise ValueError("天气预报API数据不完整")
+
+        forecast_list = []
+        for i in range(len(data["time"])):
+            forecast_list.append({
+                "date": data["time"][i],
+                "temp_max": data["temperature_2m_max"][i],
+                "temp_min": data["temperature_2m_min"][i],
+                "humidity_mean": data["relative_humidity_2m_mean"][i],
+                "precipitation": data["precipitation_sum"][i]
+            })
+        return forecast_list
+
+    async def get_current_weather(self, latitude: float, longitude: float) -> Dict[str, Any]:
+        """
+        根据经纬度从Open-Meteo获取当前天气数据。
+        返回值中的 "source" 标明数据来源: live (本次上游请求) / cached (内存缓存或本地快照) / default (默认值)。
+        """
+        return (await self.get_current_weather_many([(latitude, longitude)]))[0]
 
     async def get_7_day_forecast(self, latitude: float, longitude: float) -> Optional[List[Dict[str, Any]]]:
         """
         获取未来7天的每日天气预报。
         """
-        params = {
-            "latitude": latitude,
-            "longitude": longitude,
-            "daily": "temperature_2m_max,temperature_2m_min,relative_humidity_2m_mean,precipitation_sum",
-            "timezone": "auto",
-            "forecast_days": 7
+        return (await self.get_7_day_forecast_many([(latitude, longitude)]))[0]
+
+    async def get_current_weather_many(self, coordinates: Sequence[Tuple[float, float]]) -> List[Dict[str, Any]]:
+        """批量获取多个 (纬度, 经度) 的当前天气，获取失败的位置返回默认值 (source = "default")。"""
+        results = []
+        for result, source in await self._cached_many("current", coordinates):
+            if isinstance(result, Exception):
+                print(f"!!! 获取当前天气时出错: {result!r}. 返回默认值。")
+                results.append({"temperature": 28.0, "humidity": 75.0, "source": "default"})
+            else:
+                results.append({**result, "source": source})
+        return results
+
+    async def get_7_day_forecast_many(self, coordinates: Sequence[Tuple[float, float]]) -> List[Optional[List[Dict[str, Any]]]]:
+        """批量获取多个 (纬度, 经度) 的7天预报，获取失败的位置为 None。"""
+        results = []
+        for result, _ in await self._cached_many("forecast", coordinates):
+            if isinstance(result, Exception):
+                print(f"!!! 获取7天天气预报时出错: {result!r}")
+                results.append(None)
+            else:
+                results.append([dict(day) for day in result])
+        return results
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "cached_entries": len(self._cache),
+            "inflight": len(self._inflight),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "upstream_calls": self.upstream_calls,
+            "stale_served": self.stale_served,
+            "deadline_exceeded": self.deadline_exceeded,
+            "active_cells": len(self._active),
+            "hit_rate": ((self.hits + self.coalesced) / lookups) if lookups else 0.0,
         }
-        try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(self.api_url, params=params)
-                response.raise_for_status()
-                data = response.json().get("daily", {})
-                
-                required_keys = ["time", "temperature_2m_max", "temperature_2m_min", "relative_humidity_2m_mean", "precipitation_sum"]
-                if not data or not all(k in data for k in required_keys):
-                    print("!!! 天气预报API数据不完整")
-                    return None
-
-                forecast_list = []
-                for i in range(len(data["time"])):
-                    forecast_list.append({
-                        "date": data["time"][i],
-                        "temp_max": data["temperature_2m_max"][i],
-                        "temp_min": data["temperature_2m_min"][i],
-                        "humidity_mean": data["relative_humidity_2m_mean"][i],
-                        "precipitation": data["precipitation_sum"][i]
-                    })
-                return forecast_list
-        except Exception as e:
-            print(f"!!! 获取7天天气预报时出错: {e}")
-            return None
 
 # 创建一个全局实例
-weather_service = WeatherService()
\ No newline at end of file
+weather_service = WeatherService(
+    api_url=settings.OPEN_METEO_API_URL,
+    grid_degrees=settings.WEATHER_GRID_DEGREES,
+    current_ttl=settings.WEATHER_CURRENT_TTL_SECONDS,
+    forecast_ttl=settings.WEATHER_FORECAST_TTL_SECONDS,
+    max_entries=settings.WEATHER_CACHE_MAX_ENTRIES,
+    bulk_max_locations=settings.WEATHER_BULK_MAX_LOCATIONS,
+    timeout=settings.WEATHER_HTTP_TIMEOUT_SECONDS,
+    snapshot_store=WeatherSnapshotStore(BASE_DIR / settings.WEATHER_SNAPSHOT_PATH) if settings.WEATHER_SNAPSHOT_PATH else None,
+    live_timeout=settings.WEATHER_LIVE_TIMEOUT_SECONDS,
+    max_stale_seconds=settings.WEATHER_SNAPSHOT_MAX_STALE_SECONDS,
+    refresh_interval=settings.WEATHER_REFRESH_INTERVAL_SECONDS,
+    active_window=settings.WEATHER_ACTIVE_REGION_SECONDS,
+)
@@ -0,0 +1,81 @@
+# app/services/weather_snapshot_store.py
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, List, Optional, Tuple
+
+
+class WeatherSnapshotStore:
+    """
+    按网格保存最近天气数据的本地时间序列 (SQLite)。
+    Open-Meteo 慢或不可用、或进程刚重启内存缓存为空时，WeatherService 从这里立即返回最近一次的数据 (stale-while-revalidate)。
+    每次写入都会提交 WAL 事务并持有线程锁，WeatherService 通过 io_executor 调用这里的方法，不在事件循环中直接执行。
+    """
+
+    def __init__(self, path: Path, retention_seconds: int = 7 * 86400):
+        self.path = Path(path)
+        self.retention_seconds = retention_seconds
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        # 首次使用时才创建数据库文件
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS weather_snapshots ("
+                " kind TEXT NOT NULL, cell_lat INTEGER NOT NULL, cell_lon INTEGER NOT NULL,"
+                " fetched_at REAL NOT NULL, payload TEXT NOT NULL,"
+                " PRIMARY KEY (kind, cell_lat, cell_lon, fetched_at))"
+            )
+            self._conn = conn
+        return self._conn
+
+    def save(self, kind: str, cell: Tuple[int, int], payload: Any, fetched_at: Optional[float] = None):
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO weather_snapshots VALUES (?, ?, ?, ?, ?)",
+                (kind, cell[0], cell[1], fetched_at or time.time(), json.dumps(payload)),
+            )
+            conn.commit()
+
+    def latest(self, kind: str, cell: Tuple[int, int], max_age_seconds: float) -> Optional[Tuple[float, Any]]:
+        """返回该网格不超过 max_age_seconds 的最新一条数据 (fetched_at, payload)。"""
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT fetched_at, payload FROM weather_snapshots"
+                " WHERE kind = ? AND cell_lat = ? AND cell_lon = ? AND fetched_at >= ?"
+                " ORDER BY fetched_at DESC LIMIT 1",
+                (kind, cell[0], cell[1], time.time() - max_age_seconds),
+            ).fetchone()
+        return (row[0], json.loads(row[1])) if row else None
+
+    def recent_cells(self, kind: str, since_seconds: float) -> List[Tuple[int, int]]:
+        """最近一段时间内有数据的网格 (用于重启后恢复后台刷新的活跃区域)。"""
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT DISTINCT cell_lat, cell_lon FROM weather_snapshots WHERE kind = ? AND fetched_at >= ?",
+                (kind, time.time() - since_seconds),
+            ).fetchall()
+        return [(row[0], row[1]) for row in rows]
+
+    def prune(self) -> int:
+        with self._lock:
+            conn = self._connection()
+            deleted = conn.execute(
+                "DELETE FROM weather_snapshots WHERE fetched_at < ?", (time.time() - self.retention_seconds,)
+            ).rowcount
+            conn.commit()
+        return deleted
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
@@ -0,0 +1,191 @@
+# app/services/web_reference_service.py
+import asyncio
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+from urllib.parse import parse_qs, urljoin, urlparse
+
+import httpx
+from bs4 import BeautifulSoup
+from loguru import logger
+
+from ..config import settings
+from ..utils.executors import inference_executor, io_executor
+
+try:
+    from newspaper import Article
+except ImportError:
+    Article = None
+
+BASE_DIR = Path(__file__).resolve().parent.parent.parent
+USER_AGENT = "Mozilla/5.0"
+
+
+class WebReferenceService:
+    """
+    诊断报告中"网络参考信息"的异步获取管道：
+      1. 搜索 (DuckDuckGo HTML) 与文章下载全部使用共享的 httpx 连接池并发进行，每个请求和整体都有硬性期限；
+      2. 文章正文解析 (newspaper) 和句子排序 (自研 NLG 编码器) 分派到线程池执行，不阻塞事件循环；
+      3. 提取出的摘要按 (病害, 语言) 缓存到磁盘 (读写在 IO 线程池中进行)，TTL 内同一病害最多访问一次外网；
+      4. 同一 (病害, 语言) 的并发请求共享一次抓取。
+    """
+
+    def __init__(self, cache_dir: Path, ttl_seconds: int = 7 * 86400, search_url: str = "https://html.duckduckgo.com/html/",
+                 max_articles: int = 3, request_timeout: float = 4.0, deadline: float = 8.0,
+                 transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.cache_dir = Path(cache_dir)
+        self.ttl_seconds = ttl_seconds
+        self.search_url = search_url
+        self.max_articles = max_articles
+        self.request_timeout = request_timeout
+        self.deadline = deadline
+        self.transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.cache_hits = 0
+        self.fetches = 0
+        self.failures = 0
+
+    async def start(self):
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.request_timeout, connect=min(2.0, self.request_timeout)),
+                headers={"User-Agent": USER_AGENT},
+                follow_redirects=True,
+                transport=self.transport,
+                limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+            )
+
+    async def close(self):
+        for task in list(self._inflight.values()):
+            task.cancel()
+        await asyncio.gather(*self._inflight.values(), return_exceptions=True)
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    # --- 磁盘缓存 ---
+    def _cache_path(self, disease_name: str, lang: str) -> Path:
+        digest = hashlib.sha1(f"{disease_name}\x00{lang}".encode("utf-8")).hexdigest()
+        return self.cache_dir / f"{digest}.json"
+
+    def cached(self, disease_name: str, lang: str) -> Optional[List[str]]:
+        """返回 TTL 内的缓存摘要；没有或已过期时返回 None。同步读取文件，在事件循环中请通过 io_executor 调用。"""
+        path = self._cache_path(disease_name, lang)
+        try:
+            entry = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        if entry.get("fetched_at", 0) + self.ttl_seconds < time.time():
+            return None
+        return entry.get("summaries", [])
+
+    def _write_cache(self, disease_name: str, lang: str, summaries: List[str]):
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        path = self._cache_path(disease_name, lang)
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        tmp_path.write_text(json.dumps({
+            "disease": disease_name, "lang": lang, "fetched_at": time.time(), "summaries": summaries,
+        }, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp_path, path)  # 原子替换，多个 worker 进程同时写也不会读到半个文件
+
+    def is_pending(self, disease_name: str, lang: str) -> bool:
+        return f"{disease_name}\x00{lang}" in self._inflight
+
+    # --- 获取 ---
+    def prefetch(self, disease_name: str, lang: str, summarize: Callable[[str, List[str]], List[str]]) -> asyncio.Task:
+        """在后台开始 (或复用进行中的) 抓取，立即返回任务。"""
+        key = f"{disease_name}\x00{lang}"
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.get_running_loop().create_task(self._fetch_and_store(disease_name, lang, summarize))
+            self._inflight[key] = task
+            task.add_done_callback(lambda t, key=key: self._inflight.pop(key, None))
+        return task
+
+    async def get_summaries(self, disease_name: str, lang: str, summarize: Callable[[str, List[str]], List[str]],
+                            wait: Optional[float] = None) -> Optional[List[str]]:
+        """
+        获取参考摘要：优先磁盘缓存，否则抓取。
+        :param summarize: (病害名称, 文章正文列表) -> 摘要列表，在推理线程池中执行。
+        :param wait: 最多等待的秒数；超时返回 None，抓取在后台继续并写入缓存。None 表示等到抓取结束 (仍受 deadline 约束)。
+        :return: 摘要列表 (抓取成功但没有找到内容时为空列表)；抓取失败或等待超时时为 None，
+            两者可用 is_pending 区分 (超时时抓取仍在进行)。
+        """
+        summaries = await io_executor.run(self.cached, disease_name, lang)
+        if summaries is not None:
+            self.cache_hits += 1
+            return summaries
+        task = self.prefetch(disease_name, lang, summarize)
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), timeout=wait)
+        except asyncio.TimeoutError:
+            return None
+
+    async def _fetch_and_store(self, disease_name: str, lang: str, summarize) -> Optional[List[str]]:
+        self.fetches += 1
+        await self.start()
+        try:
+            articles = await asyncio.wait_for(self._fetch_articles(disease_name, lang), timeout=self.deadline)
+            summaries = await inference_executor.run(summarize, disease_name, articles) if articles else []
+        except Exception as e:
+            # 失败时不写缓存，下次请求会重试
+            self.failures += 1
+            logger.warning(f"Web reference enrichment failed for '{disease_name}' ({lang}): {e!r}")
+            return None
+        if summaries:
+            try:
+                await io_executor.run(self._write_cache, disease_name, lang, summaries)
+            except Exception as e:
+                logger.warning(f"Failed to write web reference cache for '{disease_name}' ({lang}): {e!r}")
+        return summaries
+
+    async def _fetch_articles(self, disease_name: str, lang: str) -> List[str]:
+        query = f"{disease_name.replace('_', ' ')} pepper plant treatment {lang}"
+        response = await self._client.get(self.search_url, params={"q": query})
+        response.raise_for_status()
+        links = self._parse_links(response.text, str(response.url))
+        results = await asyncio.gather(*(self._fetch_article(link, lang) for link in links), return_exceptions=True)
+        return [text for text in results if isinstance(text, str) and text]
+
+    def _parse_links(self, html: str, base_url: str) -> List[str]:
+        soup = BeautifulSoup(html, "lxml")
+        links = []
+        for a in soup.find_all("a", class_="result__a", limit=self.max_articles):
+            href = urljoin(base_url, a.get("href", ""))
+            # DuckDuckGo 的结果链接是 /l/?uddg=<真实地址> 形式的跳转链接
+            target = parse_qs(urlparse(href).query).get("uddg")
+            links.append(target[0] if target else href)
+        return links
+
+    async def _fetch_article(self, url: str, lang: str) -> str:
+        response = await self._client.get(url)
+        response.raise_for_status()
+        return await io_executor.run(self._extract_text, url, response.text, lang)
+
+    @staticmethod
+    def _extract_text(url: str, html: str, lang: str) -> str:
+        if Article is not None:
+            try:
+                article = Article(url, language=lang)
+                article.download(input_html=html)
+                article.parse()
+                return article.text
+            except Exception:
+                pass  # 例如 newspaper 不支持的语言，退回到纯文本提取
+        return BeautifulSoup(html, "lxml").get_text(" ", strip=True)
+
+    def stats(self) -> Dict[str, int]:
+        return {"cache_hits": self.cache_hits, "fetches": self.fetches, "failures": self.failures, "inflight": len(self._inflight)}
+
+# 创建全局实例
+web_reference_service = WebReferenceService(
+    cache_dir=BASE_DIR / settings.WEB_REFERENCES_CACHE_DIR,
+    ttl_seconds=settings.WEB_REFERENCES_TTL_SECONDS,
+    search_url=settings.WEB_SEARCH_URL,
+    request_timeout=settings.WEB_REFERENCES_REQUEST_TIMEOUT_SECONDS,
+    deadline=settings.WEB_REFERENCES_DEADLINE_SECONDS,
+)
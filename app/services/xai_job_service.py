@@ -0,0 +1,80 @@
+# app/services/xai_job_service.py
+import asyncio
+import time
+import uuid
+from typing import Awaitable, Callable, Dict, Optional
+
+from loguru import logger
+
+from ..config import settings
+from ..schemas.diagnosis import XaiJobStatus
+
+
+class XaiJobService:
+    """
+    延迟生成 XAI 热力图的后台任务管理。
+    /diagnose 先返回报告 (xai_status = "pending" + job_id)，热力图在后台由推理线程池生成，
+    前端随后通过 GET /diagnose/xai/{job_id} 轮询拿到图片 URL。
+
+    任务状态保存在进程内：热力图生成需要请求中已解码的图像和已加载的模型，
+    这两者都只存在于 API 进程里，因此没有交给 background_tasks.py 中的 Celery worker。
+    因此 XAI_MODE=deferred 要求 API 以单进程运行 (uvicorn 不带 --workers，或 --workers 1)：
+    多进程时轮询请求可能落到另一个 worker 上，查不到任务而返回 404。需要多进程时请使用 XAI_MODE=sync。
+    """
+
+    def __init__(self, ttl_seconds: int = 3600):
+        self.ttl_seconds = ttl_seconds
+        self._jobs: Dict[str, XaiJobStatus] = {}
+        self._created_at: Dict[str, float] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    def submit(self, work: Callable[[], Awaitable[str]], on_done: Optional[Callable[[str], Awaitable[None]]] = None,
+               job_id: Optional[str] = None) -> str:
+        """
+        登记并在后台启动一个任务。
+        :param work: 生成并保存热力图、返回图片 URL 的协程函数。
+        :param on_done: 成功后以图片 URL 调用的回调 (例如回填诊断缓存)。
+        :param job_id: 预先分配的任务ID (已写入返回给前端的报告中)，默认自动生成。
+        """
+        self._evict_expired()
+        job_id = job_id or uuid.uuid4().hex
+        self._jobs[job_id] = XaiJobStatus(job_id=job_id, status="pending")
+        self._created_at[job_id] = time.monotonic()
+        self._tasks[job_id] = asyncio.get_running_loop().create_task(self._run(job_id, work, on_done))
+        return job_id
+
+    def get(self, job_id: str) -> Optional[XaiJobStatus]:
+        return self._jobs.get(job_id)
+
+    async def _run(self, job_id: str, work, on_done):
+        try:
+            url = await work()
+            self._jobs[job_id] = XaiJobStatus(job_id=job_id, status="ready", xai_image_url=url)
+            if on_done is not None:
+                await on_done(url)
+        except Exception as e:
+            logger.error(f"Deferred XAI job {job_id} failed: {e}")
+            self._jobs[job_id] = XaiJobStatus(job_id=job_id, status="failed", error=str(e))
+        finally:
+            self._tasks.pop(job_id, None)
+
+    def _evict_expired(self):
+        deadline = time.monotonic() - self.ttl_seconds
+        for job_id in [j for j, created in self._created_at.items() if created < deadline and j not in self._tasks]:
+            self._jobs.pop(job_id, None)
+            self._created_at.pop(job_id, None)
+
+    async def shutdown(self):
+        for task in list(self._tasks.values()):
+            task.cancel()
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+
+    def stats(self) -> Dict[str, int]:
+        """本进程内各状态的任务数 (由 /diagnose/executors/stats 返回)。"""
+        counts = {"pending": 0, "ready": 0, "failed": 0}
+        for job in self._jobs.values():
+            counts[job.status] = counts.get(job.status, 0) + 1
+        return counts
+
+# 创建全局实例
+xai_job_service = XaiJobService(ttl_seconds=settings.XAI_JOB_TTL_SECONDS)
@@ -0,0 +1,30 @@
+# tests/conftest.py
+import os
+import tempfile
+
+import pytest
+
+# app.config.Settings 的部分字段没有默认值 (通常来自 .env)。
+# 为测试环境提供占位值，使依赖 settings 的模块可以被直接导入。
+for _key, _value in {
+    "DB_HOST": "localhost",
+    "DB_PORT": "3306",
+    "DB_USER": "test",
+    "DB_PASSWORD": "test",
+    "DB_NAME": "test",
+    "PROJECT_NAME": "Sarawak Agriculture (test)",
+    "SENDER_EMAIL": "test@example.com",
+    "ALLOWED_ORIGINS": "http://localhost:8080",
+    # 导入 app.main 时会建表：测试使用临时 SQLite 文件，而不是连接 MySQL
+    "DATABASE_URL": f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='app-tests-'), 'test.sqlite3')}",
+}.items():
+    os.environ.setdefault(_key, _value)
+
+
+@pytest.fixture
+def open_meteo_stub():
+    """本地 Open-Meteo 替身服务器 (app/bench/fake_servers.py)，测试无需访问外网。"""
+    from app.bench.fake_servers import FakeOpenMeteoServer
+
+    with FakeOpenMeteoServer() as server:
+        yield server
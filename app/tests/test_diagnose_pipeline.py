@@ -0,0 +1,114 @@
+# tests/test_diagnose_pipeline.py
+import io
+from types import SimpleNamespace
+
+import numpy as np
+import torch
+from fastapi.testclient import TestClient
+from PIL import Image
+
+from app import database, main
+from app.dependencies import get_current_user
+from app.schemas.diagnosis import FullDiagnosisReport, PredictionResult
+from app.services.diagnosis_cache_service import DiagnosisCache, InMemoryCacheBackend
+from app.utils.service_registry import ServiceRegistry, module_attribute
+
+
+class TinyNet(torch.nn.Module):
+    def __init__(self):
+        super().__init__()
+        self.features = torch.nn.Sequential(torch.nn.Conv2d(3, 4, 3, padding=1), torch.nn.ReLU())
+        self.head = torch.nn.Linear(4, 3)
+
+    def forward(self, x):
+        return self.head(self.features(x).mean(dim=(2, 3)))
+
+
+class EagerClassifier:
+    """与 DiseaseClassifier 接口一致的 eager 替身 (真实模型权重不随仓库分发)。"""
+    backend = "eager"
+    device = torch.device("cpu")
+    model_version = "tiny-eager"
+    labels = {0: "Healthy", 1: "Leaf Spot", 2: "Blight"}
+
+    def __init__(self):
+        self.model = TinyNet().eval()
+
+    def predict_batch(self, image_batch):
+        with torch.no_grad():
+            probabilities = torch.nn.functional.softmax(self.model(image_batch), dim=1)
+        return [self.to_prediction(row) for row in probabilities]
+
+    def to_prediction(self, probabilities):
+        confidence, index = torch.max(probabilities, 0)
+        return PredictionResult(disease=self.labels[index.item()], confidence=confidence.item())
+
+    def get_class_index(self, class_name):
+        return {name: index for index, name in self.labels.items()}.get(class_name)
+
+
+class OnePassExplainer:
+    """与 XaiGenerator.predict_and_explain 相同的调用约定：一次前向 + 反向，返回 (概率, 热力图)。"""
+
+    def __init__(self, model):
+        self.model = model
+
+    def predict_and_explain(self, image_tensor, rgb_image, target_category=None):
+        with torch.enable_grad():
+            logits = self.model(image_tensor)
+            probabilities = torch.nn.functional.softmax(logits.detach(), dim=1)[0]
+            logits[0, int(probabilities.argmax())].backward()
+        return probabilities, np.zeros_like(rgb_image)
+
+
+def test_sync_xai_on_eager_backend_runs_one_forward_pass(monkeypatch, tmp_path):
+    """测试 eager 后端 + XAI_MODE=sync 时，一次 /diagnose 只在模型上执行一次前向，预测取自 Grad-CAM 的 logits"""
+    classifier = EagerClassifier()
+    forward_calls = []
+    classifier.model.register_forward_hook(lambda module, inputs, output: forward_calls.append(inputs[0].shape[0]))
+
+    registry = ServiceRegistry()
+    registry.register("classifier", lambda: classifier)
+    registry.register("image_processor", module_attribute("app.utils.image_processing", "image_processor"))
+    registry.register("risk_assessor", module_attribute("app.models.risk_assessor", "risk_assessor"))
+    registry.register("report_generator", lambda: None)
+    registry.register("xai_generator", lambda: OnePassExplainer(classifier.model))
+    monkeypatch.setattr(main, "services", registry)
+    monkeypatch.setattr(main.settings, "XAI_MODE", "sync")
+    monkeypatch.setattr(main, "diagnosis_cache", DiagnosisCache(backend=InMemoryCacheBackend()))
+    monkeypatch.setattr(main, "static_path", tmp_path)
+    (tmp_path / "uploads").mkdir()
+
+    async def weather(latitude, longitude):
+        return {"temperature": 30.0, "humidity": 85.0, "source": "live"}
+
+    async def report(prediction, risk, language):
+        return FullDiagnosisReport(title=prediction.disease, diagnosis_summary="", environmental_context="",
+                                   management_suggestion="")
+
+    async def save_heatmap(heatmap):
+        return "/static/xai_images/xai_test.jpg"
+
+    monkeypatch.setattr(main, "get_weather_data", weather)
+    monkeypatch.setattr(main, "_generate_report", report)
+    monkeypatch.setattr(main, "_save_xai_heatmap", save_heatmap)
+    monkeypatch.setattr(main, "_save_diagnosis_records", lambda *args: None)
+    monkeypatch.setattr(main.permission_service, "check_api_limit", lambda db, user: None)
+    main.app.dependency_overrides[get_current_user] = lambda: SimpleNamespace(id=1, email="farmer@example.com")
+    main.app.dependency_overrides[database.get_db] = lambda: None
+
+    image = io.BytesIO()
+    Image.new("RGB", (320, 240), (40, 140, 60)).save(image, format="JPEG")
+    try:
+        response = TestClient(main.app).post(
+            "/diagnose",
+            files={"image": ("leaf.jpg", image.getvalue(), "image/jpeg")},
+            data={"language": "en", "latitude": "1.55", "longitude": "110.33"},
+        )
+    finally:
+        main.app.dependency_overrides.clear()
+
+    assert response.status_code == 200, response.text
+    assert response.json()["xai_status"] == "ready"
+    assert forward_calls == [1]
+    assert main.inference_batcher.total_requests == 0
@@ -0,0 +1,108 @@
+# tests/test_diagnosis_cache.py
+import io
+import time
+
+from PIL import Image
+
+from app.schemas.diagnosis import FullDiagnosisReport, PredictionResult, RiskAssessment
+from app.services.diagnosis_cache_service import CachedDiagnosis, DiagnosisCache, InMemoryCacheBackend
+
+
+def _jpeg_bytes(quality: int) -> bytes:
+    # 用一张低频的 "叶片" 纹理模拟手机照片 (平滑的色块，而不是锐利的线条)
+    image = Image.effect_mandelbrot((32, 24), (-2.0, -1.2, 1.0, 1.2), 60).convert("RGB")
+    image = image.resize((640, 480), Image.BILINEAR)
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+def _entry() -> CachedDiagnosis:
+    return CachedDiagnosis(
+        prediction=PredictionResult(disease="Footrot", confidence=0.93),
+        risk=RiskAssessment(risk_score=8.1, risk_level="High"),
+        report=FullDiagnosisReport(
+            title="t", diagnosis_summary="s", environmental_context="e", management_suggestion="m"
+        ),
+        xai_image_url="/static/xai_images/xai_1.jpg",
+    )
+
+
+def test_reencoded_photo_hits_the_same_entry():
+    """测试同一张照片以不同 JPEG 质量重新上传时，仍然命中缓存"""
+    cache = DiagnosisCache(InMemoryCacheBackend())
+    key = cache.compute_key(_jpeg_bytes(95), "b2-abc", "en")
+    cache.put(key, _entry())
+
+    hit = cache.get(cache.compute_key(_jpeg_bytes(70), "b2-abc", "en"))
+    assert hit is not None and hit.prediction.disease == "Footrot"
+    assert cache.get(cache.compute_key(_jpeg_bytes(95), "b2-abc", "zh")) is None
+    assert cache.get(cache.compute_key(_jpeg_bytes(95), "b2-new", "en")) is None
+    assert cache.stats()["hits"] == 1
+
+
+def test_memory_backend_evicts_lru_and_expired_entries():
+    """测试进程内缓存的 LRU 淘汰与 TTL 过期"""
+    backend = InMemoryCacheBackend(max_entries=2, ttl_seconds=60)
+    backend.set("a", "1")
+    backend.set("b", "2")
+    backend.get("a")
+    backend.set("c", "3")
+    assert backend.get("b") is None
+    assert backend.get("a") == "1"
+
+    expiring = InMemoryCacheBackend(ttl_seconds=0)
+    expiring.set("a", "1")
+    time.sleep(0.01)
+    assert expiring.get("a") is None
+
+
+def test_failing_backend_is_bypassed_after_repeated_errors():
+    """测试后端 (例如宕机的 Redis) 连续失败后在冷却期内被跳过，不再让每个请求等待超时"""
+    class DownBackend:
+        calls = 0
+
+        def get(self, key):
+            DownBackend.calls += 1
+            raise ConnectionError("redis down")
+
+        def set(self, key, value):
+            DownBackend.calls += 1
+            raise ConnectionError("redis down")
+
+    cache = DiagnosisCache(DownBackend(), max_failures=2, cooldown_seconds=60)
+    assert cache.get("k") is None
+    cache.put("k", _entry())
+    assert DownBackend.calls == 2
+    assert cache.get("k") is None
+    cache.put("k", _entry())
+    assert DownBackend.calls == 2
+    assert cache.stats()["errors"] == 2 and cache.stats()["bypassed"] == 2
+
+    cache._bypass_until = 0.0  # 冷却期结束后重新尝试
+    cache.get("k")
+    assert DownBackend.calls == 3
+
+
+
+def test_counters_are_exact_under_concurrent_lookups():
+    """测试事件循环与 io_executor 线程并发读写缓存时，命中/未命中/写入计数不会丢失"""
+    import sys
+    from concurrent.futures import ThreadPoolExecutor
+
+    cache = DiagnosisCache(backend=InMemoryCacheBackend())
+    cache.put("present", _entry())
+
+    def worker(_):
+        for i in range(500):
+            cache.get("present" if i % 2 else "absent")
+
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)  # 频繁切换线程，放大未加锁的 += 丢失更新
+    try:
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(worker, range(8)))
+    finally:
+        sys.setswitchinterval(interval)
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["stores"]) == (2000, 2000, 1)
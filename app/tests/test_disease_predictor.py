@@ -0,0 +1,31 @@
+# tests/test_disease_predictor.py
+import numpy as np
+
+from app.services.disease_predictor_service import disease_predictor_service
+
+
+def test_risk_tensor_matches_daily_loop():
+    """测试列式风险引擎的结果与逐日循环的 predict_daily_risk 完全一致"""
+    rng = np.random.default_rng(0)
+    forecasts = [
+        [
+            {
+                "date": f"2024-07-{day + 1:02d}",
+                "temp_max": float(rng.uniform(20, 36)),
+                "temp_min": float(rng.uniform(15, 24)),
+                "humidity_mean": float(rng.uniform(60, 100)),
+                "precipitation": float(rng.uniform(0, 12)),
+            }
+            for day in range(7)
+        ]
+        for _ in range(20)
+    ]
+    scores, keys = disease_predictor_service.predict_risk_tensor(disease_predictor_service.forecast_to_array(forecasts))
+    levels = disease_predictor_service.risk_levels(scores)
+    assert scores.shape == (20, 7, len(keys))
+
+    for i, forecast in enumerate(forecasts):
+        for k, key in enumerate(keys):
+            expected = disease_predictor_service.predict_daily_risk(forecast, key)
+            assert scores[i, :, k].tolist() == [day["risk_score"] for day in expected]
+            assert levels[i, :, k].tolist() == [day["risk_level"] for day in expected]
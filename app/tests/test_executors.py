@@ -0,0 +1,58 @@
+# tests/test_executors.py
+import asyncio
+import threading
+
+import pytest
+
+from app.utils.executors import BoundedExecutor, ExecutorSaturatedError
+
+
+def test_saturated_executor_rejects_with_retry_after():
+    """测试排队任务达到上限后，新任务立即被拒绝并带有 retry_after"""
+    executor = BoundedExecutor("test", max_workers=1, max_pending=2, retry_after=5)
+    release = threading.Event()
+
+    async def scenario():
+        running = [asyncio.ensure_future(executor.run(release.wait)) for _ in range(2)]
+        await asyncio.sleep(0.05)
+        with pytest.raises(ExecutorSaturatedError) as exc_info:
+            await executor.run(lambda: None)
+        release.set()
+        await asyncio.gather(*running)
+        return exc_info.value
+
+    error = asyncio.run(scenario())
+    assert error.retry_after == 5
+    assert executor.stats()["total_rejected"] == 1
+    assert executor.pending == 0
+    executor.shutdown()
+
+
+def test_cancelled_caller_keeps_slot_until_worker_finishes():
+    """测试等待方被取消后，线程中仍在执行的任务继续占用名额，结束后才归还"""
+    executor = BoundedExecutor("test", max_workers=1, max_pending=1)
+    started, release = threading.Event(), threading.Event()
+
+    def work():
+        started.set()
+        release.wait()
+
+    async def scenario():
+        task = asyncio.ensure_future(executor.run(work))
+        await asyncio.get_running_loop().run_in_executor(None, started.wait)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert executor.pending == 1
+        with pytest.raises(ExecutorSaturatedError):
+            await executor.run(lambda: None)
+        release.set()
+        for _ in range(100):
+            if executor.pending == 0:
+                break
+            await asyncio.sleep(0.01)
+        return await executor.run(lambda: "ok")
+
+    assert asyncio.run(scenario()) == "ok"
+    assert executor.pending == 0
+    executor.shutdown()
@@ -0,0 +1,46 @@
+# tests/test_hot_paths.py
+from app.bench.hot_paths import Case, HotPathContext, _thread_counts, compare, measure, run
+
+
+def test_measure_runs_until_min_rounds_and_reports_statistics():
+    """测试预热不计入统计，至少执行 min_rounds 次，统计量以毫秒计且满足 min <= median <= max"""
+    calls = []
+    stats = measure(lambda: calls.append(1), min_rounds=7, min_time=0.0, warmup=2)
+    assert stats["rounds"] == 7 and len(calls) == 9
+    assert stats["min_ms"] <= stats["median_ms"] <= stats["p95_ms"] <= stats["max_ms"]
+    assert stats["ops"] > 0
+
+
+def test_run_records_group_errors_and_continues():
+    """测试某一组初始化失败 (例如缺少模型权重) 或单个用例抛错时记录错误，其余用例照常计时"""
+    def broken(ctx):
+        yield Case("ok_before_failure", lambda: None)
+        raise FileNotFoundError("weights missing")
+
+    def working(ctx):
+        yield Case("fails", lambda: 1 / 0, {"batch_size": 1})
+        yield Case("noop", lambda: None, {"batch_size": 2}, items=2)
+
+    ctx = HotPathContext(images=[b""], batch_sizes=[1], thread_counts=[1])
+    outcome = run(ctx, {"broken": broken, "working": working}, min_rounds=3, min_time=0.0, warmup=0)
+
+    assert [(r["group"], r["name"]) for r in outcome["results"]] == [("broken", "ok_before_failure"), ("working", "noop")]
+    assert outcome["results"][1]["items_per_second"] == outcome["results"][1]["ops"] * 2
+    assert [(e["group"], e.get("name")) for e in outcome["errors"]] == [("broken", None), ("working", "fails")]
+    assert "weights missing" in outcome["errors"][0]["error"]
+
+
+def test_compare_matches_cases_by_params_and_thread_counts_cover_max():
+    """测试按 (组, 用例, 参数) 比较中位数，只有超过容差 + 绝对余量才算回归；线程数序列包含上限"""
+    def result(batch_size, median):
+        return {"group": "classifier", "name": "predict_batch", "params": {"threads": 4, "batch_size": batch_size},
+                "median_ms": median}
+
+    baseline = {"results": [result(8, 40.0), result(16, 80.0)]}
+    report = {"results": [result(8, 60.0), result(16, 81.0), result(32, 500.0)]}
+    regressions = compare(report, baseline, tolerance=0.2)
+    assert [r["case"] for r in regressions] == ['classifier.predict_batch{"batch_size": 8, "threads": 4}']
+
+    assert _thread_counts(1) == [1]
+    assert _thread_counts(6) == [1, 2, 4, 6]
+    assert _thread_counts(8) == [1, 2, 4, 8]
@@ -0,0 +1,60 @@
+# tests/test_image_processing.py
+import io
+
+import numpy as np
+import torch
+import torchvision.transforms as transforms
+from PIL import Image
+
+from app.utils.image_processing import IMAGENET_MEAN, IMAGENET_STD, ImageProcessor
+
+ATOL = 1e-5  # 融合的 uint8 -> float32 仿射变换与 ToTensor + Normalize 之间只有浮点舍入误差
+
+# 与训练/验证时相同的预处理
+REFERENCE = transforms.Compose([
+    transforms.Resize(256),
+    transforms.CenterCrop(224),
+    transforms.ToTensor(),
+    transforms.Normalize(mean=IMAGENET_MEAN, std=IMAGENET_STD),
+])
+
+
+def _image_bytes(size, mode="RGB", fmt="JPEG", seed=0) -> bytes:
+    rng = np.random.default_rng(seed)
+    channels = {"RGB": 3, "RGBA": 4}[mode]
+    pixels = rng.integers(0, 256, (size[1], size[0], channels), dtype=np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels, mode).save(buffer, format=fmt)
+    return buffer.getvalue()
+
+
+def _reference(image_bytes: bytes) -> torch.Tensor:
+    return REFERENCE(Image.open(io.BytesIO(image_bytes)).convert("RGB")).unsqueeze(0)
+
+
+def test_default_processor_matches_torchvision_reference():
+    """测试默认 (不缩小解码) 的 process / process_many / decode_and_crop + normalize 与训练时的 torchvision 流程数值一致"""
+    processor = ImageProcessor()
+    assert processor.fast_decode is False
+    images = [_image_bytes((1600, 1200), seed=1), _image_bytes((300, 500), fmt="PNG", seed=2),
+              _image_bytes((640, 480), mode="RGBA", fmt="PNG", seed=3)]
+    reference = torch.cat([_reference(data) for data in images])
+
+    single = torch.cat([processor.process(data) for data in images])
+    batched = processor.process_many(images)
+    split = torch.cat([processor.normalize(processor.decode_and_crop(data)[None]) for data in images])
+
+    assert single.shape == batched.shape == reference.shape == (3, 3, 224, 224)
+    assert single.dtype == torch.float32
+    for output in (single, batched, split):
+        assert torch.allclose(output, reference, atol=ATOL)
+
+
+def test_fast_decode_is_opt_in_and_stays_close_to_reference():
+    """测试缩小尺寸解码需要显式开启，且与参考结果的差异有界 (只影响大尺寸 JPEG)"""
+    processor = ImageProcessor(fast_decode=True)
+    large = _image_bytes((2000, 1500), seed=4)
+    assert (processor.process(large) - _reference(large)).abs().mean().item() < 0.05
+
+    small_png = _image_bytes((300, 300), fmt="PNG", seed=5)
+    assert torch.allclose(processor.process(small_png), _reference(small_png), atol=ATOL)
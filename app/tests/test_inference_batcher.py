@@ -0,0 +1,108 @@
+# tests/test_inference_batcher.py
+import asyncio
+
+import torch
+
+from app.models.inference_batcher import InferenceBatcher
+from app.schemas.diagnosis import PredictionResult
+
+
+def _fake_predict_batch(calls):
+    def predict_batch(image_batch: torch.Tensor):
+        calls.append(image_batch.shape[0])
+        # 用图片张量的第一个像素值作为"置信度"，以便验证结果被分发回正确的请求
+        return [PredictionResult(disease="Footrot", confidence=float(t[0, 0, 0])) for t in image_batch]
+    return predict_batch
+
+
+def test_concurrent_requests_are_batched():
+    """测试并发请求会被合并成一次前向推理，并且每个请求拿回自己的结果"""
+    calls = []
+    batcher = InferenceBatcher(_fake_predict_batch(calls), max_batch_size=8, max_wait_ms=50)
+
+    async def scenario():
+        tensors = [torch.full((1, 3, 4, 4), i / 10) for i in range(5)]
+        results = await asyncio.gather(*(batcher.submit(t) for t in tensors))
+        await batcher.stop()
+        return results
+
+    results = asyncio.run(scenario())
+    assert calls == [5]
+    assert [round(r.confidence, 1) for r in results] == [0.0, 0.1, 0.2, 0.3, 0.4]
+    stats = batcher.stats()
+    assert stats["total_requests"] == 5
+    assert stats["batch_size_histogram"] == {"5": 1}
+
+
+def test_batch_is_capped_at_max_batch_size():
+    """测试单批不会超过 max_batch_size"""
+    calls = []
+    batcher = InferenceBatcher(_fake_predict_batch(calls), max_batch_size=2, max_wait_ms=50)
+
+    async def scenario():
+        await asyncio.gather(*(batcher.submit(torch.zeros(1, 3, 4, 4)) for _ in range(5)))
+        await batcher.stop()
+
+    asyncio.run(scenario())
+    assert calls == [2, 2, 1]
+
+
+def test_failure_is_propagated_to_every_request():
+    """测试批量推理失败时，批次内所有请求都会收到异常而不是一直挂起"""
+    def broken(image_batch):
+        raise RuntimeError("boom")
+
+    batcher = InferenceBatcher(broken, max_batch_size=4, max_wait_ms=5)
+
+    async def scenario():
+        results = await asyncio.gather(
+            *(batcher.submit(torch.zeros(1, 3, 4, 4)) for _ in range(3)),
+            return_exceptions=True,
+        )
+        await batcher.stop()
+        return results
+
+    results = asyncio.run(scenario())
+    assert all(isinstance(r, RuntimeError) for r in results)
+
+
+def test_stop_fails_requests_in_flight_and_being_collected():
+    """测试 stop() 让正在推理的批次、正在攒批的请求以及仍在排队的请求全部失败返回，不会挂起"""
+    import threading
+
+    started, release = threading.Event(), threading.Event()
+
+    def slow(image_batch):
+        started.set()
+        release.wait(5)
+        return [PredictionResult(disease="Footrot", confidence=1.0) for _ in image_batch]
+
+    batcher = InferenceBatcher(slow, max_batch_size=2, max_wait_ms=1000)
+
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        running = [asyncio.ensure_future(batcher.submit(torch.zeros(1, 3, 4, 4))) for _ in range(2)]
+        await loop.run_in_executor(None, started.wait)
+        # 推理期间到达的请求停留在队列中
+        queued = asyncio.ensure_future(batcher.submit(torch.zeros(1, 3, 4, 4)))
+        await asyncio.sleep(0.01)
+        await batcher.stop()
+        results = await asyncio.wait_for(asyncio.gather(*running, queued, return_exceptions=True), 1)
+        release.set()
+        return results
+
+    results = asyncio.run(scenario())
+    assert len(results) == 3 and all(isinstance(r, RuntimeError) for r in results)
+
+
+def test_stop_fails_requests_dequeued_while_collecting_a_batch():
+    """测试 stop() 让已从队列取出、仍在等待攒满一批的请求失败返回"""
+    batcher = InferenceBatcher(_fake_predict_batch([]), max_batch_size=4, max_wait_ms=10000)
+
+    async def scenario():
+        request = asyncio.ensure_future(batcher.submit(torch.zeros(1, 3, 4, 4)))
+        await asyncio.sleep(0.05)
+        await batcher.stop()
+        return await asyncio.wait_for(asyncio.gather(request, return_exceptions=True), 1)
+
+    assert isinstance(asyncio.run(scenario())[0], RuntimeError)
@@ -0,0 +1,147 @@
+# tests/test_knowledge_base_service.py
+import asyncio
+import os
+
+from app.services.knowledge_base_service import KnowledgeBaseService
+
+FOOTROT = """
+Footrot:
+  name:
+    en: "Foot Rot (Phytophthora Blight)"
+    zh: "根腐病"
+  summary:
+    en: "Foot rot summary."
+"""
+
+BLIGHT = """
+black_pepper_leaf_blight:
+  name:
+    en: "Leaf Blight"
+    ms: "Hawar Daun"
+"""
+
+
+def _touch(path, content):
+    path.write_text(content, encoding="utf-8")
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))  # 确保 mtime 一定变化
+
+
+def test_incremental_reload_swaps_snapshot_and_notifies_listeners(tmp_path, monkeypatch):
+    """测试只重新解析修改过的文件，未变化时不重建快照；旧快照保持不变，监听者收到通知"""
+    _touch(tmp_path / "a.yaml", FOOTROT)
+    _touch(tmp_path / "b.yaml", BLIGHT)
+    service = KnowledgeBaseService(tmp_path)
+    notified = []
+    service.add_reload_listener(lambda: notified.append(service.version))
+
+    parsed = []
+    original_parse = service._parse_file
+    monkeypatch.setattr(service, "_parse_file", lambda path: parsed.append(path.name) or original_parse(path))
+
+    old_snapshot = service.snapshot
+    assert service.reload_knowledge_base() is False and notified == []
+
+    _touch(tmp_path / "b.yaml", BLIGHT.replace("Leaf Blight", "Leaf Blight v2"))
+    assert service.reload_knowledge_base() is True
+    assert parsed == ["b.yaml"] and notified == [service.version]
+    assert service.get_disease_info("black_pepper_leaf_blight")["name"]["en"] == "Leaf Blight v2"
+    assert old_snapshot.diseases["black_pepper_leaf_blight"]["name"]["en"] == "Leaf Blight"
+
+    (tmp_path / "a.yaml").unlink()
+    assert service.reload_knowledge_base() is True
+    assert service.get_disease_info("Footrot") is None and list(service.knowledge_base) == ["black_pepper_leaf_blight"]
+
+
+def test_alias_and_language_indexes():
+    """测试按标准化 key / 本地化名称查找，以及按语言的索引"""
+    service = KnowledgeBaseService.__new__(KnowledgeBaseService)
+    service._snapshot = KnowledgeBaseService._build_snapshot({
+        "Footrot": {"name": {"en": "Foot Rot (Phytophthora Blight)", "zh": "根腐病"}, "summary": {"en": "Foot rot summary."}},
+        "Slow-Decline": {"name": {"en": "Slow-Decline (Yellows Disease)"}},
+    }, version=1)
+
+    assert service.get_disease_info("footrot")["summary"]["en"] == "Foot rot summary."
+    assert service.resolve_key("slow_decline") == "Slow-Decline"
+    assert service.resolve_key("Foot Rot (Phytophthora Blight)") == "Footrot"
+    assert service.resolve_key("根腐病") == "Footrot"
+    assert service.resolve_key("unknown") is None
+    assert service.get_localized("Footrot", "zh") == {"name": "根腐病", "summary": ""}
+    assert service.get_localized("Footrot", "ms") is None
+    assert service.diseases_in_language("en") == ["Footrot", "Slow-Decline"]
+
+
+def test_watcher_picks_up_new_files(tmp_path):
+    """测试后台监视任务发现新增的 YAML 文件并自动重新加载"""
+    _touch(tmp_path / "a.yaml", FOOTROT)
+    service = KnowledgeBaseService(tmp_path, watch_interval=0.02)
+
+    async def scenario():
+        await service.start()
+        _touch(tmp_path / "b.yaml", BLIGHT)
+        for _ in range(100):
+            if service.get_disease_info("black_pepper_leaf_blight"):
+                break
+            await asyncio.sleep(0.02)
+        await service.close()
+
+    asyncio.run(scenario())
+    assert service.get_disease_info("Leaf Blight") is not None
+
+
+def test_compiled_cache_is_reused_until_source_hash_changes(tmp_path, monkeypatch):
+    """测试 YAML 编译为 JSON 缓存后，新进程直接读取缓存；源文件内容变化时才重新解析 YAML"""
+    kb_dir, compiled_dir = tmp_path / "kb", tmp_path / "compiled"
+    kb_dir.mkdir()
+    _touch(kb_dir / "a.yaml", FOOTROT)
+    first = KnowledgeBaseService(kb_dir, compiled_dir=compiled_dir)
+    assert [path.name.split("-")[0] for path in compiled_dir.glob("*.json")] == ["a"]
+
+    yaml_loads = []
+    import app.services.knowledge_base_service as module
+    original_load = module.yaml.load
+    monkeypatch.setattr(module.yaml, "load", lambda *args, **kwargs: yaml_loads.append(1) or original_load(*args, **kwargs))
+
+    second = KnowledgeBaseService(kb_dir, compiled_dir=compiled_dir)
+    assert yaml_loads == [] and dict(second.knowledge_base) == dict(first.knowledge_base)
+
+    _touch(kb_dir / "a.yaml", FOOTROT.replace("Foot rot summary.", "Updated."))
+    third = KnowledgeBaseService(kb_dir, compiled_dir=compiled_dir)
+    assert yaml_loads == [1] and third.get_disease_info("Footrot")["summary"]["en"] == "Updated."
+    assert KnowledgeBaseService(kb_dir, compiled_dir=compiled_dir).compile_all() == 1 and yaml_loads == [1]
+    assert third.compile_all(force=True) == 1 and yaml_loads == [1, 1]
+
+
+def test_compiled_cache_is_keyed_by_source_path(tmp_path):
+    """测试同名 YAML 位于不同 kb_path 时各自使用独立的编译缓存，不会覆盖彼此 (例如仓库中的缓存)"""
+    compiled_dir = tmp_path / "compiled"
+    for name, text in (("repo", FOOTROT), ("other", FOOTROT.replace("Foot rot summary.", "Other."))):
+        (tmp_path / name).mkdir()
+        _touch(tmp_path / name / "pepper.yaml", text)
+
+    repo = KnowledgeBaseService(tmp_path / "repo", compiled_dir=compiled_dir)
+    other = KnowledgeBaseService(tmp_path / "other", compiled_dir=compiled_dir)
+    assert len(list(compiled_dir.glob("pepper-*.json"))) == 2
+    assert repo._compiled_path(tmp_path / "repo" / "pepper.yaml") != other._compiled_path(tmp_path / "other" / "pepper.yaml")
+    assert KnowledgeBaseService(tmp_path / "repo", compiled_dir=compiled_dir).get_disease_info("Footrot")["summary"]["en"] \
+        == repo.get_disease_info("Footrot")["summary"]["en"] != other.get_disease_info("Footrot")["summary"]["en"]
+
+
+def test_malformed_yaml_keeps_previous_entries_until_fixed(tmp_path):
+    """测试文件被写坏 (语法错误或顶层不是映射) 时继续提供上一份快照中的条目，修复后下一次扫描重新解析"""
+    _touch(tmp_path / "a.yaml", FOOTROT)
+    _touch(tmp_path / "b.yaml", BLIGHT)
+    service = KnowledgeBaseService(tmp_path, compiled_dir=tmp_path / "compiled")
+    version = service.version
+
+    _touch(tmp_path / "b.yaml", "black_pepper_leaf_blight:\n  name: [unclosed\n")
+    assert service.reload_knowledge_base() is False and service.version == version
+    assert service.get_disease_info("black_pepper_leaf_blight")["name"]["en"] == "Leaf Blight"
+
+    _touch(tmp_path / "b.yaml", "- just\n- a list\n")
+    assert service.reload_knowledge_base() is False
+    assert sorted(service.knowledge_base) == ["Footrot", "black_pepper_leaf_blight"]
+
+    _touch(tmp_path / "b.yaml", BLIGHT.replace("Leaf Blight", "Leaf Blight v2"))
+    assert service.reload_knowledge_base() is True
+    assert service.get_disease_info("black_pepper_leaf_blight")["name"]["en"] == "Leaf Blight v2"
@@ -0,0 +1,68 @@
+# tests/test_knowledge_index.py
+import numpy as np
+
+from app.services.knowledge_base_service import kb_service
+from app.services.knowledge_index_service import KB_PATH, KnowledgeIndex, iter_kb_passages
+
+
+def _encode(texts):
+    """确定性的伪编码器：按字符哈希生成向量，测试无需训练好的 NLG 模型。"""
+    vectors = np.zeros((len(texts), 32), dtype=np.float32)
+    for i, text in enumerate(texts):
+        for word in text.lower().split():
+            vectors[i, sum(map(ord, word)) % 32] += 1.0
+    return vectors
+
+
+def test_index_is_built_per_language_and_loaded_with_mmap(tmp_path):
+    """测试索引覆盖知识库中所有语言的段落，按语言连续存放并以 mmap 方式加载"""
+    index = KnowledgeIndex.build(kb_service.knowledge_base, _encode, tmp_path, kb_path=KB_PATH)
+    passages = list(iter_kb_passages(kb_service.knowledge_base))
+
+    assert index.available and len(index.entries) == len(passages)
+    assert isinstance(index.matrix, np.memmap)
+    assert set(index.lang_ranges) == {"en", "ms", "zh"}
+    for lang, (start, end) in index.lang_ranges.items():
+        assert all(entry["lang"] == lang for entry in index.entries[start:end])
+    assert np.allclose(np.linalg.norm(index.matrix, axis=1), 1.0, atol=1e-5)
+    assert not index.is_stale(KB_PATH)
+
+    reloaded = KnowledgeIndex(tmp_path)
+    assert reloaded.load() and reloaded.entries == index.entries
+    assert not KnowledgeIndex(tmp_path / "missing").load()
+
+
+def test_search_matches_brute_force_ranking(tmp_path):
+    """测试 top-k 检索结果与逐条计算余弦相似度的排序一致，并支持按字段和病害过滤"""
+    index = KnowledgeIndex.build(kb_service.knowledge_base, _encode, tmp_path)
+    query = _encode(["improve soil drainage and remove infected plants"])[0]
+
+    hits = index.search(query, "en", k=3, field="treatment", exclude_disease="Footrot")
+
+    candidates = [e for e in index.entries if e["lang"] == "en" and e["field"] == "treatment" and e["disease"] != "Footrot"]
+    scores = [float(_encode([e["text"]])[0] @ query / (np.linalg.norm(_encode([e["text"]])[0]) * np.linalg.norm(query)))
+              for e in candidates]
+    expected = sorted(zip(scores, range(len(candidates))), key=lambda pair: -pair[0])[:3]
+    assert [hit["text"] for hit in hits] == [candidates[i]["text"] for _, i in expected]
+    assert np.allclose([hit["score"] for hit in hits], [score for score, _ in expected], atol=1e-5)
+    assert index.search(query, "en", k=3, min_score=1.01) == []
+    assert index.search(query, "fr") == []
+
+
+def test_refresh_pauses_search_until_index_is_rebuilt_after_kb_change(tmp_path):
+    """测试知识库修改后 refresh 把索引标记为过期并暂停检索，重建索引后 refresh 重新启用"""
+    kb_dir, index_dir = tmp_path / "kb", tmp_path / "index"
+    kb_dir.mkdir()
+    (kb_dir / "pepper.yaml").write_bytes((KB_PATH / "pepper.yaml").read_bytes())
+    KnowledgeIndex.build(kb_service.knowledge_base, _encode, index_dir, kb_path=kb_dir)
+    index = KnowledgeIndex(index_dir)
+    query = _encode(["leaves turn yellow"])[0]
+    assert index.refresh(kb_dir) and index.search(query, "en")
+
+    with open(kb_dir / "pepper.yaml", "a", encoding="utf-8") as f:
+        f.write("\n# edited\n")
+    assert not index.refresh(kb_dir)
+    assert index.stale and index.search(query, "en") == []
+
+    KnowledgeIndex.build(kb_service.knowledge_base, _encode, index_dir, kb_path=kb_dir)
+    assert index.refresh(kb_dir) and not index.stale
@@ -0,0 +1,50 @@
+# tests/test_load_test.py
+import asyncio
+
+from app.bench.fake_servers import FakeWebSearchServer
+from app.bench.load_test import compare, percentile, summarize_latencies
+from app.services.web_reference_service import WebReferenceService
+
+
+def test_latency_percentiles_use_nearest_rank():
+    """测试 p50/p95/p99 采用最近秩百分位数，空样本返回 None"""
+    latencies = [float(v) for v in range(100, 0, -1)]
+    summary = summarize_latencies(latencies)
+    assert (summary["p50"], summary["p95"], summary["p99"], summary["max"]) == (50.0, 95.0, 99.0, 100.0)
+    assert summary["mean"] == 50.5
+    assert percentile([7.0], 99) == 7.0
+    assert summarize_latencies([])["p95"] is None
+
+
+def test_compare_flags_latency_and_throughput_regressions():
+    """测试与基线比较：p95 超过容差 + 绝对余量或吞吐明显下降时记为回归，新增的场景不参与比较"""
+    def result(scenario, concurrency, p95, rps):
+        return {"scenario": scenario, "concurrency": concurrency, "throughput_rps": rps,
+                "latency_ms": {"p50": None, "p95": p95, "p99": None}}
+
+    baseline = {"scenarios": [result("diagnose", 4, 200.0, 10.0), result("posts_read", 4, 2.0, 500.0)]}
+    report = {"scenarios": [
+        result("diagnose", 4, 300.0, 7.0),   # 两项都回归
+        result("posts_read", 4, 6.0, 480.0),  # 快速路由的抖动在绝对余量内
+        result("chat", 4, 50.0, 10.0),        # 基线中没有
+    ]}
+    regressions = compare(report, baseline, tolerance=0.2)
+    assert [(r["scenario"], r["metric"]) for r in regressions] == [("diagnose", "p95_ms"), ("diagnose", "throughput_rps")]
+
+
+def test_fake_web_search_server_feeds_web_reference_service(tmp_path):
+    """测试网络搜索替身返回 DuckDuckGo 格式的跳转链接，WebReferenceService 能离线完成搜索与文章抓取"""
+    with FakeWebSearchServer(results=2) as server:
+        service = WebReferenceService(cache_dir=tmp_path, search_url=server.url)
+
+        async def scenario():
+            await service.start()
+            try:
+                return await service.get_summaries("Foot_Rot", "en", lambda name, articles: articles)
+            finally:
+                await service.close()
+
+        articles = asyncio.run(scenario())
+        assert server.request_count == 3  # 一次搜索 + 两篇文章
+    assert len(articles) == 2
+    assert "copper based fungicide to treat Foot Rot" in articles[0]
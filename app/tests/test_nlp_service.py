@@ -0,0 +1,57 @@
+# tests/test_nlp_service.py
+import json
+
+from app.services import nlp_service as nlp_module
+from app.services.nlp_service import NlpService, train_pipeline
+
+TRAINING_DATA = [
+    {"text": "dark spots appear on the leaves", "label": "symptom"},
+    {"text": "leaves turn yellow and wilt", "label": "symptom"},
+    {"text": "apply copper fungicide every two weeks", "label": "treatment"},
+    {"text": "remove and burn infected plants", "label": "treatment"},
+    {"text": "subscribe to our newsletter", "label": "other"},
+    {"text": "read our privacy policy", "label": "other"},
+]
+
+
+def test_saved_model_is_loaded_lazily_and_retrained_when_data_changes(tmp_path, monkeypatch):
+    """测试导入/构造时不训练；首次使用时加载已保存的模型，训练数据变化后才重新训练"""
+    data_path, model_path = tmp_path / "data.json", tmp_path / "clf.joblib"
+    data_path.write_text(json.dumps(TRAINING_DATA), encoding="utf-8")
+    train_pipeline(data_path, model_path)
+
+    trained = []
+    original_train = nlp_module.train_pipeline
+    monkeypatch.setattr(nlp_module, "train_pipeline", lambda *args: trained.append(args) or original_train(*args))
+
+    service = NlpService(model_path, data_path)
+    assert service._pipeline is None
+    assert service.extract_key_info("dark spots appear on the leaves\napply copper fungicide") == {
+        "symptoms": ["dark spots appear on the leaves"], "treatments": ["apply copper fungicide"],
+    }
+    assert trained == []
+
+    data_path.write_text(json.dumps(TRAINING_DATA + [{"text": "spray fungicide", "label": "treatment"}]), encoding="utf-8")
+    NlpService(model_path, data_path).pipeline
+    assert len(trained) == 1
+
+
+def test_extract_key_info_many_uses_a_single_predict(tmp_path):
+    """测试批量接口只调用一次 predict，并按文档正确拆分结果"""
+    data_path = tmp_path / "data.json"
+    data_path.write_text(json.dumps(TRAINING_DATA), encoding="utf-8")
+    service = NlpService(tmp_path / "clf.joblib", data_path)
+    calls = []
+    pipeline = service.pipeline
+    original_predict = pipeline.predict
+    pipeline.predict = lambda sentences: calls.append(len(sentences)) or original_predict(sentences)
+
+    docs = ["leaves turn yellow and wilt\nread our privacy policy", "", "remove and burn infected plants\n\n"]
+    results = service.extract_key_info_many(docs)
+
+    assert calls == [3]
+    assert results == [
+        {"symptoms": ["leaves turn yellow and wilt"], "treatments": []},
+        {"symptoms": [], "treatments": []},
+        {"symptoms": [], "treatments": ["remove and burn infected plants"]},
+    ]
@@ -0,0 +1,126 @@
+# tests/test_recommendation_generator.py
+import torch
+
+from app.models.recommendation_generator import AdvancedNLGGenerator, SentenceEncoder
+
+WORDS = ["<PAD>", "<UNK>", "foot", "rot", "pepper", "leaf", "spots", "treatment", "soil", "drainage", "fungus", "yellow"]
+
+
+def _generator():
+    torch.manual_seed(0)
+    generator = AdvancedNLGGenerator()
+    generator.device = torch.device("cpu")
+    generator.word_to_idx = {word: i for i, word in enumerate(WORDS)}
+    generator.embedding_model = SentenceEncoder(len(WORDS), 16, 24).eval()
+    return generator
+
+
+def test_batched_embeddings_match_single_sentence_forward():
+    """测试补齐 + 打包后的批量编码与逐句调用 forward 的结果一致，重复句子命中 LRU 缓存"""
+    generator = _generator()
+    sentences = ["foot rot", "pepper leaf yellow spots fungus", "soil drainage treatment for pepper foot rot", "unknown words", ""]
+
+    batched = generator._get_embeddings(sentences + sentences[:2])
+    with torch.no_grad():
+        # 空句子按单个 <PAD> 编码
+        expected = [generator.embedding_model(generator._sentence_to_tensor(s) if s else torch.zeros(1, dtype=torch.long))[0]
+                    for s in sentences]
+
+    assert batched.shape == (7, 24)
+    for i, vector in enumerate(expected):
+        assert torch.allclose(batched[i], vector, atol=1e-5)
+    assert torch.equal(batched[5], batched[0]) and len(generator._embedding_cache) == 5
+
+    generator.EMBEDDING_CACHE_MAX_ENTRIES = 2
+    generator._get_embeddings(["leaf spots"])
+    assert list(generator._embedding_cache) == ["", "leaf spots"]
+
+
+def test_summarize_articles_picks_most_similar_sentence_per_article():
+    """测试向量化排序与逐句计算余弦相似度选出的句子相同"""
+    generator = _generator()
+    articles = [
+        "Foot rot of pepper spreads quickly when soil drainage is poor after heavy rain. "
+        "Yellow leaf spots often appear on older pepper leaf tissue in the wet season. Short.",
+        "Nothing long enough here.",
+        "Treatment for pepper fungus includes improving soil drainage around every vine stem. "
+        "Remove and burn any pepper leaf showing yellow spots to limit the fungus spread.",
+    ]
+
+    summaries = generator.summarize_articles("Foot_Rot", articles)
+
+    query = generator._get_embedding("Foot Rot")[0]
+    expected = []
+    for i, text in enumerate(articles):
+        sentences = [s.strip() for s in text.split('.') if len(s.strip()) > 50]
+        if sentences:
+            scores = [torch.nn.functional.cosine_similarity(query, generator._get_embedding(s)[0], dim=0).item() for s in sentences]
+            expected.append(f"参考资料 #{i+1}: {sentences[scores.index(max(scores))]}.")
+    assert summaries == expected and len(summaries) == 2
+
+
+def test_report_templates_render_expected_text_and_follow_kb_reloads(tmp_path, monkeypatch):
+    """测试预编译模板生成的报告文本与逐项拼接一致；知识库重新加载后模板随之更新"""
+    from app.schemas.diagnosis import PredictionResult, RiskAssessment
+    from app.services.knowledge_base_service import kb_service
+
+    generator = AdvancedNLGGenerator()
+    generator.embedding_model = None  # 关闭检索补充，只比较模板部分
+    assert generator.compile_templates not in kb_service._reload_listeners  # 只有全局实例自动注册
+    info = kb_service.get_disease_info("Footrot")
+    report = generator.generate(PredictionResult(disease="Footrot", confidence=0.9132),
+                                RiskAssessment(risk_score=7.25, risk_level="High"), lang="ms")
+
+    assert report.title == f"Laporan Diagnosis Kesihatan Tanaman ({info['name']['ms']})"
+    assert report.diagnosis_summary == f"Diagnosis: {info['summary']['ms']} (Keyakinan Model: 91.32%)"
+    assert report.environmental_context == ("Analisis Risiko Persekitaran: Risiko High (Skor: 7.2/10). "
+                                            "Keadaan semasa sangat sesuai untuk penyakit.")
+    first_step = info["treatments"][0]["steps"][0]["ms"]
+    assert report.management_suggestion.startswith("【Cadangan Teras (来自本地知识库)】:")
+    assert f"1. {first_step}" in report.management_suggestion
+    assert ("Footrot", "zh", "Low") in generator._templates
+
+    (tmp_path / "pepper.yaml").write_text(
+        "Footrot:\n  name:\n    en: Foot Rot v2\n  summary:\n    en: Updated summary.\n", encoding="utf-8")
+    monkeypatch.setattr(kb_service, "kb_path", tmp_path)
+    monkeypatch.setattr(kb_service, "compiled_dir", tmp_path / "compiled")
+    kb_service.add_reload_listener(generator.compile_templates)
+    try:
+        kb_service.reload_knowledge_base()
+        updated = generator.generate(PredictionResult(disease="Footrot", confidence=0.9),
+                                     RiskAssessment(risk_score=2.0, risk_level="Low"), lang="en")
+        assert updated.title == "Crop Health Diagnosis Report (Foot Rot v2)"
+        assert not any(key[0] == "Pollu_Disease" for key in generator._templates)
+    finally:
+        monkeypatch.undo()
+        kb_service.reload_knowledge_base()
+        kb_service.remove_reload_listener(generator.compile_templates)
+    assert any(key[0] == "Pollu_Disease" for key in generator._templates)
+    assert generator.compile_templates not in kb_service._reload_listeners
+
+
+def test_similar_conditions_list_only_other_disease_summaries(tmp_path, monkeypatch):
+    """测试没有网络参考时，检索补充只列出其他病害的症状描述 (单独标注)，不混入其他病害的防治措施"""
+    from app.config import settings
+    from app.models import recommendation_generator
+    from app.schemas.diagnosis import PredictionResult, RiskAssessment
+    from app.services.knowledge_base_service import kb_service
+    from app.services.knowledge_index_service import KnowledgeIndex, iter_kb_passages
+
+    generator = _generator()
+    index = KnowledgeIndex.build(kb_service.knowledge_base, lambda texts: generator._get_embeddings(texts).numpy(), tmp_path)
+    monkeypatch.setattr(recommendation_generator, "kb_index", index)
+    monkeypatch.setattr(settings, "KB_INDEX_MIN_SCORE", -1.0)
+
+    report = generator.generate(PredictionResult(disease="Footrot", confidence=0.9),
+                                RiskAssessment(risk_score=5.0, risk_level="Medium"), lang="en")
+
+    header = "【Similar Conditions (for comparison only, not treatment advice) (本地知识索引)】:"
+    assert header in report.management_suggestion
+    listed = report.management_suggestion.split(header)[1].strip().splitlines()
+    summaries = {f"- {kb_service.get_disease_info(key)['name']['en']}: {info['summary']['en']}"
+                 for key, info in kb_service.knowledge_base.items() if key != "Footrot" and info.get("summary", {}).get("en")}
+    assert len(listed) == settings.KB_INDEX_TOP_K and set(listed) <= summaries
+    other_steps = [p["text"] for p in iter_kb_passages(kb_service.knowledge_base)
+                   if p["field"] == "treatment" and p["disease"] != "Footrot" and p["lang"] == "en"]
+    assert not any(step in report.management_suggestion for step in other_steps)
@@ -1,4 +1,7 @@
 # tests/test_risk_assessor.py
+import numpy as np
+import pytest
+
 from app.models.risk_assessor import risk_assessor
 
 def test_high_risk_scenario():
@@ -15,4 +18,18 @@ def test_low_risk_scenario():
     humidity = 50.0
     result = risk_assessor.assess(temp, humidity)
     assert result.risk_level == "Low"
-    assert result.risk_score < 4.0
\ No newline at end of file
+    assert result.risk_score < 4.0
+
+
+@pytest.mark.filterwarnings("ignore::DeprecationWarning")
+def test_compiled_grid_matches_skfuzzy():
+    """测试预计算网格 + 双线性插值的结果与 skfuzzy 精确推理的偏差足够小"""
+    rng = np.random.default_rng(0)
+    temps = rng.uniform(10.0, 45.0, 500)  # 包含超出论域的值，检验截断行为
+    hums = rng.uniform(35.0, 105.0, 500)
+    compiled = risk_assessor.score_many(temps, hums)
+    exact = np.array([risk_assessor.compute_exact(t, h) for t, h in zip(temps, hums)])
+    deviation = np.abs(compiled - exact)
+    assert deviation.max() < 0.15
+    assert deviation.mean() < 0.01
+    assert [r.risk_level for r in risk_assessor.assess_many([35.0, 20.0], [95.0, 50.0])] == ["High", "Low"]
@@ -0,0 +1,61 @@
+# tests/test_service_registry.py
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app.utils.service_registry import ServiceRegistry
+
+
+def test_services_load_once_on_first_use_and_report_timings():
+    """测试子系统在第一次访问时才初始化，并发访问只初始化一次，并记录加载耗时与失败原因"""
+    calls = []
+
+    def slow_model():
+        calls.append(threading.get_ident())
+        time.sleep(0.05)
+        return object()
+
+    registry = ServiceRegistry()
+    registry.register("model", slow_model)
+    registry.register("broken", lambda: 1 / 0)
+    assert calls == [] and not registry.is_loaded("model")
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(registry.model)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1 and all(result is results[0] for result in results)
+    with pytest.raises(ZeroDivisionError):
+        registry.get("broken")
+    stats = registry.stats()["subsystems"]
+    assert stats["model"]["status"] == "ready" and stats["model"]["load_seconds"] >= 0.05
+    assert stats["broken"]["status"] == "failed" and "ZeroDivisionError" in stats["broken"]["error"]
+    assert registry.ready(["model"]) and not registry.ready()
+
+
+def test_warm_up_loads_in_background_without_blocking_the_event_loop():
+    """测试后台预热不阻塞事件循环，失败的子系统不影响其他子系统，并执行加载后的回调"""
+    registry = ServiceRegistry()
+    registry.register("slow", lambda: time.sleep(0.2) or "slow")
+    registry.register("broken", lambda: 1 / 0)
+    registry.register("fast", lambda: "fast")
+    compiled = []
+
+    async def scenario():
+        task = asyncio.create_task(registry.warm_up(["slow", "broken", "fast"], after_load={"fast": compiled.append}))
+        ticks = 0
+        while not task.done():
+            ticks += 1
+            await asyncio.sleep(0.01)
+        await registry.ensure(["fast"])
+        return ticks
+
+    ticks = asyncio.run(scenario())
+    assert ticks >= 10  # 预热期间事件循环持续运行
+    assert compiled == ["fast"] and registry.ready(["slow", "fast"]) and not registry.is_loaded("broken")
+    assert registry.stats()["warmup_seconds"] >= 0.2
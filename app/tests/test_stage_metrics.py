@@ -0,0 +1,91 @@
+# tests/test_stage_metrics.py
+import asyncio
+
+import pytest
+
+from app.utils.stage_metrics import StageMetrics
+
+
+def test_spans_feed_histograms_and_prometheus_text():
+    """测试每个阶段的耗时计入对应标签的直方图，并以 Prometheus 文本格式输出累积桶、总和与次数"""
+    metrics = StageMetrics(buckets=(0.01, 1.0))
+    metrics.stage_seconds.observe(("forward",), 0.005)
+    metrics.stage_seconds.observe(("forward",), 0.5)
+    metrics.stage_seconds.observe(("forward",), 5.0)
+    with metrics.span("report"):
+        pass
+
+    text = metrics.render_prometheus()
+    assert "# TYPE pipeline_stage_seconds histogram" in text
+    assert 'pipeline_stage_seconds_bucket{stage="forward",le="0.01"} 1' in text
+    assert 'pipeline_stage_seconds_bucket{stage="forward",le="1.0"} 2' in text
+    assert 'pipeline_stage_seconds_bucket{stage="forward",le="+Inf"} 3' in text
+    assert 'pipeline_stage_seconds_count{stage="forward"} 3' in text
+    assert 'pipeline_stage_seconds_count{stage="report"} 1' in text
+    assert metrics.stats()["stages"]["forward"]["sum_seconds"] == pytest.approx(5.505)
+
+
+def test_sampled_trace_collects_spans_from_awaited_helpers():
+    """测试被采样的请求保留明细：被 await 的辅助函数中的阶段通过 contextvar 归入同一请求"""
+    metrics = StageMetrics(sample_rate=0.0)
+
+    async def helper():
+        with metrics.span("report"):
+            await asyncio.sleep(0)
+
+    async def request(sample):
+        with metrics.trace("diagnose", sample=sample) as trace:
+            with metrics.span("forward"):
+                await asyncio.sleep(0)
+            await helper()
+            trace.attributes["cache_hit"] = False
+
+    asyncio.run(request(sample=True))
+    asyncio.run(request(sample=None))  # sample_rate=0: 只计入直方图
+
+    traces = metrics.recent_traces()
+    assert len(traces) == 1
+    assert [span["stage"] for span in traces[0]["spans"]] == ["forward", "report"]
+    assert traces[0]["outcome"] == "ok" and traces[0]["attributes"] == {"cache_hit": False}
+    assert metrics.stats()["stages"]["forward"]["count"] == 2
+    assert 'pipeline_request_seconds_count{pipeline="diagnose",outcome="ok"} 2' in metrics.render_prometheus()
+
+
+def test_failed_stage_is_recorded_and_trace_marked_as_error():
+    """测试阶段抛出异常时仍记录耗时，span 标注异常类型，请求以 outcome=error 计入"""
+    metrics = StageMetrics()
+    with pytest.raises(ValueError):
+        with metrics.trace("diagnose", sample=True):
+            with metrics.span("decode_preprocess"):
+                raise ValueError("corrupt image")
+
+    trace = metrics.recent_traces()[0]
+    assert trace["outcome"] == "error"
+    assert trace["spans"] == [dict(trace["spans"][0], stage="decode_preprocess", error="ValueError")]
+    assert 'pipeline_request_seconds_count{pipeline="diagnose",outcome="error"} 1' in metrics.render_prometheus()
+
+    # 请求结束后 (例如延迟生成的热力图) 才完成的阶段只计入直方图，不改写已结束的明细
+    with metrics.span("decode_preprocess"):
+        pass
+    assert len(metrics.recent_traces()[0]["spans"]) == 1
+
+
+def test_weather_dependency_called_inside_trace_records_span(monkeypatch):
+    """测试 /diagnose 在 trace 内调用天气依赖时，weather 阶段出现在该请求的明细中"""
+    from app import dependencies
+
+    metrics = StageMetrics(sample_rate=1.0)
+    monkeypatch.setattr(dependencies, "stage_metrics", metrics)
+
+    async def fake_weather(latitude, longitude):
+        return {"temperature": 30.0, "humidity": 80.0, "source": "live"}
+
+    monkeypatch.setattr(dependencies.weather_service, "get_current_weather", fake_weather)
+
+    async def request():
+        with metrics.trace("diagnose") as trace:
+            await dependencies.get_weather_data(3.1, 101.7)
+        return trace
+
+    trace = asyncio.run(request())
+    assert [span["stage"] for span in trace.spans] == ["weather"]
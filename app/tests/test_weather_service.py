@@ -0,0 +1,155 @@
+# tests/test_weather_service.py
+import asyncio
+
+import httpx
+
+from app.bench.fake_servers import FakeOpenMeteoServer, fake_location_weather
+from app.services.weather_service import WeatherService
+from app.services.weather_snapshot_store import WeatherSnapshotStore
+
+
+def test_nearby_requests_share_one_upstream_call():
+    """测试同一网格内的并发请求被合并为一次上游调用，之后命中缓存；失败结果不会被缓存"""
+    calls = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(dict(request.url.params))
+        await asyncio.sleep(0.05)
+        if float(request.url.params["latitude"]) < 0:
+            return httpx.Response(500)
+        return httpx.Response(200, json={"current": {"temperature_2m": 31.0, "relative_humidity_2m": 88}})
+
+    service = WeatherService(grid_degrees=0.1, transport=httpx.MockTransport(handler))
+
+    async def scenario():
+        await service.start()
+        farmers = [service.get_current_weather(1.55 + i * 0.0001, 110.33) for i in range(50)]
+        results = await asyncio.gather(*farmers)
+        again = await service.get_current_weather(1.56, 110.34)
+        failed = [await service.get_current_weather(-3.0, 100.0) for _ in range(2)]
+        await service.close()
+        return results, again, failed
+
+    results, again, failed = asyncio.run(scenario())
+    assert all(r == {"temperature": 31.0, "humidity": 88, "source": "live"} for r in results)
+    assert again == {"temperature": 31.0, "humidity": 88, "source": "cached"}
+    assert failed[0] == {"temperature": 28.0, "humidity": 75.0, "source": "default"}
+    assert len(calls) == 3  # 一次共享请求 + 两次失败的重试
+    assert calls[0]["latitude"] == "1.6" and calls[0]["longitude"] == "110.3"
+    assert service.stats()["coalesced"] == 49
+    assert service.stats()["hits"] == 1
+
+
+def test_bulk_forecast_batches_coordinates(open_meteo_stub):
+    """测试批量预报按 bulk_max_locations 分块请求上游，并按位置正确拆分结果"""
+    service = WeatherService(api_url=open_meteo_stub.url, grid_degrees=0.1, bulk_max_locations=50)
+    coordinates = [(1.0 + 0.1 * i, 110.0 + 0.1 * (i % 7)) for i in range(120)]
+
+    async def scenario():
+        await service.start()
+        forecasts = await service.get_7_day_forecast_many(coordinates + coordinates[:5])
+        single = await service.get_7_day_forecast(*coordinates[42])
+        current = await service.get_current_weather_many(coordinates[:3])
+        await service.close()
+        return forecasts, single, current
+
+    forecasts, single, current = asyncio.run(scenario())
+    assert open_meteo_stub.request_count == 3 + 1  # 120 个网格分 3 块，另加一次当前天气请求
+    assert len(forecasts) == 125 and forecasts[120:] == forecasts[:5]
+    assert single == forecasts[42]
+    expected = fake_location_weather(round(coordinates[42][0], 1), round(coordinates[42][1], 1), {"daily": ["1"]})
+    assert [day["temp_max"] for day in single] == expected["daily"]["temperature_2m_max"]
+    assert current[1]["temperature"] == fake_location_weather(1.1, 110.1, {"current": [""]})["current"]["temperature_2m"]
+
+
+def test_slow_upstream_serves_snapshot_then_default(tmp_path):
+    """测试上游变慢时：有本地快照则立即返回 cached 并在后台刷新，没有快照则在期限内返回 default"""
+    with FakeOpenMeteoServer() as fast:
+        warm = WeatherService(api_url=fast.url, snapshot_store=WeatherSnapshotStore(tmp_path / "weather.sqlite3"))
+
+        async def fill():
+            await warm.start()
+            result = await warm.get_current_weather(1.5, 110.3)
+            await warm.close()
+            return result
+
+        live = asyncio.run(fill())
+    assert live["source"] == "live"
+
+    with FakeOpenMeteoServer(latency_ms=500) as slow:
+        store = WeatherSnapshotStore(tmp_path / "weather.sqlite3")
+        cold = WeatherService(api_url=slow.url, snapshot_store=store, live_timeout=0.1)
+
+        async def scenario():
+            await cold.start()
+            cached = await cold.get_current_weather(1.5, 110.3)
+            unknown = await cold.get_current_weather(5.0, 115.0)
+            await asyncio.sleep(0.8)  # 等待后台重新验证完成
+            refreshed = await cold.get_current_weather(1.5, 110.3)
+            await cold.close()
+            return cached, unknown, refreshed
+
+        cached, unknown, refreshed = asyncio.run(scenario())
+    assert cached == {**live, "source": "cached"}
+    assert unknown["source"] == "default"
+    assert refreshed["source"] == "cached"
+    assert cold.stats()["deadline_exceeded"] == 1
+    assert cold.stats()["stale_served"] == 1 and cold.stats()["hits"] == 1  # 重新验证后命中的是内存缓存
+
+
+def test_close_cancels_inflight_chunks_and_does_not_reopen():
+    """测试关闭时取消进行中的上游请求，等待的调用方拿到 default；关闭后不会再懒加载新的 HTTP 客户端"""
+    async def handler(request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(5)
+        return httpx.Response(200, json={"current": {"temperature_2m": 31.0, "relative_humidity_2m": 88}})
+
+    service = WeatherService(transport=httpx.MockTransport(handler))
+
+    async def scenario():
+        await service.start()
+        waiting = asyncio.ensure_future(service.get_current_weather(1.5, 110.3))
+        await asyncio.sleep(0.05)
+        await service.close()
+        result = await asyncio.wait_for(waiting, timeout=1)
+        after = await service.get_current_weather(5.0, 115.0)
+        return result, after
+
+    result, after = asyncio.run(scenario())
+    assert result["source"] == "default" and after["source"] == "default"
+    assert service._client is None and not service._chunk_tasks and not service._inflight
+
+
+def test_snapshot_store_is_accessed_off_the_event_loop(tmp_path):
+    """测试快照库的查询、写入和关闭都通过 io_executor 在线程池中执行，不阻塞事件循环线程"""
+    import threading
+
+    threads = []
+
+    class RecordingStore(WeatherSnapshotStore):
+        def save(self, *args, **kwargs):
+            threads.append(("save", threading.get_ident()))
+            return super().save(*args, **kwargs)
+
+        def latest(self, *args, **kwargs):
+            threads.append(("latest", threading.get_ident()))
+            return super().latest(*args, **kwargs)
+
+        def close(self):
+            threads.append(("close", threading.get_ident()))
+            return super().close()
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, json={"current": {"temperature_2m": 31.0, "relative_humidity_2m": 88}})
+
+    service = WeatherService(transport=httpx.MockTransport(handler), snapshot_store=RecordingStore(tmp_path / "w.sqlite3"))
+
+    async def scenario():
+        await service.start()
+        result = await service.get_current_weather(1.5, 110.3)
+        await service.close()
+        return result, threading.get_ident()
+
+    result, loop_thread = asyncio.run(scenario())
+    assert result["source"] == "live"
+    assert [op for op, _ in threads] == ["latest", "save", "close"]
+    assert all(thread != loop_thread for _, thread in threads)
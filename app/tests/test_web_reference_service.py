@@ -0,0 +1,115 @@
+# tests/test_web_reference_service.py
+import asyncio
+
+import httpx
+
+from app.services.web_reference_service import WebReferenceService
+
+SEARCH_HTML = """
+<html><body>
+  <a class="result__a" href="/l/?uddg=https%3A%2F%2Fexample.org%2Fa">A</a>
+  <a class="result__a" href="https://example.org/b">B</a>
+</body></html>
+"""
+
+
+def _handler(calls, article_delay=0.0):
+    async def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(str(request.url))
+        if request.url.host == "search.test":
+            return httpx.Response(200, text=SEARCH_HTML)
+        await asyncio.sleep(article_delay)
+        return httpx.Response(200, text=f"<html><body><p>Article {request.url.path} about foot rot.</p></body></html>")
+    return handler
+
+
+def _summarize(disease_name, articles):
+    return [f"{disease_name}: {text}" for text in articles]
+
+
+def test_summaries_are_fetched_concurrently_and_cached_on_disk(tmp_path):
+    """测试搜索结果中的文章被并发下载并解析跳转链接；结果写入磁盘缓存，TTL 内不再访问外网"""
+    calls = []
+    service = WebReferenceService(cache_dir=tmp_path, search_url="https://search.test/html/",
+                                  transport=httpx.MockTransport(_handler(calls)))
+
+    async def scenario():
+        await service.start()
+        first = await asyncio.gather(*(service.get_summaries("Foot_Rot", "en", _summarize) for _ in range(5)))
+        again = await service.get_summaries("Foot_Rot", "en", _summarize)
+        await service.close()
+        return first, again
+
+    first, again = asyncio.run(scenario())
+    assert len(calls) == 3  # 一次搜索 + 两篇文章，五个并发请求共享一次抓取
+    assert "https://example.org/a" in calls
+    assert all(result == first[0] for result in first) and again == first[0]
+    assert len(first[0]) == 2 and "Article /a about foot rot." in first[0][0]
+    assert service.stats()["fetches"] == 1 and service.stats()["cache_hits"] == 1
+
+    reloaded = WebReferenceService(cache_dir=tmp_path)
+    assert reloaded.cached("Foot_Rot", "en") == first[0]
+    assert reloaded.cached("Foot_Rot", "zh") is None
+    assert WebReferenceService(cache_dir=tmp_path, ttl_seconds=-1).cached("Foot_Rot", "en") is None
+
+
+def test_wait_budget_returns_none_and_fetch_completes_in_background(tmp_path):
+    """测试等待超时时立即返回 None，抓取在后台继续并写入缓存；超过总期限的抓取被放弃且不缓存"""
+    service = WebReferenceService(cache_dir=tmp_path, search_url="https://search.test/html/",
+                                  transport=httpx.MockTransport(_handler([], article_delay=0.2)))
+
+    async def scenario():
+        await service.start()
+        immediate = await service.get_summaries("Foot_Rot", "en", _summarize, wait=0)
+        pending = service.is_pending("Foot_Rot", "en")
+        await asyncio.sleep(0.5)
+        await service.close()
+        return immediate, pending
+
+    immediate, pending = asyncio.run(scenario())
+    assert immediate is None and pending
+    assert len(service.cached("Foot_Rot", "en")) == 2
+
+    slow = WebReferenceService(cache_dir=tmp_path / "slow", search_url="https://search.test/html/", deadline=0.05,
+                               transport=httpx.MockTransport(_handler([], article_delay=1.0)))
+
+    async def slow_scenario():
+        await slow.start()
+        result = await slow.get_summaries("Foot_Rot", "en", _summarize)
+        await slow.close()
+        return result
+
+    assert asyncio.run(slow_scenario()) is None
+    assert not slow.is_pending("Foot_Rot", "en")
+    assert slow.cached("Foot_Rot", "en") is None and slow.stats()["failures"] == 1
+
+
+def test_disk_cache_is_read_and_written_off_the_event_loop(tmp_path):
+    """测试磁盘缓存的读取与写入都在 io_executor 线程中执行，不阻塞事件循环"""
+    import threading
+
+    threads = []
+
+    class RecordingService(WebReferenceService):
+        def cached(self, disease_name, lang):
+            threads.append(("cached", threading.get_ident()))
+            return super().cached(disease_name, lang)
+
+        def _write_cache(self, disease_name, lang, summaries):
+            threads.append(("write", threading.get_ident()))
+            return super()._write_cache(disease_name, lang, summaries)
+
+    service = RecordingService(cache_dir=tmp_path, search_url="https://search.test/html/",
+                               transport=httpx.MockTransport(_handler([])))
+
+    async def scenario():
+        await service.start()
+        first = await service.get_summaries("Foot_Rot", "en", _summarize)
+        again = await service.get_summaries("Foot_Rot", "en", _summarize)
+        await service.close()
+        return first, again, threading.get_ident()
+
+    first, again, loop_thread = asyncio.run(scenario())
+    assert first and again == first
+    assert [op for op, _ in threads] == ["cached", "write", "cached"]
+    assert all(thread != loop_thread for _, thread in threads)
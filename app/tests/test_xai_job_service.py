@@ -0,0 +1,35 @@
+# tests/test_xai_job_service.py
+import asyncio
+
+from app.services.xai_job_service import XaiJobService
+
+
+def test_deferred_job_reports_ready_and_failed():
+    """测试后台热力图任务完成后状态变为 ready 并触发回调，异常时变为 failed"""
+    service = XaiJobService(ttl_seconds=60)
+    done_urls = []
+
+    async def ok():
+        await asyncio.sleep(0.01)
+        return "/static/xai_images/xai_test.jpg"
+
+    async def broken():
+        raise RuntimeError("boom")
+
+    async def on_done(url):
+        done_urls.append(url)
+
+    async def scenario():
+        ok_id = service.submit(ok, on_done=on_done)
+        bad_id = service.submit(broken, job_id="fixed-id")
+        assert service.get(ok_id).status == "pending"
+        await asyncio.sleep(0.1)
+        return ok_id, bad_id
+
+    ok_id, bad_id = asyncio.run(scenario())
+    assert service.get(ok_id).status == "ready"
+    assert service.get(ok_id).xai_image_url == done_urls[0]
+    assert bad_id == "fixed-id"
+    assert service.get(bad_id).status == "failed"
+    assert service.get("unknown") is None
+    assert service.stats() == {"pending": 0, "ready": 1, "failed": 1}
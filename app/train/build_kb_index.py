@@ -0,0 +1,40 @@
+# train/build_kb_index.py
+# 使用训练好的 SentenceEncoder 预先编码知识库中所有语言的 summary / treatment 文本，
+# 生成报告生成器离线检索使用的向量索引 (mmap .npy + 元数据 JSON)。
+#
+# 用法 (在项目根目录运行，知识库或 NLG 模型更新后需重新运行):
+#   python -m app.train.build_kb_index
+import argparse
+import sys
+import time
+from pathlib import Path
+
+from app.config import settings
+from app.models.recommendation_generator import report_generator_v3
+from app.services.knowledge_base_service import kb_service
+from app.services.knowledge_index_service import BASE_DIR, KB_PATH, KnowledgeIndex
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Build the knowledge-base embedding index.")
+    parser.add_argument("--output-dir", type=Path, default=BASE_DIR / settings.KB_INDEX_DIR)
+    args = parser.parse_args(argv)
+
+    if report_generator_v3.embedding_model is None:
+        print("❌ 自研NLG核心未加载，无法生成向量索引。请先运行 train_nlg_model.py。")
+        return 1
+
+    start = time.perf_counter()
+    index = KnowledgeIndex.build(
+        kb_service.knowledge_base,
+        lambda texts: report_generator_v3._get_embeddings(texts).numpy(),
+        args.output_dir,
+        kb_path=KB_PATH,
+    )
+    print(f"🎉 已编码 {len(index.entries)} 条段落 ({', '.join(index.lang_ranges)})，"
+          f"耗时 {time.perf_counter() - start:.2f}s，输出至: {args.output_dir}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,30 @@
+# train/compile_knowledge_base.py
+# 预先把 knowledge_base/*.yaml 编译为 JSON 缓存 (附带源文件 SHA-1)，
+# 之后每个 worker 进程启动时直接读取 JSON，只有 YAML 内容变化时才重新解析。
+#
+# 用法 (在项目根目录运行，可放在 Dockerfile / 部署脚本中):
+#   python -m app.train.compile_knowledge_base
+import sys
+import time
+
+from app.services.knowledge_base_service import kb_service
+
+
+def main() -> int:
+    if kb_service.compiled_dir is None:
+        print("❌ KB_COMPILED_CACHE_DIR 为空，知识库编译缓存已关闭。")
+        return 1
+    # 导入 kb_service 时已经加载过知识库 (缓存多半是热的)：强制重新解析，输出的耗时才是真实的编译耗时
+    start = time.perf_counter()
+    try:
+        count = kb_service.compile_all(force=True)
+    except Exception as e:
+        print(f"❌ 知识库编译失败: {e}")
+        return 1
+    print(f"🎉 已编译 {count} 个知识库文件 ({len(kb_service.knowledge_base)} 条病害记录)，"
+          f"耗时 {time.perf_counter() - start:.3f}s，输出至: {kb_service.compiled_dir}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
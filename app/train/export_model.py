@@ -0,0 +1,113 @@
+# train/export_model.py
+# 将训练好的 .pth 权重导出为 TorchScript (traced + frozen) 与 ONNX 两种部署格式，
+# 并与 eager 模式的输出做一致性 (parity) 检查。
+#
+# 用法 (在项目根目录运行):
+#   python -m app.train.export_model
+#   然后在 .env 中设置 MODEL_BACKEND=torchscript 或 MODEL_BACKEND=onnxruntime
+import argparse
+import inspect
+import sys
+import time
+from pathlib import Path
+
+import torch
+
+from app.models.disease_classifier import (
+    DiseaseClassifier, OnnxRuntimeModel, exported_model_paths, MODEL_ARCH, MODEL_PATH, LABELS_PATH
+)
+
+INPUT_SHAPE = (1, 3, 224, 224)
+PARITY_ATOL = 1e-3  # logits 的最大允许绝对误差
+
+
+def export_torchscript(model: torch.nn.Module, output_path: Path) -> Path:
+    example = torch.randn(*INPUT_SHAPE)
+    with torch.no_grad():
+        traced = torch.jit.trace(model, example)
+        # freeze 会把参数常量化并折叠 BatchNorm 等，CPU 推理更快
+        frozen = torch.jit.freeze(traced)
+    frozen.save(str(output_path))
+    print(f"✅ TorchScript 模型已导出至: {output_path}")
+    return output_path
+
+
+def export_onnx(model: torch.nn.Module, output_path: Path, opset: int = 17) -> Path:
+    example = torch.randn(*INPUT_SHAPE)
+    extra = {}
+    if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+        # 较新的 PyTorch 默认使用 dynamo 导出器，这里固定使用经典的 TorchScript 导出器以支持 dynamic_axes
+        extra["dynamo"] = False
+    torch.onnx.export(
+        model, example, str(output_path),
+        input_names=["input"], output_names=["logits"],
+        dynamic_axes={"input": {0: "batch"}, "logits": {0: "batch"}},
+        opset_version=opset,
+        **extra,
+    )
+    print(f"✅ ONNX 模型已导出至: {output_path}")
+    return output_path
+
+
+def check_parity(reference, candidate, batch_sizes=(1, 4), seed: int = 0) -> dict:
+    """比较 eager 与导出后端在相同随机输入上的 logits 与 top-1 类别。"""
+    generator = torch.Generator().manual_seed(seed)
+    max_abs_diff, top1_agree, total = 0.0, 0, 0
+    ref_time, cand_time = 0.0, 0.0
+    with torch.no_grad():
+        for batch_size in batch_sizes:
+            inputs = torch.randn(batch_size, *INPUT_SHAPE[1:], generator=generator)
+            start = time.perf_counter()
+            expected = reference(inputs).cpu()
+            ref_time += time.perf_counter() - start
+            start = time.perf_counter()
+            actual = candidate(inputs).cpu()
+            cand_time += time.perf_counter() - start
+            max_abs_diff = max(max_abs_diff, (expected - actual).abs().max().item())
+            top1_agree += (expected.argmax(1) == actual.argmax(1)).sum().item()
+            total += batch_size
+    return {
+        "max_abs_diff": max_abs_diff,
+        "top1_agreement": top1_agree / total,
+        "eager_seconds": ref_time,
+        "exported_seconds": cand_time,
+        "passed": max_abs_diff <= PARITY_ATOL and top1_agree == total,
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Export the disease classifier to TorchScript and ONNX.")
+    parser.add_argument("--model-path", type=Path, default=MODEL_PATH)
+    parser.add_argument("--labels-path", type=Path, default=LABELS_PATH)
+    parser.add_argument("--architecture", default=MODEL_ARCH)
+    parser.add_argument("--skip-onnx", action="store_true", help="只导出 TorchScript")
+    args = parser.parse_args(argv)
+
+    classifier = DiseaseClassifier(args.model_path, args.labels_path, architecture=args.architecture)
+    model = classifier.model.cpu().eval()
+    paths = exported_model_paths(args.model_path)
+
+    ok = True
+    torchscript_path = export_torchscript(model, paths["torchscript"])
+    report = check_parity(model, torch.jit.load(str(torchscript_path)))
+    print(f"   - TorchScript parity: {report}")
+    ok &= report["passed"]
+
+    if not args.skip_onnx:
+        onnx_path = export_onnx(model, paths["onnxruntime"])
+        try:
+            report = check_parity(model, OnnxRuntimeModel(onnx_path))
+            print(f"   - ONNX Runtime parity: {report}")
+            ok &= report["passed"]
+        except RuntimeError as e:
+            print(f"   - ⚠️ 跳过 ONNX Runtime 一致性检查: {e}")
+
+    if not ok:
+        print(f"❌ 导出模型与 eager 输出不一致 (允许误差 {PARITY_ATOL})，请勿在生产中启用该后端。")
+        return 1
+    print("🎉 导出完成，所有后端均通过一致性检查。")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
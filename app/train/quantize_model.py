@@ -0,0 +1,189 @@
+# train/quantize_model.py
+# 为纯 CPU 的生产环境生成 INT8 量化模型：
+#   1. 训练后静态量化 (FX Graph Mode PTQ)，校准数据取自 Mydataset/ 的训练划分；
+#   2. 若静态量化失败 (或指定 --mode dynamic)，回退到动态量化 (仅 Linear 层)；
+#   3. 在与 train_model.py 完全相同的验证集划分上，对比 FP32 与 INT8 的准确率，输出回归报告。
+#
+# 用法 (在项目根目录运行):
+#   python -m app.train.quantize_model --calibration-batches 32
+#   然后在 .env 中设置 MODEL_BACKEND=quantized
+import argparse
+import copy
+import json
+import sys
+import time
+from pathlib import Path
+
+import torch
+import torch.nn as nn
+from torch.utils.data import ConcatDataset, DataLoader, Subset
+from torchvision import datasets, transforms
+
+from app.models.disease_classifier import (
+    DiseaseClassifier, exported_model_paths, BASE_DIR, MODEL_ARCH, MODEL_PATH, LABELS_PATH
+)
+
+# 与 train/train_model.py 保持一致的数据源、预处理与 80/20 划分
+DATA_DIRS = [
+    BASE_DIR / 'Mydataset' / 'kaggle_black_pepper_dataset',
+    BASE_DIR / 'Mydataset' / 'BLACK_PEPPER_DATASET',
+]
+SPLIT_SEED = 42
+VAL_TRANSFORM = transforms.Compose([
+    transforms.Resize(256),
+    transforms.CenterCrop(224),
+    transforms.ToTensor(),
+    transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225]),
+])
+INPUT_SHAPE = (1, 3, 224, 224)
+MAX_ACCURACY_DROP = 0.01  # 允许的 top-1 准确率下降 (绝对值)
+
+
+class _RemapTargets(torch.utils.data.Dataset):
+    """ImageFolder 的类别索引是按各自文件夹编号的，这里统一映射到标签文件中的全局索引。"""
+
+    def __init__(self, folder: datasets.ImageFolder, class_to_idx: dict):
+        self.folder = folder
+        self.mapping = {idx: class_to_idx.get(name, -1) for name, idx in folder.class_to_idx.items()}
+
+    def __len__(self):
+        return len(self.folder)
+
+    def __getitem__(self, idx):
+        image, target = self.folder[idx]
+        return image, self.mapping[target]
+
+
+def load_splits(class_to_idx: dict):
+    """复现 train_model.py 的训练/验证划分。"""
+    folders = [
+        _RemapTargets(datasets.ImageFolder(root=str(d), transform=VAL_TRANSFORM), class_to_idx)
+        for d in DATA_DIRS if d.is_dir()
+    ]
+    if not folders:
+        raise FileNotFoundError(f"No dataset folders found in {DATA_DIRS}")
+    full_dataset = ConcatDataset(folders)
+    train_size = int(0.8 * len(full_dataset))
+    val_size = len(full_dataset) - train_size
+    generator = torch.Generator().manual_seed(SPLIT_SEED)
+    return torch.utils.data.random_split(full_dataset, [train_size, val_size], generator=generator)
+
+
+def quantize_static(model: nn.Module, calibration_loader) -> nn.Module:
+    """FX Graph Mode 训练后静态量化：权重与激活都量化为 INT8。"""
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+    engine = _select_engine()
+    example = torch.randn(*INPUT_SHAPE)
+    prepared = prepare_fx(copy.deepcopy(model).eval(), get_default_qconfig_mapping(engine), (example,))
+    with torch.no_grad():
+        for inputs, _ in calibration_loader:
+            prepared(inputs)
+    return convert_fx(prepared)
+
+
+def quantize_dynamic(model: nn.Module) -> nn.Module:
+    """动态量化：只量化 Linear 层权重，激活在运行时量化。精度风险最小，但加速有限。"""
+    return torch.ao.quantization.quantize_dynamic(copy.deepcopy(model).eval(), {nn.Linear}, dtype=torch.qint8)
+
+
+def _select_engine() -> str:
+    engines = torch.backends.quantized.supported_engines
+    engine = 'x86' if 'x86' in engines else ('fbgemm' if 'fbgemm' in engines else engines[-1])
+    torch.backends.quantized.engine = engine
+    return engine
+
+
+def evaluate(model, loader) -> dict:
+    correct, total, predictions, elapsed = 0, 0, [], 0.0
+    with torch.no_grad():
+        for inputs, targets in loader:
+            start = time.perf_counter()
+            preds = model(inputs).argmax(1)
+            elapsed += time.perf_counter() - start
+            predictions.append(preds)
+            correct += (preds == targets).sum().item()
+            total += targets.numel()
+    return {
+        "accuracy": correct / total if total else 0.0,
+        "samples": total,
+        "ms_per_image": 1000.0 * elapsed / total if total else 0.0,
+        "predictions": torch.cat(predictions) if predictions else torch.empty(0, dtype=torch.long),
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Build an INT8 quantized CPU variant of the disease classifier.")
+    parser.add_argument("--model-path", type=Path, default=MODEL_PATH)
+    parser.add_argument("--labels-path", type=Path, default=LABELS_PATH)
+    parser.add_argument("--architecture", default=MODEL_ARCH)
+    parser.add_argument("--mode", choices=["static", "dynamic"], default="static")
+    parser.add_argument("--calibration-batches", type=int, default=32)
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--max-accuracy-drop", type=float, default=MAX_ACCURACY_DROP)
+    args = parser.parse_args(argv)
+
+    torch.set_grad_enabled(False)
+    classifier = DiseaseClassifier(args.model_path, args.labels_path, architecture=args.architecture)
+    fp32_model = classifier.model.cpu().eval()
+
+    train_split, val_split = load_splits(classifier.class_to_idx)
+    print(f"✅ 数据划分完成: 训练集 {len(train_split)} 张, 验证集 {len(val_split)} 张。")
+    calibration_size = min(len(train_split), args.calibration_batches * args.batch_size)
+    calibration_loader = DataLoader(Subset(train_split, range(calibration_size)), batch_size=args.batch_size)
+    val_loader = DataLoader(val_split, batch_size=args.batch_size, shuffle=False)
+
+    mode = args.mode
+    if mode == "static":
+        try:
+            print(f"正在进行静态量化，使用 {calibration_size} 张图片校准...")
+            quantized = quantize_static(fp32_model, calibration_loader)
+        except Exception as e:
+            print(f"⚠️ 静态量化失败 ({e})，回退到动态量化。")
+            mode = "dynamic"
+    if mode == "dynamic":
+        print("正在进行动态量化...")
+        quantized = quantize_dynamic(fp32_model)
+
+    output_path = exported_model_paths(args.model_path)["quantized"]
+    scripted = torch.jit.trace(quantized, torch.randn(*INPUT_SHAPE))
+    scripted.save(str(output_path))
+    print(f"✅ INT8 量化模型已保存至: {output_path}")
+
+    print("正在验证集上评估 FP32 与 INT8 模型...")
+    fp32 = evaluate(fp32_model, val_loader)
+    int8 = evaluate(scripted, val_loader)
+    agreement = (fp32["predictions"] == int8["predictions"]).float().mean().item() if fp32["samples"] else 0.0
+    accuracy_drop = fp32["accuracy"] - int8["accuracy"]
+    report = {
+        "model": str(args.model_path.name),
+        "artefact": str(output_path.name),
+        "mode": mode,
+        "engine": torch.backends.quantized.engine,
+        "calibration_images": calibration_size if mode == "static" else 0,
+        "validation_images": fp32["samples"],
+        "fp32_accuracy": fp32["accuracy"],
+        "int8_accuracy": int8["accuracy"],
+        "accuracy_drop": accuracy_drop,
+        "prediction_agreement": agreement,
+        "fp32_ms_per_image": fp32["ms_per_image"],
+        "int8_ms_per_image": int8["ms_per_image"],
+        "fp32_size_mb": args.model_path.stat().st_size / 1e6,
+        "int8_size_mb": output_path.stat().st_size / 1e6,
+        "passed": accuracy_drop <= args.max_accuracy_drop,
+    }
+    report_path = output_path.with_suffix('.report.json')
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=4)
+    print(json.dumps(report, indent=4))
+    print(f"📄 准确率回归报告已保存至: {report_path}")
+
+    if not report["passed"]:
+        print(f"❌ INT8 模型准确率下降 {accuracy_drop:.2%}，超过允许的 {args.max_accuracy_drop:.2%}。请勿在生产中启用。")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,25 @@
+# train/train_nlp_classifier.py
+# 训练 NlpService 使用的 TF-IDF + LinearSVC 句子分类器，并保存到 models_store/
+# (附带训练数据哈希，数据变化后服务会检测到模型过期)。
+#
+# 用法 (在项目根目录运行):
+#   python -m app.train.train_nlp_classifier
+import argparse
+import sys
+from pathlib import Path
+
+from app.services.nlp_service import DATA_PATH, MODEL_PATH, train_pipeline
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Train and save the NLP sentence classifier.")
+    parser.add_argument("--data-path", type=Path, default=DATA_PATH)
+    parser.add_argument("--model-path", type=Path, default=MODEL_PATH)
+    args = parser.parse_args(argv)
+
+    train_pipeline(args.data_path, args.model_path)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
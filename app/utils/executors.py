@@ -0,0 +1,100 @@
+# app/utils/executors.py
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+from ..config import settings
+
+
+class ExecutorSaturatedError(RuntimeError):
+    """当执行器排队任务已达上限时抛出，调用方应返回 503 并提示客户端稍后重试。"""
+
+    def __init__(self, name: str, retry_after: int):
+        super().__init__(f"Executor '{name}' is saturated, retry after {retry_after}s.")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class BoundedExecutor:
+    """
+    带并发上限和背压的线程池。
+    - max_workers: 同时执行的任务数 (真正占用 CPU/IO 的线程数)。
+    - max_pending: 已提交但尚未完成的任务总数上限 (执行中 + 排队中)，超出即拒绝。
+    这样阻塞型的推理/IO 调用就不会卡住 uvicorn 的事件循环，过载时也不会无限堆积。
+    """
+
+    def __init__(self, name: str, max_workers: int, max_pending: int, retry_after: int = 2):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_pending = max(max_pending, max_workers)
+        self.retry_after = retry_after
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self._pending = 0
+        self.total_submitted = 0
+        self.total_rejected = 0
+
+    @property
+    def pool(self) -> ThreadPoolExecutor:
+        return self._pool
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def _acquire(self):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self.total_rejected += 1
+                raise ExecutorSaturatedError(self.name, self.retry_after)
+            self._pending += 1
+            self.total_submitted += 1
+
+    def _release(self):
+        with self._lock:
+            self._pending -= 1
+
+    async def run(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """在线程池中执行 fn(*args, **kwargs)，若已饱和则立即抛出 ExecutorSaturatedError。"""
+        self._acquire()
+        try:
+            future = self._pool.submit(functools.partial(fn, *args, **kwargs))
+        except BaseException:
+            self._release()
+            raise
+        # 名额在线程真正结束 (或尚未开始即被取消) 时才归还：调用方被取消 (客户端断开、超时) 时
+        # 线程仍在执行 fn，若在这里的 finally 中归还，pending 会低估实际工作量，背压随之失效。
+        future.add_done_callback(lambda _: self._release())
+        return await asyncio.wrap_future(future)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_workers": self.max_workers,
+            "max_pending": self.max_pending,
+            "pending": self._pending,
+            "total_submitted": self.total_submitted,
+            "total_rejected": self.total_rejected,
+        }
+
+    def shutdown(self, wait: bool = False):
+        self._pool.shutdown(wait=wait)
+
+
+# --- 全局实例 ---
+# 推理池：PyTorch 前向/Grad-CAM 等 CPU 密集型任务。线程数不宜超过物理核数。
+inference_executor = BoundedExecutor(
+    name="inference",
+    max_workers=settings.INFERENCE_WORKERS,
+    max_pending=settings.INFERENCE_MAX_PENDING,
+    retry_after=settings.EXECUTOR_RETRY_AFTER_SECONDS,
+)
+
+# IO 池：文件写入、同步 requests/newspaper 网络抓取等阻塞型 IO 任务。
+io_executor = BoundedExecutor(
+    name="blocking-io",
+    max_workers=settings.IO_WORKERS,
+    max_pending=settings.IO_MAX_PENDING,
+    retry_after=settings.EXECUTOR_RETRY_AFTER_SECONDS,
+)
@@ -1,30 +1,114 @@
 import io
+from typing import List
+
+import numpy as np
+import torch
 from PIL import Image
 import torchvision.transforms as transforms
 
+from ..config import settings
+
+# 可选的加速后端：安装了 PyTurboJPEG (libjpeg-turbo) 时用它来解码 JPEG。
+# pillow-simd 是 Pillow 的直接替代品，安装后无需任何代码改动即可生效。
+try:
+    from turbojpeg import TurboJPEG, TJPF_RGB
+    _turbojpeg = TurboJPEG()
+except Exception:
+    _turbojpeg = None
+
+IMAGENET_MEAN = (0.485, 0.456, 0.406)
+IMAGENET_STD = (0.229, 0.224, 0.225)
+
+
 class ImageProcessor:
-    def __init__(self):
+    def __init__(self, resize_size: int = 256, crop_size: int = 224, fast_decode: bool = False, draft_oversample: int = 2):
+        """
+        :param fast_decode: 对 JPEG 使用缩小尺寸解码 (PIL draft 模式 / libjpeg-turbo 缩放)，
+            手机拍摄的数千万像素照片只解码到目标尺寸的 draft_oversample 倍左右，解码开销大幅下降。
+            会带来轻微的重采样差异 (归一化后最大约 0.07)，因此默认关闭；关闭时与训练时的预处理数值一致。
+        """
+        self.resize_size = resize_size
+        self.crop_size = crop_size
+        self.fast_decode = fast_decode
+        self.draft_oversample = draft_oversample
+
         # 这个预处理流程必须与你训练模型时使用的完全一致！
         self.transform = transforms.Compose([
-            transforms.Resize(256),
-            transforms.CenterCrop(224),
+            transforms.Resize(resize_size),
+            transforms.CenterCrop(crop_size),
             transforms.ToTensor(),
-            transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225]),
+            transforms.Normalize(mean=IMAGENET_MEAN, std=IMAGENET_STD),
+        ])
+        # 几何变换仍然交给 torchvision (在 PIL 图像上执行，与上面的 transform 完全相同)
+        self.geometry = transforms.Compose([
+            transforms.Resize(resize_size),
+            transforms.CenterCrop(crop_size),
         ])
+        # ToTensor + Normalize 合并成一次 uint8 -> float32 的仿射变换: x * scale + bias
+        std = np.array(IMAGENET_STD, dtype=np.float32)
+        mean = np.array(IMAGENET_MEAN, dtype=np.float32)
+        self._scale = (1.0 / (255.0 * std)).astype(np.float32)
+        self._bias = (-mean / std).astype(np.float32)
 
-    def process(self, image_bytes: bytes):
-        """将原始图片字节流转换为模型所需的Tensor"""
+    def _decode(self, image_bytes: bytes) -> Image.Image:
+        """解码为 RGB 的 PIL 图像；对 JPEG 按需缩小尺寸解码。"""
+        target = self.resize_size * self.draft_oversample
+        if self.fast_decode and _turbojpeg is not None and image_bytes[:3] == b"\xff\xd8\xff":
+            try:
+                width, height, _, _ = _turbojpeg.decode_header(image_bytes)
+                scaling_factor = self._turbojpeg_scaling_factor(width, height, target)
+                array = _turbojpeg.decode(image_bytes, pixel_format=TJPF_RGB, scaling_factor=scaling_factor)
+                return Image.fromarray(array)
+            except Exception:
+                pass  # 交给 PIL 处理 (例如 CMYK/渐进式等 turbojpeg 不支持的变体)
+
+        image = Image.open(io.BytesIO(image_bytes))
+        if self.fast_decode and image.format == "JPEG":
+            # draft 只会按 1/2、1/4、1/8 缩小，并保证结果不小于请求的尺寸
+            image.draft("RGB", (target, target))
+        # 确保图像是RGB格式
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        return image
+
+    @staticmethod
+    def _turbojpeg_scaling_factor(width: int, height: int, target: int):
+        best = (1, 1)
+        for num, denom in _turbojpeg.scaling_factors:
+            if num >= denom:
+                continue
+            if min(width, height) * num / denom >= target and num / denom < best[0] / best[1]:
+                best = (num, denom)
+        return best
+
+    def decode_and_crop(self, image_bytes: bytes) -> np.ndarray:
+        """解码并完成 Resize/CenterCrop，返回 (crop, crop, 3) 的 uint8 RGB 数组 (即模型实际"看到"的画面)。"""
         try:
-            image = Image.open(io.BytesIO(image_bytes))
-            # 确保图像是RGB格式
-            if image.mode != 'RGB':
-                image = image.convert('RGB')
-            
-            return self.transform(image).unsqueeze(0)
+            return np.asarray(self.geometry(self._decode(image_bytes)), dtype=np.uint8)
         except Exception as e:
             # 可以加入更详细的日志记录
             print(f"Error processing image: {e}")
             raise ValueError("无法处理提供的图像文件，请确保文件未损坏且格式正确。")
 
+    def normalize(self, images: np.ndarray) -> torch.Tensor:
+        """把 (N, H, W, 3) 的 uint8 数组向量化地归一化为 (N, 3, H, W) 的 float32 张量。"""
+        normalized = images.astype(np.float32) * self._scale + self._bias
+        return torch.from_numpy(np.ascontiguousarray(normalized.transpose(0, 3, 1, 2)))
+
+    def process(self, image_bytes: bytes):
+        """将原始图片字节流转换为模型所需的Tensor"""
+        return self.normalize(self.decode_and_crop(image_bytes)[None])
+
+    def process_many(self, images: List[bytes]) -> torch.Tensor:
+        """批量预处理，返回 (N, 3, crop, crop) 的张量，可直接送入 DiseaseClassifier.predict_batch。"""
+        return self.normalize(np.stack([self.decode_and_crop(image_bytes) for image_bytes in images]))
+
+    def process_reference(self, image_bytes: bytes) -> torch.Tensor:
+        """原始的 (训练时相同的) 预处理路径，作为基准测试和一致性校验的参照。"""
+        image = Image.open(io.BytesIO(image_bytes))
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        return self.transform(image).unsqueeze(0)
+
 # 创建一个全局实例，方便在其他地方调用
-image_processor = ImageProcessor()
\ No newline at end of file
+image_processor = ImageProcessor(fast_decode=settings.IMAGE_FAST_DECODE)
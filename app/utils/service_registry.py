@@ -0,0 +1,118 @@
+# app/utils/service_registry.py
+import asyncio
+import importlib
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from loguru import logger
+
+
+class LazyService:
+    """
+    一个按需初始化的子系统 (例如加载模型权重)。
+    第一次 get() 时在调用线程中执行 factory，之后直接返回同一个实例；并发调用只会初始化一次。
+    """
+
+    def __init__(self, name: str, factory: Callable[[], Any]):
+        self.name = name
+        self.factory = factory
+        self._instance: Any = None
+        self._lock = threading.Lock()
+        self.status = "not_loaded"  # not_loaded, loading, ready, failed
+        self.load_seconds: Optional[float] = None
+        self.error: Optional[str] = None
+
+    @property
+    def loaded(self) -> bool:
+        return self.status == "ready"
+
+    def get(self) -> Any:
+        if self.status == "ready":
+            return self._instance
+        with self._lock:
+            if self.status != "ready":
+                self.status = "loading"
+                start = time.perf_counter()
+                try:
+                    self._instance = self.factory()
+                except Exception as e:
+                    self.status, self.error = "failed", repr(e)
+                    self.load_seconds = time.perf_counter() - start
+                    raise
+                self.load_seconds = time.perf_counter() - start
+                self.status, self.error = "ready", None
+                logger.info(f"Subsystem '{self.name}' loaded in {self.load_seconds:.2f}s.")
+        return self._instance
+
+    def stats(self) -> Dict[str, Any]:
+        return {"status": self.status, "load_seconds": self.load_seconds, "error": self.error}
+
+
+def module_attribute(module_name: str, attribute: str) -> Callable[[], Any]:
+    """factory 辅助函数：在首次使用时才导入模块并取出其中的全局实例。"""
+    return lambda: getattr(importlib.import_module(module_name), attribute)
+
+
+class ServiceRegistry:
+    """
+    重量级子系统 (分类模型、Grad-CAM、NLG 核心、模糊推理系统等) 的注册表。
+    导入 app.main 时不再加载任何模型，只有用到它们的路由 (或启动后的后台预热) 才会触发加载。
+    通过属性访问: services.classifier 等价于 services.get("classifier")。
+    """
+
+    def __init__(self):
+        self._services: Dict[str, LazyService] = {}
+        self.created_at = time.perf_counter()
+        self.warmup_seconds: Optional[float] = None
+
+    def register(self, name: str, factory: Callable[[], Any]) -> LazyService:
+        service = LazyService(name, factory)
+        self._services[name] = service
+        return service
+
+    def get(self, name: str) -> Any:
+        return self._services[name].get()
+
+    def __getattr__(self, name: str) -> Any:
+        services = self.__dict__.get("_services", {})
+        if name in services:
+            return services[name].get()
+        raise AttributeError(name)
+
+    def is_loaded(self, name: str) -> bool:
+        return self._services[name].loaded
+
+    def ready(self, names: Optional[Iterable[str]] = None) -> bool:
+        return all(self._services[name].loaded for name in (names or self._services))
+
+    async def ensure(self, names: Iterable[str]):
+        """确保子系统已加载；未加载的在后台线程中加载，避免在事件循环中阻塞读取模型权重。"""
+        for name in names:
+            service = self._services[name]
+            if not service.loaded:
+                await asyncio.to_thread(service.get)
+
+    async def warm_up(self, names: Optional[List[str]] = None, after_load: Optional[Dict[str, Callable[[Any], Any]]] = None):
+        """
+        在后台线程中依次加载子系统，不阻塞事件循环 (应用可以立即开始服务轻量路由)。
+        :param after_load: 名称 -> 回调，子系统加载后同样在后台线程中执行 (例如预编译风险曲面)。
+        """
+        start = time.perf_counter()
+        for name in names or list(self._services):
+            try:
+                instance = await asyncio.to_thread(self._services[name].get)
+                if after_load and name in after_load:
+                    await asyncio.to_thread(after_load[name], instance)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Warm-up of subsystem '{name}' failed: {e}")
+        self.warmup_seconds = time.perf_counter() - start
+        logger.info(f"Subsystem warm-up finished in {self.warmup_seconds:.2f}s.")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "subsystems": {name: service.stats() for name, service in self._services.items()},
+            "warmup_seconds": self.warmup_seconds,
+        }
@@ -0,0 +1,161 @@
+# app/utils/stage_metrics.py
+import bisect
+import contextvars
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+
+from loguru import logger
+
+from ..config import settings
+
+# 秒；覆盖从几毫秒的缓存查询到几秒的网络参考抓取
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """按标签组合分别累计的 Prometheus 风格直方图 (累积桶 + 总和 + 次数)，线程安全。"""
+
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...], buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], List[float]] = {}  # 标签值 -> [各桶计数..., +Inf 计数, 总和]
+        self._lock = threading.Lock()
+
+    def observe(self, labels: Tuple[str, ...], value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def summary(self) -> Dict[Tuple[str, ...], Dict[str, float]]:
+        with self._lock:
+            snapshot = {labels: list(series) for labels, series in self._series.items()}
+        return {labels: {"count": sum(series[:-1]), "sum_seconds": series[-1]} for labels, series in snapshot.items()}
+
+    def render(self) -> List[str]:
+        """Prometheus 文本格式 (0.0.4)。"""
+        with self._lock:
+            snapshot = sorted((labels, list(series)) for labels, series in self._series.items())
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for labels, series in snapshot:
+            label_text = ",".join(f'{key}="{value}"' for key, value in zip(self.label_names, labels))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series[:-1]):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'{self.name}_bucket{{{label_text},le="{le}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{label_text}}} {series[-1]}")
+            lines.append(f"{self.name}_count{{{label_text}}} {cumulative}")
+        return lines
+
+
+class Trace:
+    """一次请求的分阶段耗时记录。只有被采样的请求才保留明细，其余请求只计入直方图。"""
+
+    def __init__(self, pipeline: str, sampled: bool):
+        self.pipeline = pipeline
+        self.sampled = sampled
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self.spans: List[Dict[str, Any]] = []
+        self.attributes: Dict[str, Any] = {}
+        self.finished = False
+
+    def add_span(self, stage: str, start: float, seconds: float, error: Optional[str] = None):
+        # 请求结束后才完成的后台工作 (例如延迟生成的热力图) 不再附加到已结束的明细上
+        if self.sampled and not self.finished:
+            span = {"stage": stage, "offset_ms": round((start - self._start) * 1000, 3), "duration_ms": round(seconds * 1000, 3)}
+            if error:
+                span["error"] = error
+            self.spans.append(span)
+
+    def to_dict(self, total_seconds: float, outcome: str) -> Dict[str, Any]:
+        return {
+            "pipeline": self.pipeline, "started_at": self.started_at, "outcome": outcome,
+            "total_ms": round(total_seconds * 1000, 3), "attributes": self.attributes, "spans": self.spans,
+        }
+
+
+_current_trace: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("current_trace", default=None)
+
+
+class StageMetrics:
+    """
+    诊断流水线的分阶段延迟统计：
+      - span(stage): 计时一个阶段，计入 pipeline_stage_seconds{stage=...} 直方图；
+      - trace(pipeline): 包住整个请求，计入 pipeline_request_seconds{pipeline, outcome}，
+        并按 sample_rate 采样保留每个阶段的明细 (最近 max_traces 条)。
+    当前请求的 Trace 保存在 contextvar 中，被 await 的辅助函数中的 span 会自动归入同一请求。
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS, sample_rate: float = 0.0, max_traces: int = 100):
+        self.sample_rate = sample_rate
+        self.stage_seconds = Histogram("pipeline_stage_seconds", "Latency of each diagnosis pipeline stage.", ("stage",), buckets)
+        self.request_seconds = Histogram("pipeline_request_seconds", "End-to-end latency of instrumented requests.", ("pipeline", "outcome"), buckets)
+        self._traces: Deque[Dict[str, Any]] = deque(maxlen=max_traces)
+
+    @contextmanager
+    def span(self, stage: str) -> Iterator[None]:
+        start = time.perf_counter()
+        error = None
+        try:
+            yield
+        except BaseException as e:
+            error = type(e).__name__
+            raise
+        finally:
+            seconds = time.perf_counter() - start
+            self.stage_seconds.observe((stage,), seconds)
+            trace = _current_trace.get()
+            if trace is not None:
+                trace.add_span(stage, start, seconds, error)
+
+    @contextmanager
+    def trace(self, pipeline: str, sample: Optional[bool] = None) -> Iterator[Trace]:
+        """:param sample: 强制采样 (True) 或不采样 (False)；None 表示按 sample_rate 随机决定。"""
+        sampled = sample if sample is not None else (self.sample_rate > 0 and random.random() < self.sample_rate)
+        trace = Trace(pipeline, sampled)
+        token = _current_trace.set(trace)
+        outcome = "ok"
+        try:
+            yield trace
+        except BaseException:
+            outcome = "error"
+            raise
+        finally:
+            _current_trace.reset(token)
+            seconds = time.perf_counter() - trace._start
+            trace.finished = True
+            self.request_seconds.observe((pipeline, outcome), seconds)
+            if sampled:
+                record = trace.to_dict(seconds, outcome)
+                self._traces.append(record)
+                logger.debug(f"Trace {pipeline}: {record['total_ms']:.1f}ms " + ", ".join(
+                    f"{span['stage']}={span['duration_ms']:.1f}ms" for span in record["spans"]))
+
+    def recent_traces(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        traces = list(self._traces)
+        return traces[-limit:] if limit else traces
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "stages": {labels[0]: values for labels, values in self.stage_seconds.summary().items()},
+            "sample_rate": self.sample_rate,
+            "sampled_traces": len(self._traces),
+        }
+
+    def render_prometheus(self) -> str:
+        return "\n".join(self.stage_seconds.render() + self.request_seconds.render()) + "\n"
+
+
+# --- 全局实例 ---
+stage_metrics = StageMetrics(sample_rate=settings.TRACE_SAMPLE_RATE, max_traces=settings.TRACE_MAX_SAMPLES)
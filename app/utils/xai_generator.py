@@ -1,10 +1,12 @@
 # xai_generator.py
 import os
+import threading
+from typing import Optional, Tuple
 import numpy as np
 import torch
 from pytorch_grad_cam import GradCAM
 from pytorch_grad_cam.utils.model_targets import ClassifierOutputTarget
-from pytorch_grad_cam.utils.image import show_cam_on_image
+from pytorch_grad_cam.utils.image import show_cam_on_image, scale_cam_image
 from PIL import Image
 from pathlib import Path
 import cv2
@@ -17,9 +19,20 @@ class XaiGenerator:
         :param target_layers: 模型中用于生成Grad-CAM的目标卷积层。
         """
         self.model = model
-        # --- ↓↓↓ 移除 use_cuda 参数 ↓↓↓ ---
-        self.cam = GradCAM(model=model, target_layers=target_layers)
-        # --- ↑↑↑ 修改结束 ↑↑↑ ---
+        self.target_layers = target_layers
+        self._cam = None
+
+    @property
+    def cam(self) -> GradCAM:
+        """
+        pytorch_grad_cam 的 GradCAM 会在模型上永久注册钩子 (每次前向都会触发)，
+        因此只有在调用旧的 generate_heatmap 接口时才按需创建。
+        """
+        if self._cam is None:
+            # --- ↓↓↓ 移除 use_cuda 参数 ↓↓↓ ---
+            self._cam = GradCAM(model=self.model, target_layers=self.target_layers)
+            # --- ↑↑↑ 修改结束 ↑↑↑ ---
+        return self._cam
 
     def _preprocess_image_for_xai(self, image_bytes: bytes):
         """
@@ -57,6 +70,49 @@ class XaiGenerator:
         
         return visualization
 
+    def predict_and_explain(self, image_tensor: torch.Tensor, rgb_image: np.ndarray,
+                            target_category: Optional[int] = None) -> Tuple[torch.Tensor, np.ndarray]:
+        """
+        一次前向传播同时完成预测与 Grad-CAM 解释：
+        在目标层上临时挂一个前向钩子截取激活值，用 torch.autograd.grad 只对该激活求梯度，
+        不需要像 generate_heatmap 那样再跑一遍完整的前向 + 反向，也不会改动模型参数的 .grad。
+        :param image_tensor: (1, 3, H, W) 标准化后的输入张量。
+        :param rgb_image: ImageProcessor.decode_and_crop 得到的 (H, W, 3) uint8 图像，即模型实际看到的画面。
+        :param target_category: 要解释的类别，默认为预测概率最高的类别。
+        :return: (该图片的类别概率向量, 叠加了热力图的RGB图像)
+        """
+        captured = {}
+        owner = threading.get_ident()
+        target_layer = self.target_layers[0]
+
+        def capture_activation(module, inputs, output):
+            # 推理线程池中可能有其他线程同时在用同一个模型，只截取本线程的激活
+            if threading.get_ident() == owner:
+                captured["activation"] = output
+
+        handle = target_layer.register_forward_hook(capture_activation)
+        try:
+            with torch.enable_grad():
+                logits = self.model(image_tensor)
+                probabilities = torch.nn.functional.softmax(logits.detach(), dim=1)[0]
+                if target_category is None:
+                    target_category = int(probabilities.argmax().item())
+                activation = captured["activation"]
+                (gradients,) = torch.autograd.grad(logits[0, target_category], activation)
+        finally:
+            handle.remove()
+
+        # Grad-CAM: 通道权重 = 梯度的空间平均，CAM = ReLU(Σ 权重 × 激活)
+        weights = gradients[0].mean(dim=(1, 2))
+        cam = torch.relu((weights[:, None, None] * activation[0].detach()).sum(dim=0))
+        height, width = rgb_image.shape[:2]
+        # 与 pytorch_grad_cam 相同的后处理：缩放到图像尺寸并归一化，再做一次层间聚合时的归一化
+        grayscale_cam = scale_cam_image(cam[None].cpu().numpy(), (width, height))
+        grayscale_cam = scale_cam_image(np.maximum(grayscale_cam, 0))[0]
+
+        visualization = show_cam_on_image(np.float32(rgb_image) / 255, grayscale_cam, use_rgb=True)
+        return probabilities.cpu(), visualization
+
 # --- 全局实例初始化 ---
 # 我们需要导入我们的分类器来获取模型本身
 from ..models.disease_classifier import classifier